@@ -0,0 +1,124 @@
+"""
+Bulk todo operations.
+
+Operations are validated and resolved up front (one batch read for all
+existing todos), then written in chunks of the storage backend's batch
+size: 25 per TransactWriteItems call on DynamoDB, together with the
+user's stats counters. Each write is conditional on the todo being
+unchanged since the read (or, for creates, on the id being free), so a
+todo updated or deleted concurrently is reported as a 409 conflict
+instead of being overwritten or brought back to life.
+"""
+from datetime import datetime, timezone
+
+from changes import TOMBSTONE_TTL
+from ids import new_todo_id
+from models import Todo
+from storage import storage
+
+
+def _result(index, op, todo_id, status, item=None, error=None):
+    result = {"index": index, "op": op, "id": todo_id, "status": status, "item": item}
+    if error:
+        result["error"] = error
+    return result
+
+
+def run_batch(user_id: str, operations: list) -> list:
+    """
+    Apply create/update/complete/delete operations for one user.
+
+    ``operations`` are dicts with ``op`` and, depending on the op, ``id``,
+    ``title``, ``description`` and ``completed``. Returns one result dict
+    per operation, in request order.
+    """
+    now = datetime.now(timezone.utc)
+    results = [None] * len(operations)
+    seen_ids = set()
+    lookups = {}
+
+    # Validate, and reject anything that touches the same todo twice:
+    # BatchWriteItem refuses duplicate keys in one request.
+    for index, operation in enumerate(operations):
+        op, todo_id = operation["op"], operation.get("id")
+        if op == "create":
+            if not operation.get("title"):
+                results[index] = _result(index, op, None, 400, error="title is required")
+            continue
+        if not todo_id:
+            results[index] = _result(index, op, None, 400, error="id is required")
+        elif todo_id in seen_ids:
+            results[index] = _result(index, op, todo_id, 409, error="Duplicate id in batch")
+        else:
+            seen_ids.add(todo_id)
+            lookups[todo_id] = index
+
+    existing = {}
+    if lookups:
+        for todo in storage.batch_get_todos(user_id, list(lookups)):
+            if not todo.deleted:
+                existing[todo.todo_id] = todo
+
+    puts = []
+    # Index -> the todo as read (updated_at and completed), None for creates
+    before = {}
+    for index, operation in enumerate(operations):
+        if results[index] is not None:
+            continue
+        op = operation["op"]
+        if op == "create":
+            todo = Todo(
+                user_id=user_id,
+                todo_id=new_todo_id(now),
+                title=operation["title"],
+                description=operation.get("description"),
+                completed=False,
+                created_at=now,
+                updated_at=now,
+            )
+            puts.append((index, todo))
+            before[index] = None
+            results[index] = _result(index, op, todo.todo_id, 201, item=todo)
+            continue
+
+        todo = existing.get(operation["id"])
+        if todo is None:
+            results[index] = _result(index, op, operation["id"], 404, error="Todo not found")
+            continue
+        before[index] = Todo(
+            user_id=user_id, todo_id=todo.todo_id, completed=todo.completed, updated_at=todo.updated_at
+        )
+        if op == "delete":
+            # A tombstone, so the changes feed can report the delete
+            todo.mark_deleted(now, TOMBSTONE_TTL)
+            puts.append((index, todo))
+            results[index] = _result(index, op, todo.todo_id, 200, item=todo)
+            continue
+        if op == "complete":
+            todo.completed = True
+        else:
+            if operation.get("title") is not None:
+                todo.title = operation["title"]
+            if operation.get("description") is not None:
+                todo.description = operation["description"]
+            if operation.get("completed") is not None:
+                todo.completed = operation["completed"]
+        todo.updated_at = now
+        puts.append((index, todo))
+        results[index] = _result(index, op, todo.todo_id, 200, item=todo)
+
+    # Deletes are tombstone puts too, so every write is a put
+    for start in range(0, len(puts), storage.batch_write_limit):
+        chunk = puts[start:start + storage.batch_write_limit]
+        try:
+            unwritten = storage.conditional_batch_write(user_id, [(todo, before[index]) for index, todo in chunk])
+            status, error = 409, "conflict: todo was changed or deleted concurrently, please retry"
+        except Exception as e:
+            print(f"Error writing todo batch: {e}")
+            unwritten = {todo.todo_id for _, todo in chunk}
+            status, error = 500, f"Write failed: {str(e)}"
+        for index, todo in chunk:
+            if todo.todo_id in unwritten:
+                results[index] = _result(index, operations[index]["op"], todo.todo_id, status, error=error)
+
+    return results
@@ -0,0 +1,59 @@
+"""
+Micro-benchmark for per-request authentication overhead.
+
+Times ``get_current_user`` (header parsing plus token verification) for
+each JWT backend with the verified-token cache off, and for a cache hit,
+and prints the results as JSON.
+
+    python bench_auth.py [--iterations N]
+"""
+import argparse
+import json
+import os
+import time
+
+os.environ.setdefault("MY_AWS_SECRET_ACCESS_KEY", "bench-secret-key-for-local-benchmarks")
+
+import tokens
+from main import get_current_user
+
+
+def time_per_call(fn, iterations: int) -> float:
+    """Mean wall time per call in microseconds."""
+    fn()  # warm up
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=20000)
+    args = parser.parse_args()
+
+    results = {}
+    default_backend = tokens.get_jwt_backend()
+    for name, backend_class in tokens.BACKENDS.items():
+        try:
+            backend = backend_class()
+        except RuntimeError as e:
+            results[f"{name}_uncached"] = {"skipped": str(e)}
+            continue
+        tokens.jwt_backend = backend
+        header = f"Bearer {tokens.create_access_token({'sub': 'bench-user'})}"
+        tokens.TOKEN_CACHE_ENABLED = False
+        results[f"{name}_uncached"] = {"us_per_request": round(time_per_call(lambda: get_current_user(header), args.iterations), 2)}
+
+    tokens.jwt_backend = default_backend
+    tokens.TOKEN_CACHE_ENABLED = True
+    header = f"Bearer {tokens.create_access_token({'sub': 'bench-user'})}"
+    results["cache_hit"] = {"us_per_request": round(time_per_call(lambda: get_current_user(header), args.iterations), 2)}
+
+    baseline = results[f"{default_backend.name}_uncached"]["us_per_request"]
+    results["cache_hit"]["speedup_vs_uncached"] = round(baseline / results["cache_hit"]["us_per_request"], 1)
+    print(json.dumps({"iterations": args.iterations, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
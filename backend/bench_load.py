@@ -0,0 +1,287 @@
+"""
+Load test for the API, run in-process against a local storage backend.
+
+Seeds ``--users`` users with ``--todos`` todos each straight into the
+memory (default) or SQLite backend, then drives a mixed workload of
+``/token`` and ``/todos`` list/get/create/update/delete requests through
+the ASGI app with ``--concurrency`` concurrent clients. Prints JSON with
+throughput and p50/p95/p99 latency per operation, plus memory allocated
+per request, measured in a separate sequential pass with tracemalloc so
+tracing doesn't skew the latency numbers. The same ``--seed`` replays the
+same sequence of operations.
+
+    python bench_load.py [--users N] [--todos M] [--requests R] [--concurrency C]
+                         [--mix list=50,get=20,create=10,update=10,delete=5,token=5]
+                         [--backend memory|sqlite] [--output FILE]
+
+Requires ``httpx`` (already installed alongside FastAPI's test client).
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+OPERATIONS = ("token", "list", "get", "create", "update", "delete")
+DEFAULT_MIX = "list=50,get=20,create=10,update=10,delete=5,token=5"
+BENCH_PASSWORD = "bench-password"
+
+
+def parse_mix(value: str) -> dict:
+    """Parse ``op=weight,...`` into a dict of weights."""
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise argparse.ArgumentTypeError(f"Unknown operation '{name}'")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def percentile(sorted_values: list, q: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, int(round(q / 100 * len(sorted_values))) - 1))
+    return sorted_values[rank]
+
+
+def summarize(latencies: list, errors: int, elapsed: float) -> dict:
+    values = sorted(latencies)
+    return {
+        "requests": len(values),
+        "errors": errors,
+        "throughput_rps": round(len(values) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(values, 50) * 1000, 3),
+        "p95_ms": round(percentile(values, 95) * 1000, 3),
+        "p99_ms": round(percentile(values, 99) * 1000, 3),
+        "max_ms": round(values[-1] * 1000, 3) if values else 0.0,
+    }
+
+
+class Workload:
+    """Seeded users and todos plus the request for each operation."""
+
+    def __init__(self, client, users: list, todo_ids: dict, tokens: dict, page_size: int, rng: random.Random):
+        self.client = client
+        self.users = users
+        self.todo_ids = todo_ids
+        self.tokens = tokens
+        self.page_size = page_size
+        self.rng = rng
+        self.counter = 0
+
+    def headers(self, user: str) -> dict:
+        return {"Authorization": f"Bearer {self.tokens[user]}"}
+
+    async def request(self, op: str, user: str):
+        """Issue one request; returns the response, or None if there was nothing to do."""
+        ids = self.todo_ids[user]
+        if op == "token":
+            return await self.client.post("/token", data={"username": user, "password": BENCH_PASSWORD})
+        if op == "list":
+            params = {"limit": self.page_size}
+            if self.rng.random() < 0.25:
+                params["completed"] = "false"
+            return await self.client.get("/todos", params=params, headers=self.headers(user))
+        if op == "create":
+            self.counter += 1
+            response = await self.client.post(
+                "/todos", json={"title": f"bench todo {self.counter}"}, headers=self.headers(user)
+            )
+            if response.status_code == 200:
+                ids.append(response.json()["id"])
+            return response
+        if not ids:
+            return None
+        if op == "get":
+            return await self.client.get(f"/todos/{self.rng.choice(ids)}", headers=self.headers(user))
+        if op == "update":
+            return await self.client.put(
+                f"/todos/{self.rng.choice(ids)}",
+                json={"completed": self.rng.random() < 0.5},
+                headers=self.headers(user),
+            )
+        # Remove the id first so no other client picks it while the delete is in flight
+        todo_id = ids.pop(self.rng.randrange(len(ids)))
+        return await self.client.delete(f"/todos/{todo_id}", headers=self.headers(user))
+
+
+def seed(users: int, todos: int, rng: random.Random):
+    """Write users and todos directly to storage; returns (usernames, todo ids per user, tokens)."""
+    from ids import new_todo_id
+    from models import Todo, User
+    from passwords import hash_password
+    from storage import storage
+    from tokens import create_access_token
+
+    # One hash for everyone: seeding shouldn't be dominated by bcrypt
+    hashed_password = hash_password(BENCH_PASSWORD)
+    base = datetime.utcnow() - timedelta(days=30)
+    usernames, todo_ids, tokens = [], {}, {}
+    for u in range(users):
+        username = f"bench-user-{u}"
+        storage.put_user(User(username=username, hashed_password=hashed_password))
+        batch = []
+        for t in range(todos):
+            created_at = base + timedelta(seconds=u * todos + t)
+            batch.append(Todo(
+                user_id=username,
+                todo_id=new_todo_id(created_at),
+                title=f"todo {t}",
+                description=f"seeded todo {t} for {username}" if rng.random() < 0.5 else None,
+                completed=rng.random() < 0.3,
+                created_at=created_at,
+                updated_at=created_at,
+            ))
+        for start in range(0, len(batch), storage.batch_write_limit):
+            storage.batch_write(batch[start:start + storage.batch_write_limit], [])
+        usernames.append(username)
+        todo_ids[username] = [todo.todo_id for todo in batch]
+        tokens[username] = create_access_token({"sub": username})
+    return usernames, todo_ids, tokens
+
+
+async def run_load(workload: Workload, plan: list, concurrency: int):
+    """Run ``plan`` (a list of (op, user)) with ``concurrency`` clients; returns per-op results."""
+    latencies = {op: [] for op in OPERATIONS}
+    errors = {op: 0 for op in OPERATIONS}
+    position = 0
+
+    async def client():
+        nonlocal position
+        while position < len(plan):
+            op, user = plan[position]
+            position += 1
+            started = time.perf_counter()
+            response = await workload.request(op, user)
+            if response is None:
+                continue
+            latencies[op].append(time.perf_counter() - started)
+            if response.status_code >= 400:
+                errors[op] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    results = {
+        "overall": summarize(
+            [value for values in latencies.values() for value in values], sum(errors.values()), elapsed
+        ),
+        "per_op": {op: summarize(latencies[op], errors[op], elapsed) for op in OPERATIONS if latencies[op]},
+    }
+    results["overall"]["elapsed_s"] = round(elapsed, 3)
+    return results
+
+
+async def measure_allocations(workload: Workload, ops: list, users: list, samples: int) -> dict:
+    """Mean peak traced memory per request for each op, one request at a time."""
+    results = {}
+    tracemalloc.start()
+    try:
+        for op in ops:
+            peaks = []
+            for _ in range(samples):
+                user = workload.rng.choice(users)
+                tracemalloc.reset_peak()
+                before = tracemalloc.get_traced_memory()[0]
+                response = await workload.request(op, user)
+                if response is not None:
+                    peaks.append(tracemalloc.get_traced_memory()[1] - before)
+            if peaks:
+                results[op] = {
+                    "samples": len(peaks),
+                    "mean_peak_kib": round(sum(peaks) / len(peaks) / 1024, 2),
+                    "max_peak_kib": round(max(peaks) / 1024, 2),
+                }
+    finally:
+        tracemalloc.stop()
+    return results
+
+
+async def bench(args):
+    import httpx
+    from executor import shutdown_pools
+    from main import app
+
+    rng = random.Random(args.seed)
+    started = time.perf_counter()
+    users, todo_ids, tokens = seed(args.users, args.todos, rng)
+    seed_seconds = time.perf_counter() - started
+
+    names = list(args.mix)
+    weights = [args.mix[name] for name in names]
+    plan = list(zip(rng.choices(names, weights, k=args.requests), rng.choices(users, k=args.requests)))
+
+    transport = httpx.ASGITransport(app=app)
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            workload = Workload(client, users, todo_ids, tokens, args.page_size, rng)
+            for op, user in plan[:args.warmup]:
+                await workload.request(op, user)
+            load = await run_load(workload, plan, args.concurrency)
+            allocations = {}
+            if args.alloc_samples:
+                allocations = await measure_allocations(workload, names, users, args.alloc_samples)
+    finally:
+        shutdown_pools(wait=True)
+
+    return {
+        "config": {
+            "backend": os.environ["STORAGE_BACKEND"],
+            "users": args.users,
+            "todos_per_user": args.todos,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "mix": args.mix,
+            "page_size": args.page_size,
+            "seed": args.seed,
+            "python": sys.version.split()[0],
+        },
+        "seed_s": round(seed_seconds, 3),
+        "load": load,
+        "allocations": allocations,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--todos", type=int, default=200, help="todos per user")
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX))
+    parser.add_argument("--page-size", type=int, default=50, help="limit for list requests")
+    parser.add_argument("--warmup", type=int, default=200, help="requests from the plan to run untimed first")
+    parser.add_argument("--alloc-samples", type=int, default=50, help="requests per op for allocations; 0 to skip")
+    parser.add_argument("--backend", choices=("memory", "sqlite"), default="memory")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    args = parser.parse_args()
+
+    # Configure the app before it is imported
+    os.environ["STORAGE_BACKEND"] = args.backend
+    if args.backend == "sqlite" and "SQLITE_PATH" not in os.environ:
+        os.environ["SQLITE_PATH"] = os.path.join(tempfile.mkdtemp(prefix="bench-load-"), "todo.db")
+    os.environ.setdefault("MY_AWS_SECRET_ACCESS_KEY", "bench-secret-key-for-local-benchmarks")
+    # Measure the request path, not the hashing cost; override to include it
+    os.environ.setdefault("BCRYPT_ROUNDS", "4")
+    # Every simulated client shares one IP and a handful of users
+    os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+
+    report = json.dumps(asyncio.run(bench(args)), indent=2)
+    print(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report + "\n")
+
+
+if __name__ == "__main__":
+    main()
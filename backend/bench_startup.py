@@ -0,0 +1,196 @@
+"""
+Cold-start benchmark: import time of main.py and time to first response.
+
+Every run starts a fresh interpreter, so only the OS page cache and .pyc
+files carry over between runs:
+
+- ``import``: ``python -X importtime -c "import main"``. The report has the
+  total plus the slowest imports, both as main.py's direct imports
+  (cumulative) and summed by top-level package (self time), so a new heavy
+  dependency shows up by name
+- ``first_response``: from spawning ``uvicorn main:app`` to the first
+  successful ``GET /health``, lifespan startup included
+- ``interpreter``: ``python -c pass``, the floor under both
+
+Times are medians over ``--runs`` runs, in milliseconds. The app runs with
+``STARTUP_MODE=lazy`` and the memory backend by default, so no AWS account
+is needed. ``--output`` saves the report; ``--baseline`` compares with a
+saved one and exits non-zero when the median import or first-response time
+is more than ``--max-regression`` percent slower.
+
+    python bench_startup.py [--runs N] [--mode lazy|eager] [--backend memory|sqlite|dynamodb]
+                            [--top N] [--output FILE] [--baseline FILE] [--max-regression PCT]
+
+Requires ``uvicorn`` (in requirements.txt).
+"""
+import argparse
+import http.client
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+FIRST_RESPONSE_TIMEOUT = 30.0
+POLL_INTERVAL = 0.005
+
+
+def parse_importtime(stderr: str, root: str = "main") -> list:
+    """``(depth, name, self_us, cumulative_us)`` for ``root`` and everything imported under it."""
+    entries, subtree = [], []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        # One space after the bar, then two per nesting level
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        subtree.append((depth, name.strip(), int(self_us), int(cumulative_us)))
+        if depth == 0:
+            # A top-level import is printed after everything it imported
+            if name.strip() == root:
+                entries = subtree
+            subtree = []
+    return entries
+
+
+def run_import(env: dict) -> dict:
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import main failed:\n{result.stderr[-2000:]}")
+    entries = parse_importtime(result.stderr)
+    packages = {}
+    for depth, name, self_us, _ in entries:
+        package = name.split(".")[0]
+        packages[package] = packages.get(package, 0) + self_us
+    return {
+        "total_us": entries[-1][3],
+        "modules": {name: cumulative_us for depth, name, _, cumulative_us in entries if depth == 1},
+        "packages": packages,
+    }
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def run_first_response(env: dict) -> float:
+    """Seconds from spawning the server to its first 200 from /health."""
+    port = _free_port()
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+    )
+    try:
+        while time.perf_counter() - started < FIRST_RESPONSE_TIMEOUT:
+            if server.poll() is not None:
+                raise RuntimeError(f"server exited:\n{server.stderr.read().decode()[-2000:]}")
+            try:
+                connection = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+                connection.request("GET", "/health")
+                if connection.getresponse().status == 200:
+                    return time.perf_counter() - started
+            except OSError:
+                pass
+            time.sleep(POLL_INTERVAL)
+        raise RuntimeError(f"no response from /health within {FIRST_RESPONSE_TIMEOUT}s")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def run_interpreter(env: dict) -> float:
+    started = time.perf_counter()
+    subprocess.run([sys.executable, "-c", "pass"], env=env, check=True)
+    return time.perf_counter() - started
+
+
+def _ms(values: list) -> float:
+    return round(statistics.median(values) / 1000, 1)
+
+
+def _top(samples: list, top: int) -> dict:
+    """Median per name across runs, slowest ``top`` first, in ms."""
+    names = set().union(*samples)
+    medians = {name: _ms([sample.get(name, 0) for sample in samples]) for name in names}
+    return dict(sorted(medians.items(), key=lambda item: item[1], reverse=True)[:top])
+
+
+def bench(args, env: dict) -> dict:
+    imports, first_responses, interpreters = [], [], []
+    # One untimed run of each, so .pyc files are written before timing
+    run_import(env)
+    run_first_response(env)
+    for _ in range(args.runs):
+        interpreters.append(run_interpreter(env) * 1e6)
+        imports.append(run_import(env))
+        first_responses.append(run_first_response(env) * 1e6)
+    return {
+        "config": {
+            "runs": args.runs,
+            "mode": args.mode,
+            "backend": args.backend,
+            "python": sys.version.split()[0],
+        },
+        "interpreter_ms": _ms(interpreters),
+        "import_ms": _ms([sample["total_us"] for sample in imports]),
+        "first_response_ms": _ms(first_responses),
+        "slowest_modules_ms": _top([sample["modules"] for sample in imports], args.top),
+        "slowest_packages_ms": _top([sample["packages"] for sample in imports], args.top),
+    }
+
+
+def compare(report: dict, baseline: dict, max_regression: float) -> dict:
+    """Percent change per headline metric against ``baseline``; flags the ones past the limit."""
+    comparison = {}
+    for metric in ("import_ms", "first_response_ms"):
+        before, after = baseline.get(metric), report[metric]
+        if not before:
+            continue
+        change = round((after - before) / before * 100, 1)
+        comparison[metric] = {"baseline": before, "current": after, "change_pct": change,
+                              "regressed": change > max_regression}
+    return comparison
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--mode", choices=("lazy", "eager"), default="lazy", help="STARTUP_MODE for the app")
+    parser.add_argument("--backend", choices=("memory", "sqlite", "dynamodb"), default="memory")
+    parser.add_argument("--top", type=int, default=15, help="slowest modules and packages to list")
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    parser.add_argument("--baseline", help="a report saved with --output to compare against")
+    parser.add_argument("--max-regression", type=float, default=20.0, help="percent slowdown that fails the run")
+    args = parser.parse_args()
+
+    env = dict(os.environ, STARTUP_MODE=args.mode, STORAGE_BACKEND=args.backend)
+    env.setdefault("MY_AWS_SECRET_ACCESS_KEY", "bench-secret-key-for-local-benchmarks")
+    if args.backend == "sqlite" and "SQLITE_PATH" not in env:
+        env["SQLITE_PATH"] = os.path.join(tempfile.mkdtemp(prefix="bench-startup-"), "todo.db")
+
+    report = bench(args, env)
+    if args.baseline:
+        with open(args.baseline) as f:
+            report["comparison"] = compare(report, json.load(f), args.max_regression)
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    if any(metric["regressed"] for metric in report.get("comparison", {}).values()):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
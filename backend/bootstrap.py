@@ -0,0 +1,395 @@
+"""
+Create or update the DynamoDB tables from the models, and seed test data.
+
+The desired schema comes from the PynamoDB models: key schema, global
+secondary indexes, the ``TTLAttribute`` and the billing settings on their
+``Meta`` (``DYNAMODB_BILLING_MODE`` and the capacity variables, see
+database.py). Each run describes the live tables, works out the steps
+that bring them in line, and applies them one thread per table, so the
+tables are created and their indexes backfilled concurrently; a table's
+own steps run in order, since DynamoDB takes one index creation per table
+at a time. Tables and indexes that already match are left alone, so
+running it again is a no-op. Indexes the models don't define, or whose
+key schema differs, are reported but never dropped.
+
+    python bootstrap.py [--dry-run]
+    python bootstrap.py --seed-users N [--todos-per-user N] [--workers N]
+                        [--random-seed N]
+    python bootstrap.py --backfill-status-keys
+    python bootstrap.py --migrate-ids
+    python bootstrap.py --reconcile-stats [--workers N]
+
+``--dry-run`` prints the steps without running them. Seeding writes
+synthetic users (``seed-user-<n>``, password ``BOOTSTRAP_SEED_PASSWORD``)
+and their todos through the storage backend's batch writes from
+``--workers`` threads, so it fills a SQLite database as well
+(``STORAGE_BACKEND=sqlite``). The data depends only on ``--random-seed``
+and the day it is written, so seeding again the same day overwrites the
+same todos instead of adding more. Seeded users' stats counters are
+recounted once their todos are in; ``--reconcile-stats`` recounts every
+user's (see stats.py).
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from botocore.exceptions import ClientError
+from pynamodb.attributes import TTLAttribute
+from pynamodb.constants import PROVISIONED_BILLING_MODE
+from pynamodb.transactions import TransactWrite
+
+from database import attach_models, get_dynamodb_client
+from ids import derived_todo_id, is_time_ordered, new_todo_id
+from models import Todo, TodoStats, User
+from passwords import hash_password
+from stats import reconcile_all
+from storage import storage
+
+MODELS = (User, Todo, TodoStats)
+
+BOOTSTRAP_SEED_PASSWORD = os.getenv("BOOTSTRAP_SEED_PASSWORD", "password")
+BOOTSTRAP_WORKERS = int(os.getenv("BOOTSTRAP_WORKERS", "8"))
+# How far back seeded todos' created_at goes
+SEED_DAYS = 90
+INDEX_POLL_SECONDS = 5
+
+SEED_WORDS = (
+    "review", "write", "plan", "call", "buy", "fix", "update", "email", "book", "clean",
+    "docs", "groceries", "budget", "invoice", "meeting", "release", "dentist", "report",
+    "garden", "taxes", "backup", "slides", "flights", "laundry", "feedback", "roadmap",
+)
+
+
+def _throughput(meta) -> dict:
+    return {"ReadCapacityUnits": meta.read_capacity_units, "WriteCapacityUnits": meta.write_capacity_units}
+
+
+def table_spec(model) -> dict:
+    """The table a model describes, in CreateTable terms, plus its TTL attribute."""
+    schema = model._get_schema()
+    meta = model.Meta
+    provisioned = meta.billing_mode == PROVISIONED_BILLING_MODE
+
+    definitions = {}
+    for definition in schema["attribute_definitions"]:
+        definitions[definition["AttributeName"]] = definition
+    for index in schema["global_secondary_indexes"]:
+        for definition in index["attribute_definitions"]:
+            definitions[definition["AttributeName"]] = definition
+
+    indexes = []
+    for index in schema["global_secondary_indexes"]:
+        spec = {
+            "IndexName": index["index_name"],
+            "KeySchema": _key_schema(index["key_schema"]),
+            "Projection": index["projection"],
+        }
+        if provisioned:
+            spec["ProvisionedThroughput"] = _throughput(meta)
+        indexes.append(spec)
+
+    spec = {
+        "TableName": meta.table_name,
+        "KeySchema": _key_schema(schema["key_schema"]),
+        "AttributeDefinitions": sorted(definitions.values(), key=lambda d: d["AttributeName"]),
+        "BillingMode": meta.billing_mode,
+        "GlobalSecondaryIndexes": indexes,
+        "ttl": next(
+            (attr.attr_name for attr in model.get_attributes().values() if isinstance(attr, TTLAttribute)),
+            None,
+        ),
+    }
+    if provisioned:
+        spec["ProvisionedThroughput"] = _throughput(meta)
+    return spec
+
+
+def _key_schema(key_schema: list) -> list:
+    # HASH before RANGE, as DynamoDB requires
+    return sorted(key_schema, key=lambda key: key["KeyType"] != "HASH")
+
+
+def _step(table: str, action: str, detail: str, **args) -> dict:
+    return {"table": table, "action": action, "detail": detail, **args}
+
+
+def plan_table(spec: dict) -> list:
+    """The steps that bring the live table in line with ``spec``; warnings are steps too."""
+    client = get_dynamodb_client()
+    name = spec["TableName"]
+    try:
+        table = client.describe_table(TableName=name)["Table"]
+    except ClientError as e:
+        if e.response["Error"]["Code"] != "ResourceNotFoundException":
+            raise
+        indexes = ", ".join(index["IndexName"] for index in spec["GlobalSecondaryIndexes"])
+        steps = [_step(name, "create_table", f"create table ({spec['BillingMode']}; indexes: {indexes or 'none'})")]
+        if spec["ttl"]:
+            steps.append(_step(name, "enable_ttl", f"enable TTL on '{spec['ttl']}'"))
+        return steps
+
+    steps = []
+    billing_mode = table.get("BillingModeSummary", {}).get("BillingMode", PROVISIONED_BILLING_MODE)
+    if billing_mode != spec["BillingMode"]:
+        steps.append(_step(name, "update_billing", f"billing {billing_mode} -> {spec['BillingMode']}"))
+    elif "ProvisionedThroughput" in spec:
+        current = {key: table["ProvisionedThroughput"][key] for key in spec["ProvisionedThroughput"]}
+        if current != spec["ProvisionedThroughput"]:
+            steps.append(_step(name, "update_billing", f"capacity {current} -> {spec['ProvisionedThroughput']}"))
+
+    live = {index["IndexName"]: index for index in table.get("GlobalSecondaryIndexes", [])}
+    wanted = {index["IndexName"] for index in spec["GlobalSecondaryIndexes"]}
+    for index in spec["GlobalSecondaryIndexes"]:
+        existing = live.get(index["IndexName"])
+        if existing is None:
+            steps.append(_step(name, "create_index", f"create index '{index['IndexName']}'", index=index))
+        elif _key_schema(existing["KeySchema"]) != index["KeySchema"]:
+            steps.append(_step(name, "warn", f"index '{index['IndexName']}' has a different key schema; "
+                                             f"drop it by hand to have it recreated"))
+    for index_name in sorted(set(live) - wanted):
+        steps.append(_step(name, "warn", f"index '{index_name}' is not defined on the model (left in place)"))
+
+    if spec["ttl"]:
+        ttl = client.describe_time_to_live(TableName=name)["TimeToLiveDescription"]
+        if ttl.get("TimeToLiveStatus") not in ("ENABLED", "ENABLING"):
+            steps.append(_step(name, "enable_ttl", f"enable TTL on '{spec['ttl']}'"))
+        elif ttl.get("AttributeName") != spec["ttl"]:
+            steps.append(_step(name, "warn", f"TTL is on '{ttl.get('AttributeName')}', not '{spec['ttl']}'"))
+    return steps
+
+
+def wait_for_table(table_name: str, index_name: str = None, delay: float = INDEX_POLL_SECONDS):
+    """Block until the table (and ``index_name``, if given) is ACTIVE."""
+    client = get_dynamodb_client()
+    while True:
+        table = client.describe_table(TableName=table_name)["Table"]
+        statuses = [table["TableStatus"]]
+        if index_name is not None:
+            statuses += [
+                index["IndexStatus"] for index in table.get("GlobalSecondaryIndexes", [])
+                if index["IndexName"] == index_name
+            ]
+        if all(status == "ACTIVE" for status in statuses):
+            return
+        time.sleep(delay)
+
+
+def run_step(spec: dict, step: dict):
+    client = get_dynamodb_client()
+    name = spec["TableName"]
+    action = step["action"]
+    if action == "create_table":
+        create = {key: value for key, value in spec.items() if key != "ttl" and value}
+        client.create_table(**create)
+        client.get_waiter("table_exists").wait(TableName=name)
+    elif action == "create_index":
+        client.update_table(
+            TableName=name,
+            AttributeDefinitions=spec["AttributeDefinitions"],
+            GlobalSecondaryIndexUpdates=[{"Create": step["index"]}],
+        )
+        wait_for_table(name, step["index"]["IndexName"])
+    elif action == "update_billing":
+        update = {"TableName": name, "BillingMode": spec["BillingMode"]}
+        if "ProvisionedThroughput" in spec:
+            update["ProvisionedThroughput"] = spec["ProvisionedThroughput"]
+            # Existing indexes need capacity too once the table is provisioned
+            live = client.describe_table(TableName=name)["Table"].get("GlobalSecondaryIndexes", [])
+            if live:
+                update["GlobalSecondaryIndexUpdates"] = [
+                    {"Update": {"IndexName": index["IndexName"], "ProvisionedThroughput": spec["ProvisionedThroughput"]}}
+                    for index in live
+                ]
+        client.update_table(**update)
+        wait_for_table(name)
+    elif action == "enable_ttl":
+        client.update_time_to_live(
+            TableName=name,
+            TimeToLiveSpecification={"Enabled": True, "AttributeName": spec["ttl"]},
+        )
+
+
+def apply_table(spec: dict, steps: list) -> bool:
+    """Run one table's steps in order; stops at the first failure."""
+    for step in steps:
+        if step["action"] == "warn":
+            continue
+        try:
+            started = time.perf_counter()
+            run_step(spec, step)
+            print(f"  ✓ {step['table']}: {step['detail']} ({time.perf_counter() - started:.1f}s)")
+        except ClientError as e:
+            print(f"  ✗ {step['table']}: {step['detail']} failed: {e}")
+            return False
+    return True
+
+
+def print_plan(plans: dict):
+    for table_name, steps in plans.items():
+        if not steps:
+            print(f"{table_name}: up to date")
+            continue
+        print(f"{table_name}:")
+        for step in steps:
+            print(f"  {'!' if step['action'] == 'warn' else '+'} {step['detail']}")
+
+
+def bootstrap_schema(dry_run: bool = False) -> bool:
+    """Plan every model's table, then (unless ``dry_run``) apply the plans concurrently."""
+    specs = [table_spec(model) for model in MODELS]
+    with ThreadPoolExecutor(max_workers=len(specs), thread_name_prefix="bootstrap") as executor:
+        plans = dict(zip(
+            (spec["TableName"] for spec in specs),
+            executor.map(plan_table, specs),
+        ))
+        print_plan(plans)
+        if dry_run:
+            return True
+        results = executor.map(apply_table, specs, plans.values())
+        return all(list(results))
+
+
+def _seed_todos(rng: random.Random, user_id: str, count: int, anchor: datetime) -> list:
+    todos = []
+    for n in range(count):
+        created_at = anchor - timedelta(seconds=rng.randrange(SEED_DAYS * 24 * 3600))
+        updated_at = min(created_at + timedelta(seconds=rng.randrange(7 * 24 * 3600)), anchor)
+        words = rng.sample(SEED_WORDS, rng.randint(2, 4))
+        todos.append(Todo(
+            user_id=user_id,
+            todo_id=derived_todo_id(created_at, f"seed|{user_id}|{n}"),
+            title=" ".join(words).capitalize(),
+            description=" ".join(rng.choices(SEED_WORDS, k=rng.randint(5, 20))) if rng.random() < 0.5 else None,
+            completed=rng.random() < 0.3,
+            created_at=created_at,
+            updated_at=updated_at,
+        ))
+    return todos
+
+
+def seed_data(users: int, todos_per_user: int, workers: int = BOOTSTRAP_WORKERS, random_seed: int = 0) -> dict:
+    """Write ``users`` synthetic users with ``todos_per_user`` todos each, ``workers`` users at a time."""
+    # One hash for everyone: hashing is deliberately slow
+    hashed_password = hash_password(BOOTSTRAP_SEED_PASSWORD)
+    anchor = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+
+    def seed_user(n):
+        user_id = f"seed-user-{n}"
+        storage.put_user(User(username=user_id, hashed_password=hashed_password))
+        todos = _seed_todos(random.Random(f"{random_seed}|{n}"), user_id, todos_per_user, anchor)
+        unwritten = 0
+        for start in range(0, len(todos), storage.batch_write_limit):
+            unwritten += len(storage.batch_write(todos[start:start + storage.batch_write_limit], []))
+        # Reseeding replaces todos, so count rather than add
+        storage.reconcile_stats(user_id)
+        return len(todos) - unwritten, unwritten
+
+    started = time.perf_counter()
+    written = failed = 0
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="seed") as executor:
+        for done, (ok, unwritten) in enumerate(executor.map(seed_user, range(users)), 1):
+            written += ok
+            failed += unwritten
+            if done % 100 == 0:
+                print(f"  {done}/{users} users, {written} todos", file=sys.stderr)
+    seconds = time.perf_counter() - started
+    return {
+        "users": users,
+        "todos": written,
+        "failed": failed,
+        "seconds": round(seconds, 3),
+        "todos_per_second": round(written / seconds) if seconds else None,
+    }
+
+
+def backfill_status_keys():
+    """Set status_key on todos written before the status indexes existed."""
+    print(f"Backfilling status_key in '{Todo.Meta.table_name}'...")
+    updated = 0
+    for todo in Todo.scan(filter_condition=Todo.status_key.does_not_exist() & Todo.deleted.does_not_exist()):
+        todo.update(actions=[Todo.status_key.set(Todo.make_status_key(todo.user_id, bool(todo.completed)))])
+        updated += 1
+    print(f"Backfilled {updated} todos.")
+
+
+def migrate_legacy_todo_ids():
+    """
+    Re-key todos that still have random UUID4 ids.
+
+    Each legacy item is copied to a time-ordered id derived from its
+    created_at, keeping the old id in legacy_id (the API still resolves
+    it, through the legacy_id index), and the original is deleted in the
+    same transaction.
+    """
+    print(f"Migrating legacy todo ids in '{Todo.Meta.table_name}'...")
+    migrated = 0
+    connection = Todo._get_connection().connection
+    for todo in Todo.scan():
+        if is_time_ordered(todo.todo_id):
+            continue
+        new_todo = Todo(
+            user_id=todo.user_id,
+            todo_id=new_todo_id(todo.created_at),
+            legacy_id=todo.todo_id,
+            title=todo.title,
+            description=todo.description,
+            completed=todo.completed,
+            created_at=todo.created_at,
+            updated_at=todo.updated_at,
+            deleted=todo.deleted,
+            expires_at=todo.expires_at,
+        )
+        try:
+            with TransactWrite(connection=connection) as transaction:
+                transaction.save(new_todo, condition=Todo.todo_id.does_not_exist())
+                transaction.delete(todo)
+            migrated += 1
+        except Exception as e:
+            print(f"  ✗ Error migrating todo '{todo.todo_id}': {e}")
+    print(f"Migrated {migrated} todos.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--dry-run", action="store_true", help="print the schema changes without applying them")
+    parser.add_argument("--seed-users", type=int, default=0, help="synthetic users to write")
+    parser.add_argument("--todos-per-user", type=int, default=20)
+    parser.add_argument("--workers", type=int, default=BOOTSTRAP_WORKERS)
+    parser.add_argument("--random-seed", type=int, default=0)
+    parser.add_argument("--backfill-status-keys", action="store_true")
+    parser.add_argument("--migrate-ids", action="store_true", help="re-key todos that still use UUID4 ids")
+    parser.add_argument("--reconcile-stats", action="store_true", help="recount every user's todo stats")
+    args = parser.parse_args()
+
+    if storage.name == "dynamodb":
+        attach_models(*MODELS)
+        if not bootstrap_schema(dry_run=args.dry_run):
+            raise SystemExit("Schema bootstrap failed")
+        if args.dry_run:
+            return
+        if args.backfill_status_keys:
+            backfill_status_keys()
+        if args.migrate_ids:
+            migrate_legacy_todo_ids()
+    elif args.dry_run or args.backfill_status_keys or args.migrate_ids:
+        raise SystemExit(f"--dry-run, --backfill-status-keys and --migrate-ids only apply to DynamoDB, "
+                         f"not STORAGE_BACKEND={storage.name}")
+    else:
+        # The memory and SQLite engines create their own schema
+        print(f"STORAGE_BACKEND={storage.name}: no tables to bootstrap")
+
+    if args.seed_users:
+        print(f"Seeding {args.seed_users} users with {args.todos_per_user} todos each...")
+        print(json.dumps(seed_data(args.seed_users, args.todos_per_user, args.workers, args.random_seed), indent=2))
+    if args.reconcile_stats:
+        print("Reconciling todo stats...")
+        print(json.dumps(reconcile_all(args.workers), indent=2))
+
+
+if __name__ == "__main__":
+    main()
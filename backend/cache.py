@@ -0,0 +1,241 @@
+"""
+Read-through cache for todo reads.
+
+Two tiers sit in front of the Todo table:
+
+- a bounded in-process LRU with per-entry TTL
+- an optional shared tier (anything implementing ``SharedCache``; Redis
+  when ``TODO_CACHE_URL`` is set), so several workers see the same data
+
+Entries are namespaced by a per-user version stamp. Writes bump the
+user's version instead of hunting down individual keys, which makes every
+cached list and item for that user unreachable at once. Without a shared
+tier the stamp lives in one worker's memory and can't see other workers'
+writes, so lists pass the user's last write time as the version instead
+(``list_version`` in main.py): the later of what storage reports and of
+this worker's own last write, which covers index reads that lag behind
+it. Single items are then read from storage uncached.
+"""
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Optional
+
+MISSING = object()
+
+
+class LRUCache:
+    """A thread-safe LRU cache with per-entry expiry and hit/miss counters."""
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: str) -> Any:
+        """Return the cached value, or MISSING."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return MISSING
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return MISSING
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+class SharedCache:
+    """Interface for a cache tier shared between workers."""
+
+    def get(self, key: str) -> Optional[str]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: str, ttl: float):
+        raise NotImplementedError
+
+    def incr(self, key: str) -> int:
+        """Atomically increment an integer counter and return the new value."""
+        raise NotImplementedError
+
+
+class InMemorySharedCache(SharedCache):
+    """A dict-backed SharedCache, for tests and single-process deployments."""
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                return None
+            return value
+
+    def set(self, key: str, value: str, ttl: float):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl)
+
+    def incr(self, key: str) -> int:
+        with self._lock:
+            entry = self._data.get(key)
+            value = int(entry[0]) + 1 if entry else 1
+            self._data[key] = (str(value), None)
+            return value
+
+
+class RedisSharedCache(SharedCache):
+    """SharedCache backed by Redis (requires the optional ``redis`` package)."""
+
+    def __init__(self, url: str):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("TODO_CACHE_URL is set but the 'redis' package is not installed")
+        self._client = redis.Redis.from_url(url, decode_responses=True)
+
+    def get(self, key: str) -> Optional[str]:
+        return self._client.get(key)
+
+    def set(self, key: str, value: str, ttl: float):
+        self._client.set(key, value, px=int(ttl * 1000))
+
+    def incr(self, key: str) -> int:
+        return self._client.incr(key)
+
+
+class TodoCache:
+    """Per-user, version-stamped cache of serialized todo lists and items."""
+
+    def __init__(self, local: LRUCache, shared: Optional[SharedCache] = None, enabled: bool = True):
+        self.local = local
+        self.shared = shared
+        self.enabled = enabled
+        self._versions = LRUCache(max_entries=local.max_entries, ttl=local.ttl)
+        # User -> updated_at of this worker's latest write, kept while the index may lag
+        self._written = LRUCache(max_entries=local.max_entries, ttl=local.ttl)
+        self.shared_hits = 0
+        self.invalidations = 0
+
+    def version(self, user_id: str) -> str:
+        """The user's current version stamp; read it before querying the table."""
+        if self.shared is not None:
+            return self.shared.get(f"todos:v:{user_id}") or "0"
+        version = self._versions.get(user_id)
+        if version is MISSING:
+            version = uuid.uuid4().hex
+            self._versions.set(user_id, version)
+        return version
+
+    def invalidate(self, user_id: str, at: Optional[datetime] = None):
+        """Bump the user's version after a write stamped ``at`` (default: now)."""
+        self.invalidations += 1
+        if self.shared is not None:
+            self.shared.incr(f"todos:v:{user_id}")
+        else:
+            self._versions.set(user_id, uuid.uuid4().hex)
+        at = at or datetime.now(timezone.utc)
+        previous = self._written.get(user_id)
+        if previous is MISSING or at > previous:
+            self._written.set(user_id, at)
+
+    def last_write(self, user_id: str) -> Optional[datetime]:
+        """When this worker last wrote the user's todos, if within the TTL."""
+        written = self._written.get(user_id)
+        return None if written is MISSING else written
+
+    def get(self, user_id: str, version: str, key: str) -> Any:
+        """Return a cached value, or MISSING."""
+        if not self.enabled:
+            return MISSING
+        full_key = f"todos:{user_id}:{version}:{key}"
+        value = self.local.get(full_key)
+        if value is not MISSING or self.shared is None:
+            return value
+        raw = self.shared.get(full_key)
+        if raw is None:
+            return MISSING
+        self.shared_hits += 1
+        value = json.loads(raw)
+        self.local.set(full_key, value)
+        return value
+
+    def set(self, user_id: str, version: str, key: str, value: Any):
+        if not self.enabled:
+            return
+        full_key = f"todos:{user_id}:{version}:{key}"
+        self.local.set(full_key, value)
+        if self.shared is not None:
+            self.shared.set(full_key, json.dumps(value), self.local.ttl)
+
+    def stats(self) -> dict:
+        stats = self.local.stats()
+        stats.update({
+            "enabled": self.enabled,
+            "shared_tier": type(self.shared).__name__ if self.shared is not None else None,
+            "shared_hits": self.shared_hits,
+            "invalidations": self.invalidations,
+        })
+        return stats
+
+
+def build_todo_cache() -> TodoCache:
+    """Build the cache from TODO_CACHE_* environment variables."""
+    url = os.getenv("TODO_CACHE_URL")
+    shared = RedisSharedCache(url) if url else None
+    local = LRUCache(
+        max_entries=int(os.getenv("TODO_CACHE_MAX_ENTRIES", "10000")),
+        ttl=float(os.getenv("TODO_CACHE_TTL", "30")),
+    )
+    enabled = os.getenv("TODO_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+    return TodoCache(local, shared, enabled=enabled)
+
+
+todo_cache = build_todo_cache()
@@ -0,0 +1,79 @@
+"""
+Delta sync: ``GET /todos/changes?since=<token>``.
+
+Deletes leave a tombstone (``Todo.deleted``) instead of removing the item,
+and tombstones expire after ``TOMBSTONE_TTL_SECONDS`` (DynamoDB TTL on
+``expires_at``; the memory and SQLite engines purge them when the feed is
+read). The feed walks the user's todos by ``updated_at`` on the
+updated_at index, so a client that synced recently pays only for what
+changed since, tombstones included.
+
+The sync token is a signed cursor carrying the time the last complete
+pass started, plus the page key while a pass is still in progress. Each
+pass re-reads ``CHANGES_SKEW_SECONDS`` before that time, so writes that
+were in flight (or stamped by a slightly slow clock) when the previous
+pass ran are not missed; clients must treat changes as idempotent
+upserts. A token older than the tombstone TTL may have missed deletes, so
+it is rejected with ``SyncTokenExpired`` and the client has to resync from
+scratch.
+"""
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from conditional import EPOCH, parse_timestamp
+from pagination import decode_cursor, encode_cursor
+from serialization import TodoOut
+from storage import storage
+from tokens import SECRET_KEY
+
+TOMBSTONE_TTL = timedelta(seconds=int(os.getenv("TOMBSTONE_TTL_SECONDS", str(7 * 24 * 3600))))
+CHANGES_SKEW = timedelta(seconds=float(os.getenv("CHANGES_SKEW_SECONDS", "5")))
+
+
+class SyncTokenExpired(Exception):
+    """Raised when a sync token predates the oldest tombstone still kept."""
+
+
+def _scope(user_id: str) -> str:
+    return f"{user_id}|changes"
+
+
+def sync_token(user_id: str, at: datetime) -> str:
+    """A token for the changes feed that covers everything from ``at`` on."""
+    return encode_cursor({"t": at.isoformat()}, _scope(user_id), SECRET_KEY)
+
+
+def load_changes(user_id: str, token: Optional[str], limit: int) -> dict:
+    """
+    One page of changes after ``token`` (everything when it is None).
+
+    Returns ``{"changes": [...], "deleted": [ids], "next_since": token,
+    "has_more": bool}``. Raises ``InvalidCursor`` for a bad token and
+    ``SyncTokenExpired`` for one that is too old.
+    """
+    started = datetime.now(timezone.utc)
+    base, start_key = None, None
+    if token:
+        state = decode_cursor(token, _scope(user_id), SECRET_KEY)
+        # No "t" means the continuation of a full sync, which can't have missed deletes
+        base, start_key = parse_timestamp(state.get("t")), state.get("k")
+        if base is not None and base < started - TOMBSTONE_TTL:
+            raise SyncTokenExpired()
+
+    since = max(base - CHANGES_SKEW, EPOCH) if base is not None else EPOCH
+    todos, last_key = storage.query_changes(user_id, since, limit, start_key)
+
+    if last_key is None:
+        # Pass complete: the next one starts from when this page was read
+        state = {"t": started.isoformat()}
+    else:
+        state = {"k": last_key}
+        if base is not None:
+            state["t"] = base.isoformat()
+    return {
+        "changes": [TodoOut.from_model(todo) for todo in todos if not todo.deleted],
+        "deleted": [todo.todo_id for todo in todos if todo.deleted],
+        "next_since": encode_cursor(state, _scope(user_id), SECRET_KEY),
+        "has_more": last_key is not None,
+    }
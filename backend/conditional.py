@@ -0,0 +1,71 @@
+"""
+ETag helpers for conditional GETs and optimistic concurrency.
+
+List ETags are weak and derived from the user's cache version plus the
+query, so ``If-None-Match`` on ``GET /todos`` can be answered without
+reading any items. Item ETags are strong and encode ``updated_at`` in
+microseconds, which lets ``If-Match`` on ``PUT /todos/{id}`` become a
+DynamoDB condition on ``updated_at``.
+"""
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime
+from typing import Optional
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def _as_utc(value: datetime) -> datetime:
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def parse_timestamp(value: Optional[str]) -> Optional[datetime]:
+    """Parse a serialized ``created_at``/``updated_at`` into an aware UTC datetime."""
+    if not value:
+        return None
+    return _as_utc(datetime.fromisoformat(value))
+
+
+def list_etag(user_id: str, version: str, query_key: str) -> str:
+    digest = hashlib.sha1(f"{user_id}:{version}:{query_key}".encode("utf-8")).hexdigest()
+    return f'W/"{digest}"'
+
+
+def todo_etag(updated_at: datetime) -> str:
+    delta = _as_utc(updated_at) - EPOCH
+    micros = (delta.days * 86400 + delta.seconds) * 1_000_000 + delta.microseconds
+    return f'"{micros:x}"'
+
+
+def parse_todo_etag(etag: str) -> Optional[datetime]:
+    """Recover ``updated_at`` from an item ETag; None if it isn't one of ours."""
+    value = etag.strip()
+    if value.startswith("W/"):
+        value = value[2:]
+    try:
+        micros = int(value.strip('"'), 16)
+    except ValueError:
+        return None
+    return datetime.fromtimestamp(micros // 1_000_000, tz=timezone.utc).replace(microsecond=micros % 1_000_000)
+
+
+def etag_matches(header: Optional[str], etag: str) -> bool:
+    """Weak comparison of ``etag`` against an If-None-Match/If-Match header."""
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    bare = etag[2:] if etag.startswith("W/") else etag
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == bare:
+            return True
+    return False
+
+
+def http_date(value: datetime) -> str:
+    return format_datetime(_as_utc(value), usegmt=True)
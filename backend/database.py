@@ -1,19 +1,186 @@
 """
 Database connection and utilities for DynamoDB.
+
+All AWS/DynamoDB settings are read once here. A single botocore client,
+and so a single HTTP connection pool, is built lazily on first use and
+shared by the PynamoDB models and the boto3 helpers. Models built on
+``SharedClientModel`` attach to it the first time they are used. With
+``STARTUP_MODE=eager`` (the default) the FastAPI lifespan hook also
+pre-opens connections, so TLS handshakes happen at startup instead of on
+the request path; ``STARTUP_MODE=lazy`` skips that for serverless cold
+starts, and boto3 and the client are not loaded until the first request
+that needs them. pynamodb and botocore still load at import, whatever
+the storage backend, because every engine builds the models' instances.
+
+Tuning (environment variables):
+
+- ``DYNAMODB_MAX_POOL_CONNECTIONS``: keep at least ``IO_POOL_WORKERS``,
+  or connections are discarded and re-established under load
+- ``DYNAMODB_CONNECT_TIMEOUT`` / ``DYNAMODB_READ_TIMEOUT`` (seconds)
+- ``DYNAMODB_RETRY_MODE`` (``standard``, ``adaptive`` or ``legacy``) and
+  ``DYNAMODB_MAX_ATTEMPTS``
+- ``DYNAMODB_TCP_KEEPALIVE``
+- ``DYNAMODB_WARMUP_CONNECTIONS``: connections to open at startup
+- ``DYNAMODB_ENDPOINT_URL``: e.g. DynamoDB Local
+- ``DYNAMODB_BILLING_MODE`` (``PAY_PER_REQUEST`` or ``PROVISIONED``) and
+  ``DYNAMODB_READ_CAPACITY_UNITS`` / ``DYNAMODB_WRITE_CAPACITY_UNITS``:
+  applied to the tables and their indexes by bootstrap.py
 """
-import boto3
+import asyncio
+import functools
 import os
-from dotenv import load_dotenv
+import threading
+
+from pynamodb.models import Model
+
+from metrics import instrument_dynamodb
+
+# Load environment variables from .env, if there is one; deployments that
+# set them directly skip importing python-dotenv altogether
+ENV_FILE = os.path.join(os.path.dirname(__file__), '..', '.env')
+if os.path.exists(ENV_FILE):
+    from dotenv import load_dotenv
+
+    load_dotenv(dotenv_path=ENV_FILE)
+
+
+@functools.lru_cache(maxsize=None)
+def get_settings() -> dict:
+    """AWS and connection settings, parsed once per process."""
+    return {
+        "region": os.getenv("AWS_REGION", "us-east-1"),
+        "endpoint_url": os.getenv("DYNAMODB_ENDPOINT_URL") or None,
+        "aws_access_key_id": os.getenv("MY_AWS_ACCESS_KEY_ID"),
+        "aws_secret_access_key": os.getenv("MY_AWS_SECRET_ACCESS_KEY"),
+        "max_pool_connections": int(os.getenv("DYNAMODB_MAX_POOL_CONNECTIONS", "50")),
+        "connect_timeout": float(os.getenv("DYNAMODB_CONNECT_TIMEOUT", "2")),
+        "read_timeout": float(os.getenv("DYNAMODB_READ_TIMEOUT", "5")),
+        "retry_mode": os.getenv("DYNAMODB_RETRY_MODE", "standard"),
+        "max_attempts": int(os.getenv("DYNAMODB_MAX_ATTEMPTS", "3")),
+        "tcp_keepalive": os.getenv("DYNAMODB_TCP_KEEPALIVE", "true").lower() in ("1", "true", "yes"),
+        "warmup_connections": int(os.getenv("DYNAMODB_WARMUP_CONNECTIONS", "4")),
+        "billing_mode": os.getenv("DYNAMODB_BILLING_MODE", "PAY_PER_REQUEST").upper(),
+        "read_capacity_units": int(os.getenv("DYNAMODB_READ_CAPACITY_UNITS", "5")),
+        "write_capacity_units": int(os.getenv("DYNAMODB_WRITE_CAPACITY_UNITS", "5")),
+    }
 
-# Load environment variables from .env
-load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '..', '.env'))
 
+class DynamoDBMeta:
+    """Base for the PynamoDB models' Meta classes, filled from get_settings()."""
+    region = get_settings()["region"]
+    host = get_settings()["endpoint_url"]
+    aws_access_key_id = get_settings()["aws_access_key_id"]
+    aws_secret_access_key = get_settings()["aws_secret_access_key"]
+    connect_timeout_seconds = get_settings()["connect_timeout"]
+    read_timeout_seconds = get_settings()["read_timeout"]
+    max_retry_attempts = get_settings()["max_attempts"] - 1
+    max_pool_connections = get_settings()["max_pool_connections"]
+    billing_mode = get_settings()["billing_mode"]
+    read_capacity_units = get_settings()["read_capacity_units"]
+    write_capacity_units = get_settings()["write_capacity_units"]
 
+
+def get_client_config():
+    """botocore client configuration (a ``botocore.config.Config``) built from the settings."""
+    import botocore.config
+
+    settings = get_settings()
+    return botocore.config.Config(
+        region_name=settings["region"],
+        max_pool_connections=settings["max_pool_connections"],
+        connect_timeout=settings["connect_timeout"],
+        read_timeout=settings["read_timeout"],
+        retries={"mode": settings["retry_mode"], "total_max_attempts": settings["max_attempts"]},
+        tcp_keepalive=settings["tcp_keepalive"],
+        # PynamoDB builds requests itself; skip botocore's re-validation
+        parameter_validation=False,
+    )
+
+
+# boto3 client/resource construction is not thread-safe
+_client_lock = threading.Lock()
+
+
+def _boto3_session():
+    # boto3 is only needed for the shared client, so it loads with it
+    import boto3
+
+    settings = get_settings()
+    return boto3.session.Session(
+        region_name=settings["region"],
+        aws_access_key_id=settings["aws_access_key_id"],
+        aws_secret_access_key=settings["aws_secret_access_key"],
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def get_dynamodb_client():
+    """Get the shared DynamoDB client."""
+    with _client_lock:
+        client = _boto3_session().client(
+            "dynamodb",
+            endpoint_url=get_settings()["endpoint_url"],
+            config=get_client_config(),
+        )
+    instrument_dynamodb(client)
+    return client
+
+
+@functools.lru_cache(maxsize=None)
 def get_dynamodb_resource():
     """Get DynamoDB resource configured with AWS credentials."""
-    return boto3.resource(
-        "dynamodb",
-        region_name=os.getenv("AWS_REGION", "us-east-1"),
-        aws_access_key_id=os.getenv("MY_AWS_ACCESS_KEY_ID"),
-        aws_secret_access_key=os.getenv("MY_AWS_SECRET_ACCESS_KEY")
-    )
+    with _client_lock:
+        return _boto3_session().resource(
+            "dynamodb",
+            endpoint_url=get_settings()["endpoint_url"],
+            config=get_client_config(),
+        )
+
+
+_attach_lock = threading.Lock()
+
+
+def attach_connection(connection):
+    """Point one PynamoDB ``Connection`` at the shared client."""
+    client = get_dynamodb_client()
+    with _attach_lock:
+        if connection._client is client:
+            return
+        # PynamoDB registers this hook on clients it creates itself
+        client.meta.events.register_first("before-send.*.*", connection._before_send)
+        connection._client = client
+
+
+def attach_models(*models):
+    """Point the models' PynamoDB connections at the shared client."""
+    for model in models:
+        attach_connection(model._get_connection().connection)
+
+
+class SharedClientModel(Model):
+    """Base for the models: attaches them to the shared client on first use instead of PynamoDB's own."""
+
+    @classmethod
+    def _get_connection(cls):
+        connection = super()._get_connection()
+        if connection.connection._client is None:
+            attach_connection(connection.connection)
+        return connection
+
+
+async def warm_up(run, *models):
+    """
+    Attach ``models`` to the shared client and pre-open connections.
+
+    ``run`` executes a blocking call off the event loop (e.g. run_io).
+    DescribeTable calls are issued concurrently so the pool ends up with
+    several established connections. Failures are logged, not raised: a
+    cold pool is slower, not broken.
+    """
+    try:
+        await run(attach_models, *models)
+        count = get_settings()["warmup_connections"]
+        calls = [run(models[i % len(models)].describe_table) for i in range(count)]
+        await asyncio.gather(*calls)
+    except Exception as e:
+        print(f"DynamoDB warm-up failed: {e}")
@@ -0,0 +1,239 @@
+"""
+Server-side fan-out of todo changes to ``GET /todos/events`` (Server-Sent Events).
+
+The create/update/delete handlers publish to ``event_bus``, which hands
+each event to every open stream of the same user on this worker and, when
+``TODO_EVENTS_URL`` is set, to the other workers through a shared backend
+(Redis pub/sub). Delivery never blocks the publisher:
+
+- each stream keeps at most one pending event per todo, so a burst of
+  edits to the same todo reaches a slow client as its latest state
+- a stream whose pending events exceed ``TODO_EVENTS_MAX_PENDING`` drops
+  them and gets a single ``resync`` event instead; the client then catches
+  up through ``/todos/changes`` with the token from the ``ready`` event
+
+Pending events are written in one chunk per wake-up, and an idle stream
+gets a comment line every ``TODO_EVENTS_HEARTBEAT_SECONDS`` so proxies
+keep it open.
+"""
+import asyncio
+import json
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Callable, Optional
+
+from serialization import TodoOut, dumps
+
+TODO_EVENTS_MAX_PENDING = int(os.getenv("TODO_EVENTS_MAX_PENDING", "256"))
+TODO_EVENTS_MAX_STREAMS_PER_USER = int(os.getenv("TODO_EVENTS_MAX_STREAMS_PER_USER", "10"))
+TODO_EVENTS_HEARTBEAT_SECONDS = float(os.getenv("TODO_EVENTS_HEARTBEAT_SECONDS", "15"))
+TODO_EVENTS_CHANNEL = os.getenv("TODO_EVENTS_CHANNEL", "todo-events")
+
+HEARTBEAT = b": ping\n\n"
+
+
+class TooManyStreams(Exception):
+    """Raised when a user already has TODO_EVENTS_MAX_STREAMS_PER_USER streams open."""
+
+
+def frame(event_type: str, data) -> bytes:
+    """One SSE message."""
+    return b"event: " + event_type.encode("ascii") + b"\ndata: " + dumps(data) + b"\n\n"
+
+
+def todo_event(event_type: str, todo) -> dict:
+    """An event for a todo model; deletes carry only the id."""
+    data = {"type": event_type, "id": todo.todo_id}
+    if event_type != "deleted":
+        data["todo"] = TodoOut.from_model(todo).to_dict()
+    return data
+
+
+def _merge(old: dict, new: dict) -> dict:
+    # A todo created and then edited before the client saw it is still new to the client
+    if old["type"] == "created" and new["type"] == "updated":
+        return {**new, "type": "created"}
+    return new
+
+
+class Stream:
+    """One open event stream: a bounded, per-todo coalescing queue read by a single consumer."""
+
+    def __init__(self, user_id: str, max_pending: int):
+        self.user_id = user_id
+        self.max_pending = max_pending
+        self._pending = OrderedDict()
+        self._overflowed = False
+        self._wake = asyncio.Event()
+
+    def offer(self, event: dict) -> str:
+        """Queue an event; returns "queued", "coalesced" or "overflowed". Event-loop thread only."""
+        outcome = "queued"
+        if self._overflowed:
+            outcome = "overflowed"
+        elif event["id"] in self._pending:
+            event = _merge(self._pending.pop(event["id"]), event)
+            self._pending[event["id"]] = event
+            outcome = "coalesced"
+        elif len(self._pending) >= self.max_pending:
+            # The client is too far behind for events to be worth keeping
+            self._pending.clear()
+            self._overflowed = True
+            outcome = "overflowed"
+        else:
+            self._pending[event["id"]] = event
+        self._wake.set()
+        return outcome
+
+    async def next_chunk(self, timeout: float) -> Optional[bytes]:
+        """Everything pending as SSE bytes, or None if nothing arrived within ``timeout``."""
+        if not self._pending and not self._overflowed:
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout)
+            except asyncio.TimeoutError:
+                return None
+        if self._overflowed:
+            self._overflowed = False
+            return frame("resync", {"type": "resync"})
+        events, self._pending = list(self._pending.values()), OrderedDict()
+        return b"".join(frame(event["type"], event) for event in events)
+
+
+class EventBackend:
+    """Interface for relaying events between workers."""
+
+    def publish(self, message: str):
+        raise NotImplementedError
+
+    def start(self, deliver: Callable[[str], None]):
+        """Start calling ``deliver(message)`` (from any thread) for messages published elsewhere."""
+        raise NotImplementedError
+
+    def stop(self):
+        raise NotImplementedError
+
+
+class RedisEventBackend(EventBackend):
+    """EventBackend on Redis pub/sub (requires the optional ``redis`` package)."""
+
+    def __init__(self, url: str, channel: str):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("TODO_EVENTS_URL is set but the 'redis' package is not installed")
+        self.channel = channel
+        self._client = redis.Redis.from_url(url, decode_responses=True)
+        self._pubsub = None
+        self._thread = None
+
+    def publish(self, message: str):
+        self._client.publish(self.channel, message)
+
+    def start(self, deliver):
+        self._pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+        self._pubsub.subscribe(self.channel)
+
+        def listen():
+            try:
+                for message in self._pubsub.listen():
+                    deliver(message["data"])
+            except Exception as e:
+                # Closing the connection in stop() ends listen() with an error
+                if self._pubsub is not None:
+                    print(f"Todo event listener stopped: {e}")
+
+        self._thread = threading.Thread(target=listen, name="todo-events", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        pubsub, self._pubsub = self._pubsub, None
+        if pubsub is not None:
+            pubsub.close()
+
+
+class EventBus:
+    """Per-user fan-out to open streams, optionally relayed across workers."""
+
+    def __init__(self, backend: Optional[EventBackend] = None, max_pending: int = TODO_EVENTS_MAX_PENDING,
+                 max_streams_per_user: int = TODO_EVENTS_MAX_STREAMS_PER_USER):
+        self.backend = backend
+        self.max_pending = max_pending
+        self.max_streams_per_user = max_streams_per_user
+        # Tags our own messages, which come back from the backend too
+        self.origin = uuid.uuid4().hex
+        self._streams = {}
+        self._loop = None
+        self.counters = {"published": 0, "queued": 0, "coalesced": 0, "overflowed": 0, "relayed": 0}
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        if self.backend is not None:
+            self.backend.start(self._receive)
+
+    def stop(self):
+        if self.backend is not None:
+            self.backend.stop()
+
+    def subscribe(self, user_id: str) -> Stream:
+        streams = self._streams.setdefault(user_id, set())
+        if len(streams) >= self.max_streams_per_user:
+            raise TooManyStreams()
+        stream = Stream(user_id, self.max_pending)
+        streams.add(stream)
+        return stream
+
+    def unsubscribe(self, stream: Stream):
+        streams = self._streams.get(stream.user_id)
+        if streams is not None:
+            streams.discard(stream)
+            if not streams:
+                del self._streams[stream.user_id]
+
+    def _deliver(self, user_id: str, events: list):
+        for stream in self._streams.get(user_id, ()):
+            for event in events:
+                self.counters[stream.offer(event)] += 1
+
+    def _receive(self, message: str):
+        # Called on the backend's thread
+        data = json.loads(message)
+        if data["origin"] != self.origin and self._loop is not None:
+            self.counters["relayed"] += 1
+            self._loop.call_soon_threadsafe(self._deliver, data["user_id"], data["events"])
+
+    async def publish(self, user_id: str, events: list, run=None):
+        """Fan ``events`` out to the user's streams; ``run`` runs the backend publish off the event loop."""
+        if not events:
+            return
+        self.counters["published"] += len(events)
+        self._deliver(user_id, events)
+        if self.backend is not None:
+            message = dumps({"origin": self.origin, "user_id": user_id, "events": events}).decode("utf-8")
+            try:
+                if run is not None:
+                    await run(self.backend.publish, message)
+                else:
+                    self.backend.publish(message)
+            except Exception as e:
+                # Other workers' streams miss this; their clients resync on reconnect
+                print(f"Error relaying todo events: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "users": len(self._streams),
+            "streams": sum(len(streams) for streams in self._streams.values()),
+            "backend": type(self.backend).__name__ if self.backend is not None else None,
+            **self.counters,
+        }
+
+
+def build_event_bus() -> EventBus:
+    """Build the bus from TODO_EVENTS_* environment variables."""
+    url = os.getenv("TODO_EVENTS_URL")
+    return EventBus(RedisEventBackend(url, TODO_EVENTS_CHANNEL) if url else None)
+
+
+event_bus = build_event_bus()
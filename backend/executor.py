@@ -0,0 +1,172 @@
+"""
+Bounded worker pools for blocking DynamoDB and password-hashing calls.
+
+PynamoDB and bcrypt are synchronous, so the async handlers in main.py hand
+that work to one of these pools instead of running it on the event loop.
+Each pool has a fixed number of workers plus a bounded backlog; once both
+are full, new work is rejected immediately with a 503 rather than queueing
+behind slow calls. The password-hashing pool lives in passwords.py.
+"""
+import asyncio
+import contextvars
+import functools
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import HTTPException
+
+
+class PoolSaturated(HTTPException):
+    """Raised when a pool's workers and backlog are all in use."""
+
+    def __init__(self, pool_name: str, retry_after: int = 1):
+        super().__init__(
+            status_code=503,
+            detail=f"Server busy ({pool_name} pool saturated), please retry",
+            headers={"Retry-After": str(retry_after)},
+        )
+
+
+# Every pool created, for stats and shutdown
+_pools = []
+
+
+class BoundedExecutor:
+    """
+    A thread or process pool with a queue-depth limit and basic counters.
+
+    Process pools use the spawn start method (forking a process that is
+    already running threads is unsafe), so functions and arguments sent to
+    them must be picklable. The underlying pool (and, for process pools,
+    multiprocessing itself) is only created on first use.
+    """
+
+    def __init__(self, name: str, max_workers: int, max_queue: int, kind: str = "thread"):
+        self.name = name
+        self.kind = kind
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor = None
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._submitted = 0
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+        self._queue_wait_total = 0.0
+        self._run_time_total = 0.0
+        self._queue_wait_max = 0.0
+        _pools.append(self)
+
+    def _get_executor(self):
+        if self._executor is not None:
+            return self._executor
+        with self._lock:
+            if self._executor is None:
+                if self.kind == "process":
+                    import multiprocessing
+                    from concurrent.futures import ProcessPoolExecutor
+
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.max_workers, mp_context=multiprocessing.get_context("spawn")
+                    )
+                else:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.max_workers, thread_name_prefix=f"{self.name}-pool"
+                    )
+            return self._executor
+
+    async def run(self, fn, *args, **kwargs):
+        """Run ``fn(*args, **kwargs)`` on the pool and await its result."""
+        with self._lock:
+            if self._in_flight >= self.max_workers + self.max_queue:
+                self._rejected += 1
+                raise PoolSaturated(self.name)
+            self._in_flight += 1
+            self._submitted += 1
+
+        loop = asyncio.get_running_loop()
+        executor = self._get_executor()
+        enqueued = time.perf_counter()
+        try:
+            if self.kind == "process":
+                # Only the round trip can be timed from this side, so queue
+                # wait is not split out for process pools
+                result = await loop.run_in_executor(executor, functools.partial(fn, *args, **kwargs))
+                self._record(0.0, time.perf_counter() - enqueued)
+            else:
+                def call():
+                    started = time.perf_counter()
+                    try:
+                        return fn(*args, **kwargs)
+                    finally:
+                        self._record(started - enqueued, time.perf_counter() - started)
+
+                # Copy the caller's context so request-scoped contextvars are
+                # visible inside the worker thread.
+                ctx = contextvars.copy_context()
+                result = await loop.run_in_executor(executor, ctx.run, call)
+        except BaseException:
+            with self._lock:
+                self._failed += 1
+            raise
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+                self._completed += 1
+        return result
+
+    def _record(self, wait: float, run_time: float):
+        with self._lock:
+            self._queue_wait_total += wait
+            self._queue_wait_max = max(self._queue_wait_max, wait)
+            self._run_time_total += run_time
+
+    def stats(self) -> dict:
+        """Snapshot of the pool's counters."""
+        with self._lock:
+            completed = self._completed
+            return {
+                "kind": self.kind,
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "in_flight": self._in_flight,
+                "queued": max(0, self._in_flight - self.max_workers),
+                "submitted": self._submitted,
+                "completed": completed,
+                "failed": self._failed,
+                "rejected": self._rejected,
+                "avg_queue_wait_ms": (self._queue_wait_total / completed * 1000) if completed else 0.0,
+                "max_queue_wait_ms": self._queue_wait_max * 1000,
+                "avg_run_time_ms": (self._run_time_total / completed * 1000) if completed else 0.0,
+            }
+
+    def shutdown(self, wait: bool = True):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+
+
+# DynamoDB calls spend almost all their time waiting on the network, so the
+# I/O pool can be much wider than the CPU count.
+io_pool = BoundedExecutor(
+    "io",
+    max_workers=int(os.getenv("IO_POOL_WORKERS", "32")),
+    max_queue=int(os.getenv("IO_POOL_QUEUE", "256")),
+)
+
+
+async def run_io(fn, *args, **kwargs):
+    """Run a blocking data-access call on the I/O pool."""
+    return await io_pool.run(fn, *args, **kwargs)
+
+
+def pool_stats() -> dict:
+    """Counters for every pool, keyed by pool name."""
+    return {pool.name: pool.stats() for pool in _pools}
+
+
+def shutdown_pools(wait: bool = True):
+    for pool in _pools:
+        pool.shutdown(wait=wait)
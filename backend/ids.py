@@ -0,0 +1,196 @@
+"""
+Todo ID generation.
+
+``todo_id`` is the Todo table's range key, so IDs that sort by creation
+time make a plain partition query come back in chronological order and
+turn "created since T" into a key-range condition. The scheme is chosen
+with ``TODO_ID_SCHEME``:
+
+- ``ulid`` (default): 26-character Crockford base32 ULID, monotonic
+  within a millisecond
+- ``uuid7``: RFC 9562 UUIDv7 in canonical lowercase form
+- ``uuid4``: random UUIDs, as IDs were generated originally
+"""
+import hashlib
+import os
+import re
+import secrets
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Optional
+
+CROCKFORD_ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+ULID_PATTERN = re.compile(r"^[0-7][0-9A-HJKMNP-TV-Z]{25}$")
+
+
+def _timestamp_ms(at: Optional[datetime]) -> int:
+    if at is None:
+        return time.time_ns() // 1_000_000
+    if at.tzinfo is None:
+        at = at.replace(tzinfo=timezone.utc)
+    return int(at.timestamp() * 1000)
+
+
+def _digest(key: str) -> bytes:
+    return hashlib.sha256(key.encode("utf-8")).digest()
+
+
+def _encode_crockford(value: int, length: int) -> str:
+    chars = []
+    for _ in range(length):
+        value, index = divmod(value, 32)
+        chars.append(CROCKFORD_ALPHABET[index])
+    return "".join(reversed(chars))
+
+
+class IdGenerator:
+    """Base class for todo ID schemes."""
+
+    name = ""
+    time_ordered = False
+
+    def new_id(self, at: Optional[datetime] = None) -> str:
+        """
+        Return a new ID, stamped with ``at`` (default: now) when time-ordered.
+
+        IDs made in the same millisecond sort in the order they were made,
+        whether or not ``at`` is given; an ``at`` earlier than the last ID's
+        keeps its own time.
+        """
+        raise NotImplementedError
+
+    def derived_id(self, at: datetime, key: str) -> str:
+        """A stable ID for ``key``: the same ``at`` and ``key`` always give the same ID."""
+        raise NotImplementedError
+
+    def floor(self, at: datetime) -> str:
+        """Smallest possible ID created at or after ``at``."""
+        raise ValueError(f"'{self.name}' IDs are not time-ordered")
+
+    def owns(self, todo_id: str) -> bool:
+        """Whether ``todo_id`` was produced by this scheme."""
+        raise NotImplementedError
+
+
+class UlidGenerator(IdGenerator):
+    name = "ulid"
+    time_ordered = True
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._last_ms = -1
+        self._last_random = 0
+
+    def new_id(self, at: Optional[datetime] = None) -> str:
+        timestamp = _timestamp_ms(at)
+        with self._lock:
+            if timestamp == self._last_ms or (at is None and timestamp < self._last_ms):
+                # Same millisecond (or clock went backwards): stay monotonic
+                timestamp = self._last_ms
+                random_part = (self._last_random + 1) & ((1 << 80) - 1)
+            else:
+                random_part = secrets.randbits(80)
+            if timestamp >= self._last_ms:
+                self._last_ms, self._last_random = timestamp, random_part
+        return _encode_crockford((timestamp << 80) | random_part, 26)
+
+    def derived_id(self, at, key):
+        random_part = int.from_bytes(_digest(key)[:10], "big")
+        return _encode_crockford((_timestamp_ms(at) << 80) | random_part, 26)
+
+    def floor(self, at: datetime) -> str:
+        return _encode_crockford(_timestamp_ms(at) << 80, 26)
+
+    def owns(self, todo_id: str) -> bool:
+        return bool(ULID_PATTERN.match(todo_id))
+
+
+class Uuid7Generator(IdGenerator):
+    name = "uuid7"
+    time_ordered = True
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._last_ms = -1
+        self._counter = 0
+
+    @staticmethod
+    def _build(timestamp: int, rand_a: int, rand_b: int) -> str:
+        value = (timestamp & ((1 << 48) - 1)) << 80
+        value |= 0x7 << 76
+        value |= (rand_a & 0xFFF) << 64
+        value |= 0b10 << 62
+        value |= rand_b & ((1 << 62) - 1)
+        return str(uuid.UUID(int=value))
+
+    def new_id(self, at: Optional[datetime] = None) -> str:
+        timestamp = _timestamp_ms(at)
+        with self._lock:
+            # rand_a doubles as a per-millisecond counter for monotonicity
+            same_ms = timestamp == self._last_ms or (at is None and timestamp < self._last_ms)
+            if same_ms and self._counter < 0xFFF:
+                timestamp = self._last_ms
+                self._counter += 1
+                rand_a = self._counter
+            else:
+                rand_a = secrets.randbits(11)
+            if timestamp >= self._last_ms:
+                self._last_ms, self._counter = timestamp, rand_a
+        return self._build(timestamp, rand_a, secrets.randbits(62))
+
+    def derived_id(self, at, key):
+        digest = _digest(key)
+        return self._build(_timestamp_ms(at), int.from_bytes(digest[:2], "big"), int.from_bytes(digest[2:10], "big"))
+
+    def floor(self, at: datetime) -> str:
+        return self._build(_timestamp_ms(at), 0, 0)
+
+    def owns(self, todo_id: str) -> bool:
+        try:
+            return uuid.UUID(todo_id).version == 7 and todo_id == todo_id.lower()
+        except ValueError:
+            return False
+
+
+class Uuid4Generator(IdGenerator):
+    name = "uuid4"
+
+    def new_id(self, at: Optional[datetime] = None) -> str:
+        return str(uuid.uuid4())
+
+    def derived_id(self, at, key):
+        return str(uuid.UUID(bytes=_digest(key)[:16], version=4))
+
+    def owns(self, todo_id: str) -> bool:
+        try:
+            return uuid.UUID(todo_id).version == 4
+        except ValueError:
+            return False
+
+
+GENERATORS = {
+    generator.name: generator
+    for generator in (UlidGenerator(), Uuid7Generator(), Uuid4Generator())
+}
+
+id_generator = GENERATORS[os.getenv("TODO_ID_SCHEME", "ulid").lower()]
+
+
+def new_todo_id(at: Optional[datetime] = None) -> str:
+    """Generate a todo ID with the configured scheme."""
+    return id_generator.new_id(at)
+
+
+def derived_todo_id(at: datetime, key: str) -> str:
+    """A todo ID that is the same every time for ``key``, e.g. a row of an import being retried."""
+    return id_generator.derived_id(at, key)
+
+
+def is_time_ordered(todo_id: str) -> bool:
+    """Whether ``todo_id`` sorts by creation time (i.e. is not a legacy UUID4)."""
+    return any(
+        generator.time_ordered and generator.owns(todo_id)
+        for generator in GENERATORS.values()
+    )
@@ -1,14 +1,33 @@
-from fastapi import FastAPI, Depends, HTTPException, Header
+from contextlib import AsyncExitStack, asynccontextmanager
+from fastapi import BackgroundTasks, FastAPI, Depends, HTTPException, Header, Query, Request, Response
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from fastapi.security import OAuth2PasswordRequestForm
 from fastapi.middleware.cors import CORSMiddleware
-from jose import jwt, JWTError
-import bcrypt
-from datetime import datetime, timedelta
-from typing import Annotated, Optional
-from pydantic import BaseModel
+from datetime import datetime, timedelta, timezone
+from typing import Annotated, List, Literal, Optional
+from pydantic import BaseModel, Field
 from models import User, Todo
+from executor import run_io, pool_stats, shutdown_pools
+from passwords import hash_password_async, needs_rehash, verify_password_async
+from pagination import InvalidCursor, decode_cursor, encode_cursor
+from ids import new_todo_id
+from batch import run_batch
+from changes import TOMBSTONE_TTL, SyncTokenExpired, load_changes, sync_token
+from search import search_index
+from stats import load_stats, reconcile, reconcile_all
+from transfer import FORMATS, IMPORT_ID_PATTERN, ImportJob, export_chunks, iter_lines, iter_records
+from events import TODO_EVENTS_HEARTBEAT_SECONDS, HEARTBEAT, TooManyStreams, event_bus, frame, todo_event
+from cache import MISSING, todo_cache
+from conditional import etag_matches, http_date, list_etag, parse_timestamp, parse_todo_etag, todo_etag
+from storage import ConditionFailed, storage
+from serialization import FastJSONResponse, TodoOut, dumps, encode_todos
+from metrics import MetricsMiddleware, gauge_lines, render_metrics, timed
+from ratelimit import account_key, client_ip, login_key, rate_limiter
+from profiler import PROFILER_MAX_SECONDS, ProfilerBusy, ProfilerMiddleware, install_signal_handler, profile_response, start_profiler
+from tokens import ADMIN_TOKEN, ACCESS_TOKEN_EXPIRE_MINUTES, SECRET_KEY, InvalidToken, create_access_token, is_admin_token, verify_token
+import asyncio
+import hashlib
 import os
-import uuid
 
 
 class UserCreate(BaseModel):
@@ -27,11 +46,42 @@ class TodoUpdate(BaseModel):
     description: Optional[str] = None
     completed: Optional[bool] = None
 
-SECRET_KEY = os.getenv("MY_AWS_SECRET_ACCESS_KEY")
-ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 30
+class TodoBatchOperation(BaseModel):
+    """A single operation within a batch request."""
+    op: Literal["create", "update", "complete", "delete"]
+    id: Optional[str] = None
+    title: Optional[str] = None
+    description: Optional[str] = None
+    completed: Optional[bool] = None
+
+# Batch configuration
+MAX_BATCH_OPERATIONS = 500
+
+class TodoBatchRequest(BaseModel):
+    """Batch request model."""
+    operations: List[TodoBatchOperation] = Field(..., min_length=1, max_length=MAX_BATCH_OPERATIONS)
+
+# Pagination configuration
+MAX_PAGE_SIZE = 1000
+STREAM_PAGE_SIZE = int(os.getenv("STREAM_PAGE_SIZE", "200"))
+# Longer lists are served but not cached
+CACHE_MAX_LIST_SIZE = int(os.getenv("CACHE_MAX_LIST_SIZE", "1000"))
+# "eager" pre-opens storage connections at startup; "lazy" leaves that to the
+# first request, for serverless deployments where cold-start time matters
+STARTUP_MODE = os.getenv("STARTUP_MODE", "eager").lower()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    install_signal_handler()
+    if STARTUP_MODE != "lazy":
+        await storage.warm_up(run_io)
+    await event_bus.start()
+    yield
+    event_bus.stop()
+    shutdown_pools(wait=False)
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan, default_response_class=FastJSONResponse)
 
 # Get allowed origins from environment or use defaults
 allowed_origins = os.getenv("ALLOWED_ORIGINS", "").split(",") if os.getenv("ALLOWED_ORIGINS") else []
@@ -46,58 +96,166 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Total-Count", "ETag", "Last-Modified", "Server-Timing"],
 )
-
-# Bcrypt configuration
-BCRYPT_ROUNDS = 12
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(ProfilerMiddleware)
 
 def get_user_by_username(username: str):
+    return storage.get_user(username)
+
+async def rehash_password(user: User, password: str):
+    """Upgrade a user's stored hash to the configured scheme and cost."""
     try:
-        user = User.get(username)
-        return user
-    except User.DoesNotExist:
-            return None
-
-def hash_password(password: str) -> str:
-    """Hash a password using bcrypt, handling the 72-byte limit."""
-    # Bcrypt has a 72-byte limit, so we need to truncate if necessary
-    password_bytes = password.encode('utf-8')
-    if len(password_bytes) > 72:
-        password_bytes = password_bytes[:72]
-    
-    # Generate salt and hash
-    salt = bcrypt.gensalt(rounds=BCRYPT_ROUNDS)
-    hashed = bcrypt.hashpw(password_bytes, salt)
-    # Return as string for storage
-    return hashed.decode('utf-8')
-
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    """Verify a password against a hash."""
-    # Bcrypt has a 72-byte limit, so we need to truncate if necessary
-    password_bytes = plain_password.encode('utf-8')
-    if len(password_bytes) > 72:
-        password_bytes = password_bytes[:72]
-    
-    # Verify password
-    hashed_bytes = hashed_password.encode('utf-8')
-    return bcrypt.checkpw(password_bytes, hashed_bytes)
+        new_hash = await hash_password_async(password)
+        # Skip if the password changed since this login read the user
+        await run_io(storage.update_password, user, new_hash)
+    except Exception as e:
+        print(f"Error rehashing password for {user.username}: {e}")
 
-def create_user(username: str, password: str):
-    hashed_password = hash_password(password)
+async def create_user(username: str, password: str):
+    hashed_password = await hash_password_async(password)
     user = User(username=username, hashed_password=hashed_password)
-    user.save()
+    await run_io(storage.put_user, user)
     return user
 
-def create_access_token(data: dict, expires_delta: timedelta = None):
-    """Create a JWT access token."""
-    to_encode = data.copy()
-    if expires_delta:
-        expire = datetime.utcnow() + expires_delta
-    else:
-        expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
-    return encoded_jwt
+# API field name -> Todo attribute name
+TODO_FIELDS = {
+    "id": "todo_id",
+    "title": "title",
+    "description": "description",
+    "completed": "completed",
+    "created_at": "created_at",
+    "updated_at": "updated_at",
+}
+
+def parse_fields(fields: Optional[str]) -> Optional[list]:
+    """Parse the comma-separated ``fields`` query parameter."""
+    if not fields:
+        return None
+    names = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = [name for name in names if name not in TODO_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    return names
+
+def plan_todo_query(user_id: str, completed: Optional[bool], sort: Optional[str], order: str,
+                    fields: Optional[list], since: Optional[datetime] = None):
+    """
+    Turn list parameters into storage query arguments.
+
+    Returns ``(query, cursor_scope)``; ``query`` is passed on to
+    ``storage.query_todos``.
+    """
+    query = {
+        "completed": completed,
+        "sort": sort,
+        "order": order,
+        "since": since,
+        "fields": [TODO_FIELDS[name] for name in fields] if fields else None,
+    }
+    return query, storage.cursor_scope(user_id, completed, sort)
+
+async def stream_todos(user_id: str, query: dict, fmt: str,
+                       start_key: Optional[dict] = None, fields: Optional[list] = None):
+    """Yield query results page by page as NDJSON lines or a JSON array."""
+    last_key = start_key
+    first = True
+    if fmt == "json":
+        yield b"["
+    while True:
+        todos, last_key = await run_io(
+            storage.query_todos, user_id, limit=STREAM_PAGE_SIZE, start_key=last_key, **query
+        )
+        for todo in todos:
+            data = dumps(TodoOut.from_model(todo).to_dict(fields) if fields else TodoOut.from_model(todo))
+            if fmt == "ndjson":
+                yield data + b"\n"
+            else:
+                yield data if first else b"," + data
+            first = False
+        if last_key is None:
+            break
+    if fmt == "json":
+        yield b"]"
+
+def get_user_todo(user_id: str, todo_id: str) -> Todo:
+    """Fetch a todo; raises ``Todo.DoesNotExist`` if the user has none with that id."""
+    todo = storage.get_todo(user_id, todo_id)
+    if todo.deleted:
+        raise Todo.DoesNotExist()
+    return todo
+
+def list_version(user_id: str) -> str:
+    """
+    What list ETags and cached pages are keyed on, the same on every worker.
+
+    With a shared cache tier that is its version stamp, which every write
+    bumps. Without one, the stamp lives in each worker's memory, so the
+    user's latest write time (tombstones included) is read from storage
+    instead. On DynamoDB that read goes to an index, which can lag a write
+    just made; this worker's own last write time covers that, so its
+    writes are always visible to its next read.
+    """
+    if todo_cache.shared is not None:
+        return todo_cache.version(user_id)
+    last_change = storage.last_change(user_id)
+    written = todo_cache.last_write(user_id)
+    if written is not None and (last_change is None or written > last_change):
+        last_change = written
+    return last_change.isoformat() if last_change else "0"
+
+def load_todo_list(user_id: str, version: str, cache_key: str, query: dict, limit: Optional[int],
+                   start_key: Optional[dict], fields: Optional[list], scope: str) -> dict:
+    """
+    Read one page of a list query through the cache.
+
+    Returns ``{"body": ..., "count": ..., "next_cursor": ..., "last_modified": ...}``
+    where ``body`` is the already-encoded JSON array, so cache hits skip
+    serialization entirely. ``version`` must be read before calling, so a
+    concurrent write can't leave stale data cached under the new version.
+    """
+    page = todo_cache.get(user_id, version, cache_key)
+    if page is not MISSING:
+        return page
+
+    with timed("storage"):
+        if limit is None and start_key is None:
+            todos, last_key = storage.query_todos(user_id, **query)
+        else:
+            todos, last_key = storage.query_todos(
+                user_id, limit=limit or MAX_PAGE_SIZE, start_key=start_key, **query
+            )
+    next_cursor = encode_cursor(last_key, scope, SECRET_KEY)
+    last_modified = max((todo.updated_at for todo in todos if todo.updated_at), default=None)
+    with timed("serialize"):
+        body = encode_todos(todos, fields).decode("utf-8")
+    page = {
+        "body": body,
+        "count": len(todos),
+        "next_cursor": next_cursor,
+        "last_modified": last_modified.isoformat() if last_modified else None,
+    }
+    if page["count"] <= CACHE_MAX_LIST_SIZE:
+        todo_cache.set(user_id, version, cache_key, page)
+    return page
+
+def load_todo(user_id: str, todo_id: str) -> dict:
+    """
+    Read a single serialized todo through the cache.
+
+    Only with a shared tier: without one, the version stamp doesn't move on
+    other workers' writes, and a stale item would carry a stale ETag.
+    """
+    if todo_cache.shared is None:
+        return TodoOut.from_model(get_user_todo(user_id, todo_id)).to_dict()
+    version = todo_cache.version(user_id)
+    cache_key = f"item:{todo_id}"
+    data = todo_cache.get(user_id, version, cache_key)
+    if data is MISSING:
+        data = TodoOut.from_model(get_user_todo(user_id, todo_id)).to_dict()
+        todo_cache.set(user_id, version, cache_key, data)
+    return data
 
 def get_current_user(authorization: Optional[str] = Header(None)):
     """Get current user from JWT token."""
@@ -125,15 +283,9 @@ def get_current_user(authorization: Optional[str] = Header(None)):
         )
     
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise HTTPException(
-                status_code=401,
-                detail="Invalid token",
-                headers={"WWW-Authenticate": "Bearer"},
-            )
-    except JWTError:
+        with timed("auth"):
+            username = verify_token(token)
+    except InvalidToken:
         raise HTTPException(
             status_code=401,
             detail="Invalid token",
@@ -142,35 +294,138 @@ def get_current_user(authorization: Optional[str] = Header(None)):
     
     return username
 
-@app.post("/register")
+def get_stream_user(authorization: Optional[str] = Header(None), access_token: Optional[str] = None):
+    """get_current_user that also takes the token as ``access_token``, since EventSource can't set headers."""
+    if not authorization and access_token:
+        authorization = f"Bearer {access_token}"
+    return get_current_user(authorization)
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """Allow only callers presenting ADMIN_TOKEN; admin endpoints 404 when it isn't configured."""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not is_admin_token(x_admin_token):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+def rate_limited(route: str, user_dependency=get_current_user, concurrent: bool = True):
+    """
+    Dependency: the current user, once ``route``'s cost is charged to their rate limit.
+
+    Holds one of the user's in-flight slots until the response is done,
+    unless ``concurrent`` is off.
+    """
+    async def dependency(current_user: str = Depends(user_dependency)):
+        async with rate_limiter.admit("user", current_user, route, run_io, concurrent):
+            yield current_user
+    return dependency
+
+def ip_rate_limited(route: str):
+    """Dependency charging ``route`` to the client IP's rate limit, for routes called before login."""
+    async def dependency(request: Request):
+        async with rate_limiter.admit("ip", client_ip(request.headers, request.client), route, run_io):
+            yield
+    return dependency
+
+def login_rate_limited(route: str):
+    """
+    Dependency charging a login attempt to the client IP, to the IP and username, and to the username.
+
+    See ratelimit.py for why the username is limited both with and
+    without the IP. The form is already parsed and cached on the request.
+    """
+    async def dependency(request: Request):
+        ip = client_ip(request.headers, request.client)
+        username = (await request.form()).get("username")
+        async with AsyncExitStack() as stack:
+            await stack.enter_async_context(rate_limiter.admit("ip", ip, route, run_io))
+            if account_key(username) is not None:
+                await stack.enter_async_context(rate_limiter.admit("login", login_key(ip, username), route, run_io))
+                await stack.enter_async_context(rate_limiter.admit("account", account_key(username), route, run_io))
+            yield
+    return dependency
+
+@app.post("/register", dependencies=[Depends(ip_rate_limited("register"))])
 async def register_user(user: UserCreate):
     try:
-        existing = get_user_by_username(user.username)
+        existing = await run_io(get_user_by_username, user.username)
         if existing:
             raise HTTPException(status_code=400, detail="Username already registered")
 
-        new_user = create_user(username=user.username, password=user.password)
+        new_user = await create_user(username=user.username, password=user.password)
         return {"message": "User created successfully", "username": new_user.username}
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error registering user: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to create user: {str(e)}")
 
 @app.get("/health")
-def health_check():
-    """Health check endpoint."""
+async def health_check():
+    """Health check endpoint. Touches no storage or worker pool, so it stays cheap on a cold start."""
     return {"status": "ok", "message": "Backend is running"}
 
-@app.post("/token")
-async def login(form_data: Annotated[OAuth2PasswordRequestForm, Depends()]):
+@app.get("/health/cache")
+def cache_stats():
+    """Todo cache counters (hits, misses, evictions, invalidations)."""
+    return todo_cache.stats()
+
+@app.get("/health/executors")
+def executor_stats():
+    """Worker pool counters (in-flight, queued, rejected, wait times)."""
+    return pool_stats()
+
+@app.get("/health/events")
+def event_stats():
+    """Event stream counters (open streams, coalesced and overflowed events)."""
+    return event_bus.stats()
+
+@app.get("/health/search")
+def search_stats():
+    """Search index counters (users and todos indexed, builds, catch-ups)."""
+    return search_index.stats()
+
+@app.get("/health/ratelimit")
+def rate_limit_stats():
+    """Rate limiter settings and counters (admitted, limited and over-concurrency requests by route)."""
+    return rate_limiter.stats()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics():
+    """Request, DynamoDB, worker pool and cache metrics in the Prometheus text format."""
+    pools = pool_stats()
+    cache = todo_cache.stats()
+    events = event_bus.stats()
+    limits = rate_limiter.stats()
+    extra = (
+        gauge_lines("worker_pool_in_flight", "Calls running or queued on a worker pool.", ("pool",),
+                    {(name,): stats["in_flight"] for name, stats in pools.items()})
+        + gauge_lines("worker_pool_rejected", "Calls rejected by a saturated worker pool.", ("pool",),
+                      {(name,): stats["rejected"] for name, stats in pools.items()})
+        + gauge_lines("todo_cache_hits", "Todo cache hits.", (), {(): cache.get("hits", 0)})
+        + gauge_lines("todo_cache_misses", "Todo cache misses.", (), {(): cache.get("misses", 0)})
+        + gauge_lines("todo_event_streams", "Open todo event streams.", (), {(): events["streams"]})
+        + gauge_lines("todo_events", "Todo events by outcome (queued, coalesced, overflowed, relayed).", ("outcome",),
+                      {(name,): events[name] for name in ("queued", "coalesced", "overflowed", "relayed")})
+        + gauge_lines("rate_limited_requests", "Requests rejected by the rate limiter, by route and reason.",
+                      ("route", "reason"),
+                      {**{(route, "rate"): count for route, count in limits["limited"].items()},
+                       **{(route, "concurrency"): count for route, count in limits["over_concurrency"].items()}})
+    )
+    return PlainTextResponse(render_metrics(extra), media_type="text/plain; version=0.0.4")
+
+@app.post("/token", dependencies=[Depends(login_rate_limited("token"))])
+async def login(form_data: Annotated[OAuth2PasswordRequestForm, Depends()], background_tasks: BackgroundTasks):
     """Authenticate user and return access token."""
     try:
-        user = get_user_by_username(form_data.username)
-        if not user or not verify_password(form_data.password, user.hashed_password):
+        user = await run_io(get_user_by_username, form_data.username)
+        if not user or not await verify_password_async(form_data.password, user.hashed_password):
             raise HTTPException(
                 status_code=401,
                 detail="Incorrect username or password",
                 headers={"WWW-Authenticate": "Bearer"},
             )
+        if needs_rehash(user.hashed_password):
+            background_tasks.add_task(rehash_password, user, form_data.password)
         
         access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
         access_token = create_access_token(
@@ -183,33 +438,128 @@ async def login(form_data: Annotated[OAuth2PasswordRequestForm, Depends()]):
         print(f"Error during login: {e}")
         raise HTTPException(status_code=500, detail=f"Login failed: {str(e)}")
 
+@app.post("/admin/profile", response_class=PlainTextResponse, dependencies=[Depends(require_admin)])
+async def profile_process(
+    seconds: float = Query(10, gt=0, le=PROFILER_MAX_SECONDS),
+    interval_ms: float = Query(5, ge=0.5, le=1000),
+    idle: bool = False,
+):
+    """
+    Sample every thread's stack for ``seconds`` and return collapsed stacks
+    (flamegraph.pl / speedscope input). ``idle`` keeps threads that are only
+    waiting. Returns 409 while another profile is running.
+    """
+    try:
+        profiler = start_profiler(interval_ms / 1000, include_idle=idle)
+    except ProfilerBusy:
+        raise HTTPException(status_code=409, detail="A profile is already running")
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        stacks = profiler.stop()
+    return profile_response(profiler, stacks)
+
+@app.post("/admin/search/rebuild", dependencies=[Depends(require_admin)])
+async def rebuild_search_index(user_id: Optional[str] = None):
+    """Rebuild one user's search index, or every user's from a table scan."""
+    try:
+        if user_id:
+            await run_io(search_index.rebuild, user_id)
+            return {"users": 1}
+        return await run_io(search_index.rebuild_all)
+    except Exception as e:
+        print(f"Error rebuilding search index: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to rebuild search index: {str(e)}")
+
+@app.post("/admin/stats/reconcile", dependencies=[Depends(require_admin)])
+async def reconcile_stats(user_id: Optional[str] = None):
+    """Rebuild one user's todo counters, or every user's, from their todos."""
+    try:
+        if user_id:
+            return {"users": 1, "stats": await run_io(reconcile, user_id)}
+        return await run_io(reconcile_all)
+    except Exception as e:
+        print(f"Error reconciling stats: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to reconcile stats: {str(e)}")
+
 # Todo endpoints
-@app.get("/todos")
-async def get_todos(current_user: str = Depends(get_current_user)):
-    """Get all todos for the current user."""
+@app.get("/todos", response_model=List[TodoOut])
+async def get_todos(
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    stream: Optional[Literal["ndjson", "json"]] = None,
+    completed: Optional[bool] = None,
+    sort: Optional[Literal["created_at", "updated_at"]] = None,
+    order: Literal["asc", "desc"] = "asc",
+    fields: Optional[str] = None,
+    since: Optional[datetime] = None,
+    if_none_match: Optional[str] = Header(None),
+    current_user: str = Depends(rate_limited("list")),
+):
+    """
+    Get todos for the current user.
+
+    With ``limit``, returns one page and sets ``X-Next-Cursor`` when more
+    items remain; pass it back as ``cursor`` to fetch the next page. With
+    ``stream``, the whole list (from ``cursor`` onwards) is streamed page by
+    page as NDJSON or a JSON array instead of being built in memory.
+
+    ``completed`` filters by status, ``sort``/``order`` order by a timestamp
+    and ``fields`` (comma-separated) limits the attributes returned; all
+    three are answered by the storage backend's indexes. ``since`` returns
+    only todos created at or after that time.
+
+    Responses carry a weak ``ETag`` derived from the user's list version
+    (see list_version), so a matching ``If-None-Match`` gets a 304 without
+    reading the list.
+    """
+    field_names = parse_fields(fields)
+    query, scope = plan_todo_query(
+        current_user, completed, sort, order, field_names, since
+    )
     try:
-        todos = Todo.query(current_user)
-        return [
-            {
-                "id": todo.todo_id,
-                "title": todo.title,
-                "description": todo.description,
-                "completed": todo.completed,
-                "created_at": todo.created_at.isoformat() if todo.created_at else None,
-                "updated_at": todo.updated_at.isoformat() if todo.updated_at else None,
-            }
-            for todo in todos
-        ]
+        start_key = decode_cursor(cursor, scope, SECRET_KEY) if cursor else None
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if stream:
+        media_type = "application/x-ndjson" if stream == "ndjson" else "application/json"
+        return StreamingResponse(
+            stream_todos(current_user, query, stream, start_key, field_names),
+            media_type=media_type,
+        )
+
+    cache_key = "list:" + hashlib.sha1(
+        repr((limit, cursor, completed, sort, order, field_names, since)).encode("utf-8")
+    ).hexdigest()
+    try:
+        version = await run_io(list_version, current_user)
+        etag = list_etag(current_user, version, cache_key)
+        if etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers={"ETag": etag})
+
+        page = await run_io(
+            load_todo_list, current_user, version, cache_key, query, limit,
+            start_key, field_names, scope,
+        )
+        headers = {"ETag": etag}
+        if page["last_modified"]:
+            headers["Last-Modified"] = http_date(parse_timestamp(page["last_modified"]))
+        if page["next_cursor"]:
+            headers["X-Next-Cursor"] = page["next_cursor"]
+        return Response(content=page["body"], media_type="application/json", headers=headers)
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error fetching todos: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to fetch todos: {str(e)}")
 
-@app.post("/todos")
-async def create_todo(todo: TodoCreate, current_user: str = Depends(get_current_user)):
+@app.post("/todos", response_model=TodoOut)
+async def create_todo(todo: TodoCreate, current_user: str = Depends(rate_limited("create"))):
     """Create a new todo."""
     try:
-        todo_id = str(uuid.uuid4())
-        now = datetime.utcnow()
+        now = datetime.now(timezone.utc)
+        todo_id = new_todo_id(now)
         new_todo = Todo(
             user_id=current_user,
             todo_id=todo_id,
@@ -219,77 +569,308 @@ async def create_todo(todo: TodoCreate, current_user: str = Depends(get_current_
             created_at=now,
             updated_at=now,
         )
-        new_todo.save()
-        return {
-            "id": new_todo.todo_id,
-            "title": new_todo.title,
-            "description": new_todo.description,
-            "completed": new_todo.completed,
-            "created_at": new_todo.created_at.isoformat() if new_todo.created_at else None,
-            "updated_at": new_todo.updated_at.isoformat() if new_todo.updated_at else None,
-        }
+        # Counted in the user's stats in the same transaction
+        await run_io(storage.create_todo, new_todo)
+        await run_io(todo_cache.invalidate, current_user, new_todo.updated_at)
+        search_index.apply(current_user, [new_todo])
+        await event_bus.publish(current_user, [todo_event("created", new_todo)], run_io)
+        return FastJSONResponse(TodoOut.from_model(new_todo))
+    except ConditionFailed:
+        raise HTTPException(status_code=409, detail="Todo id already taken, please retry")
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error creating todo: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to create todo: {str(e)}")
 
-@app.get("/todos/{todo_id}")
-async def get_todo(todo_id: str, current_user: str = Depends(get_current_user)):
-    """Get a specific todo by ID."""
+@app.post("/todos:batch")
+async def batch_todos(batch: TodoBatchRequest, current_user: str = Depends(rate_limited("batch"))):
+    """
+    Apply up to MAX_BATCH_OPERATIONS create/update/complete/delete operations.
+
+    Writes go out in chunks (TransactWriteItems calls of 25 on DynamoDB), so
+    the whole batch costs a handful of round trips. Each operation gets its
+    own status, 409 if its todo changed after the batch read it; the
+    request itself succeeds even if some operations fail.
+    """
+    try:
+        results = await run_io(run_batch, current_user, [operation.model_dump() for operation in batch.operations])
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error running todo batch: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to run batch: {str(e)}")
+    finally:
+        await run_io(todo_cache.invalidate, current_user)
+
+    events, written = [], []
+    for result in results:
+        item = result.pop("item")
+        if result["status"] >= 300:
+            continue
+        written.append(item)
+        if result["op"] == "delete":
+            events.append({"type": "deleted", "id": result["id"]})
+        else:
+            result["todo"] = TodoOut.from_model(item)
+            events.append({"type": "created" if result["op"] == "create" else "updated", "id": result["id"],
+                           "todo": result["todo"].to_dict()})
+    search_index.apply(current_user, written)
+    await event_bus.publish(current_user, events, run_io)
+    succeeded = sum(1 for result in results if result["status"] < 300)
+    return FastJSONResponse({"succeeded": succeeded, "failed": len(results) - succeeded, "results": results})
+
+@app.get("/todos/changes")
+async def get_todo_changes(
+    since: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    current_user: str = Depends(rate_limited("changes")),
+):
+    """
+    Todos created, updated or deleted since a sync token.
+
+    Without ``since``, returns everything (a full sync). Pass ``next_since``
+    from the response back as ``since``; while ``has_more`` is true, keep
+    going straight away, otherwise poll with it later. Changed todos are in
+    ``changes`` and deleted ones in ``deleted`` (ids). A token older than
+    the tombstone TTL gets 410, and the client must resync without one.
+    """
+    try:
+        return FastJSONResponse(await run_io(load_changes, current_user, since, limit))
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except SyncTokenExpired:
+        raise HTTPException(status_code=410, detail="Sync token expired, resync without since")
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error fetching todo changes: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to fetch changes: {str(e)}")
+
+@app.get("/todos/export")
+async def export_todos(
+    format: Literal[FORMATS] = "ndjson",
+    current_user: str = Depends(rate_limited("export")),
+):
+    """Download all of the current user's todos as NDJSON or CSV, streamed page by page."""
+    chunks = export_chunks(current_user, format)
+
+    async def stream():
+        while True:
+            chunk = await run_io(next, chunks, None)
+            if chunk is None:
+                break
+            yield chunk
+
+    filename = f"todos-{datetime.utcnow().strftime('%Y%m%d-%H%M%S')}.{format}"
+    return StreamingResponse(
+        stream(),
+        media_type="text/csv" if format == "csv" else "application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+@app.post("/todos/import")
+async def import_todos(
+    request: Request,
+    format: Optional[Literal[FORMATS]] = None,
+    import_id: Optional[str] = Query(None, pattern=IMPORT_ID_PATTERN.pattern),
+    skip: int = Query(0, ge=0),
+    current_user: str = Depends(rate_limited("import")),
+):
+    """
+    Create or overwrite todos from an NDJSON or CSV upload (the request body).
+
+    Rows are skipped (and reported) rather than replacing a todo changed or
+    deleted after the row's ``updated_at``; imported todos get the time of
+    the import as their ``updated_at``.
+
+    The body is parsed as it arrives and written in batches, so uploads of
+    any size use flat memory. ``format`` defaults from the Content-Type.
+    The response has per-row errors, the ``import_id`` and a
+    ``checkpoint``: to resume an interrupted import, send the same file
+    with ``skip`` set to the checkpoint and the same ``import_id``, which
+    keeps the ids of rows without one stable.
+    """
+    if format is None:
+        format = "csv" if "csv" in request.headers.get("content-type", "") else "ndjson"
+
+    def on_written(todos):
+        search_index.apply(current_user, todos)
+
+    job = ImportJob(current_user, run_io, import_id=import_id, skip=skip, on_written=on_written)
+    try:
+        summary = await job.run_records(iter_records(iter_lines(request.stream()), format))
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail={"error": "Upload must be UTF-8", **job.summary()})
+    except Exception as e:
+        print(f"Error importing todos: {e}")
+        raise HTTPException(status_code=500, detail={"error": f"Import failed: {str(e)}", **job.summary()})
+    finally:
+        await run_io(todo_cache.invalidate, current_user)
+    if summary["imported"]:
+        # Too many to send one by one; open streams catch up through the changes feed
+        await event_bus.publish(current_user, [{"type": "resync", "id": None}], run_io)
+    return summary
+
+@app.get("/todos/stats")
+async def get_todo_stats(current_user: str = Depends(rate_limited("stats"))):
+    """
+    The current user's total, completed and pending counts.
+
+    Read from one counter item kept up to date by every write, so the cost
+    doesn't grow with the number of todos. ``updated_at`` is when the
+    counts last changed.
+    """
+    try:
+        return FastJSONResponse(await run_io(load_stats, current_user))
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error fetching todo stats: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to fetch stats: {str(e)}")
+
+@app.get("/todos/search", response_model=List[TodoOut])
+async def search_todos(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=100),
+    current_user: str = Depends(rate_limited("search")),
+):
+    """
+    Todos whose title or description contain every word in ``q``, best match first.
+
+    Words also match as prefixes ("gro" finds "groceries"). Returns up to
+    ``limit`` todos; ``X-Total-Count`` has the number of matches.
+    """
+    try:
+        with timed("search"):
+            todo_ids = await run_io(search_index.search, current_user, q)
+        todos = {todo.todo_id: todo for todo in await run_io(storage.batch_get_todos, current_user, todo_ids[:limit])}
+        results = [
+            TodoOut.from_model(todos[todo_id])
+            for todo_id in todo_ids[:limit]
+            if todo_id in todos and not todos[todo_id].deleted
+        ]
+        return FastJSONResponse(results, headers={"X-Total-Count": str(len(todo_ids))})
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error searching todos: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to search todos: {str(e)}")
+
+@app.get("/todos/events")
+async def todo_events(current_user: str = Depends(rate_limited("events", get_stream_user, concurrent=False))):
+    """
+    Server-Sent Events stream of the current user's todo changes.
+
+    Starts with a ``ready`` event carrying a changes-feed token (``since``),
+    then sends ``created``/``updated`` events with the todo and ``deleted``
+    events with its id. ``resync`` means events were dropped because the
+    client fell behind: fetch ``/todos/changes?since=<token>`` to catch up.
+    Accepts the token as ``access_token`` for EventSource clients.
+    """
     try:
-        todo = Todo.get(current_user, todo_id)
-        return {
-            "id": todo.todo_id,
-            "title": todo.title,
-            "description": todo.description,
-            "completed": todo.completed,
-            "created_at": todo.created_at.isoformat() if todo.created_at else None,
-            "updated_at": todo.updated_at.isoformat() if todo.updated_at else None,
-        }
+        stream = event_bus.subscribe(current_user)
+    except TooManyStreams:
+        raise HTTPException(status_code=429, detail="Too many open event streams")
+    ready = frame("ready", {"type": "ready", "since": sync_token(current_user, datetime.now(timezone.utc))})
+
+    async def events():
+        try:
+            yield b"retry: 5000\n" + ready
+            while True:
+                chunk = await stream.next_chunk(TODO_EVENTS_HEARTBEAT_SECONDS)
+                yield HEARTBEAT if chunk is None else chunk
+        finally:
+            event_bus.unsubscribe(stream)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/todos/{todo_id}", response_model=TodoOut)
+async def get_todo(
+    todo_id: str,
+    if_none_match: Optional[str] = Header(None),
+    current_user: str = Depends(rate_limited("get")),
+):
+    """Get a specific todo by ID. Answers a matching ``If-None-Match`` with 304."""
+    try:
+        data = await run_io(load_todo, current_user, todo_id)
+        updated_at = parse_timestamp(data["updated_at"])
+        headers = {}
+        if updated_at:
+            headers = {"ETag": todo_etag(updated_at), "Last-Modified": http_date(updated_at)}
+            if etag_matches(if_none_match, headers["ETag"]):
+                return Response(status_code=304, headers=headers)
+        return FastJSONResponse(data, headers=headers)
     except Todo.DoesNotExist:
         raise HTTPException(status_code=404, detail="Todo not found")
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error fetching todo: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to fetch todo: {str(e)}")
 
-@app.put("/todos/{todo_id}")
-async def update_todo(todo_id: str, todo_update: TodoUpdate, current_user: str = Depends(get_current_user)):
-    """Update a specific todo by ID."""
+@app.put("/todos/{todo_id}", response_model=TodoOut)
+async def update_todo(
+    todo_id: str,
+    todo_update: TodoUpdate,
+    if_match: Optional[str] = Header(None),
+    current_user: str = Depends(rate_limited("update")),
+):
+    """
+    Update a specific todo by ID.
+
+    With ``If-Match``, the write is conditional on the todo's ``updated_at``
+    still matching the ETag, and a lost race returns 412.
+    """
+    expected_updated_at = None
+    if if_match and if_match.strip() != "*":
+        expected_updated_at = parse_todo_etag(if_match.split(",")[0])
+        if expected_updated_at is None:
+            raise HTTPException(status_code=412, detail="Precondition failed")
+
     try:
-        todo = Todo.get(current_user, todo_id)
-        
-        if todo_update.title is not None:
-            todo.title = todo_update.title
-        if todo_update.description is not None:
-            todo.description = todo_update.description
-        if todo_update.completed is not None:
-            todo.completed = todo_update.completed
-        
-        todo.updated_at = datetime.utcnow()
-        todo.save()
+        # One conditional write that returns the updated todo; no read first
+        changes = todo_update.model_dump(exclude_none=True)
+        todo = await run_io(
+            storage.update_todo, current_user, todo_id, changes, datetime.now(timezone.utc), expected_updated_at
+        )
+        await run_io(todo_cache.invalidate, current_user, todo.updated_at)
+        search_index.apply(current_user, [todo])
+        await event_bus.publish(current_user, [todo_event("updated", todo)], run_io)
         
-        return {
-            "id": todo.todo_id,
-            "title": todo.title,
-            "description": todo.description,
-            "completed": todo.completed,
-            "created_at": todo.created_at.isoformat() if todo.created_at else None,
-            "updated_at": todo.updated_at.isoformat() if todo.updated_at else None,
-        }
+        return FastJSONResponse(TodoOut.from_model(todo), headers={"ETag": todo_etag(todo.updated_at)})
     except Todo.DoesNotExist:
         raise HTTPException(status_code=404, detail="Todo not found")
+    except HTTPException:
+        raise
+    except ConditionFailed:
+        if expected_updated_at is None:
+            # Completion kept flipping under a concurrent writer
+            raise HTTPException(status_code=409, detail="Todo changed concurrently, please retry")
+        raise HTTPException(status_code=412, detail="Precondition failed")
     except Exception as e:
         print(f"Error updating todo: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to update todo: {str(e)}")
 
 @app.delete("/todos/{todo_id}")
-async def delete_todo(todo_id: str, current_user: str = Depends(get_current_user)):
-    """Delete a specific todo by ID."""
+async def delete_todo(todo_id: str, current_user: str = Depends(rate_limited("delete"))):
+    """Delete a specific todo by ID, leaving a tombstone for the changes feed."""
     try:
-        todo = Todo.get(current_user, todo_id)
-        todo.delete()
+        todo = await run_io(storage.tombstone_todo, current_user, todo_id, datetime.now(timezone.utc), TOMBSTONE_TTL)
+        await run_io(todo_cache.invalidate, current_user, todo.updated_at)
+        search_index.apply(current_user, [todo])
+        await event_bus.publish(current_user, [todo_event("deleted", todo)], run_io)
         return {"message": "Todo deleted successfully"}
     except Todo.DoesNotExist:
         raise HTTPException(status_code=404, detail="Todo not found")
+    except ConditionFailed:
+        raise HTTPException(status_code=409, detail="Todo changed concurrently, please retry")
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error deleting todo: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to delete todo: {str(e)}")
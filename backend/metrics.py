@@ -0,0 +1,281 @@
+"""
+Request metrics, DynamoDB call accounting and the Prometheus exposition.
+
+``MetricsMiddleware`` times every request per route template and keeps a
+``RequestMetrics`` object in a context variable for the duration of the
+request. The executor copies the context into its worker threads, so the
+botocore hooks installed by ``instrument_dynamodb`` can charge each
+DynamoDB call (latency, consumed capacity, retries, errors) to the
+request that made it. ``timed()`` records named phases such as token
+verification or serialization the same way.
+
+With ``METRICS_SERVER_TIMING`` on, responses carry a ``Server-Timing``
+header with the per-request breakdown. ``render_metrics()`` produces the
+Prometheus text format served at ``/metrics``.
+
+Configuration: ``METRICS_ENABLED`` (default on), ``METRICS_SERVER_TIMING``
+(default off).
+"""
+import bisect
+import contextvars
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+METRICS_SERVER_TIMING = os.getenv("METRICS_SERVER_TIMING", "false").lower() in ("1", "true", "yes")
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100)
+
+WRITE_OPERATIONS = {"PutItem", "UpdateItem", "DeleteItem", "BatchWriteItem", "TransactWriteItems"}
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+# Every metric created, in exposition order
+_metrics = []
+
+
+class Counter:
+    """A monotonically increasing value per label combination."""
+
+    def __init__(self, name: str, help_text: str, labels: tuple = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def inc(self, label_values: tuple = (), amount: float = 1.0):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0.0) + amount
+
+    def expose(self) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for label_values, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labels, label_values)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    """Bucketed observations per label combination."""
+
+    def __init__(self, name: str, help_text: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = buckets
+        # label values -> [per-bucket counts (last is +Inf), sum]
+        self._series = {}
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def observe(self, label_values: tuple, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def expose(self) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for label_values, (counts, total) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + ("+Inf",), counts):
+                    cumulative += count
+                    le = 'le="{}"'.format("+Inf" if bound == "+Inf" else _format_value(bound))
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labels, label_values, le)} {cumulative}")
+                labels = _format_labels(self.labels, label_values)
+                lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+                lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+http_request_duration = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route.", ("method", "route", "status")
+)
+http_request_dynamodb_calls = Histogram(
+    "http_request_dynamodb_calls", "DynamoDB calls made per HTTP request.", ("method", "route"), COUNT_BUCKETS
+)
+phase_duration = Histogram(
+    "request_phase_duration_seconds", "Time spent in named request phases.", ("phase",)
+)
+dynamodb_call_duration = Histogram(
+    "dynamodb_call_duration_seconds", "DynamoDB call latency, including retries.", ("operation",)
+)
+dynamodb_consumed_capacity = Counter(
+    "dynamodb_consumed_capacity_units_total", "Capacity units consumed, from ConsumedCapacity.", ("table", "kind")
+)
+dynamodb_retries = Counter(
+    "dynamodb_retries_total", "Retries performed by the botocore retry handler.", ("operation",)
+)
+dynamodb_errors = Counter(
+    "dynamodb_errors_total", "DynamoDB calls that returned an error.", ("operation", "code")
+)
+
+
+class RequestMetrics:
+    """Per-request accumulator shared with the worker threads serving the request."""
+
+    __slots__ = ("db_calls", "db_time", "read_units", "write_units", "retries", "phases")
+
+    def __init__(self):
+        self.db_calls = 0
+        self.db_time = 0.0
+        self.read_units = 0.0
+        self.write_units = 0.0
+        self.retries = 0
+        self.phases = {}
+
+    def server_timing(self, total: float) -> str:
+        parts = [f"app;dur={total * 1000:.1f}"]
+        if self.db_calls:
+            parts.append(
+                f'db;dur={self.db_time * 1000:.1f};desc="{self.db_calls} calls, '
+                f'{self.read_units:g} RCU, {self.write_units:g} WCU, {self.retries} retries"'
+            )
+        for name, seconds in self.phases.items():
+            parts.append(f"{name};dur={seconds * 1000:.1f}")
+        return ", ".join(parts)
+
+
+_current = contextvars.ContextVar("request_metrics", default=None)
+
+
+@contextmanager
+def timed(phase: str):
+    """Record the time spent in the block as ``phase`` for this request."""
+    if not METRICS_ENABLED:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        phase_duration.observe((phase,), elapsed)
+        request = _current.get()
+        if request is not None:
+            request.phases[phase] = request.phases.get(phase, 0.0) + elapsed
+
+
+def _before_call(context, **kwargs):
+    context["metrics_started"] = time.perf_counter()
+
+
+def _after_call(http_response, parsed, model, context, **kwargs):
+    operation = model.name
+    elapsed = time.perf_counter() - context.get("metrics_started", time.perf_counter())
+    dynamodb_call_duration.observe((operation,), elapsed)
+
+    retries = parsed.get("ResponseMetadata", {}).get("RetryAttempts", 0)
+    if retries:
+        dynamodb_retries.inc((operation,), retries)
+    if "Error" in parsed:
+        dynamodb_errors.inc((operation, parsed["Error"].get("Code", "Unknown")))
+
+    capacity = parsed.get("ConsumedCapacity") or []
+    if isinstance(capacity, dict):
+        capacity = [capacity]
+    kind = "write" if operation in WRITE_OPERATIONS else "read"
+    units = 0.0
+    for entry in capacity:
+        consumed = entry.get("CapacityUnits", 0.0)
+        units += consumed
+        dynamodb_consumed_capacity.inc((entry.get("TableName", ""), kind), consumed)
+
+    request = _current.get()
+    if request is not None:
+        request.db_calls += 1
+        request.db_time += elapsed
+        request.retries += retries
+        if kind == "write":
+            request.write_units += units
+        else:
+            request.read_units += units
+
+
+def instrument_dynamodb(client):
+    """Attach the call-accounting hooks to a botocore DynamoDB client (once)."""
+    if not METRICS_ENABLED or getattr(client, "_metrics_instrumented", False):
+        return
+    client.meta.events.register("before-call.dynamodb.*", _before_call)
+    client.meta.events.register("after-call.dynamodb.*", _after_call)
+    client._metrics_instrumented = True
+
+
+class MetricsMiddleware:
+    """ASGI middleware that records per-route latency and DynamoDB usage."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        request = RequestMetrics()
+        token = _current.set(request)
+        started = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if METRICS_SERVER_TIMING:
+                    headers = list(message.get("headers", []))
+                    timing = request.server_timing(time.perf_counter() - started)
+                    headers.append((b"server-timing", timing.encode("latin-1")))
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            route = scope.get("route")
+            # Label by route template; unmatched paths share one series
+            route_path = getattr(route, "path", None) or "unmatched"
+            method = scope["method"]
+            http_request_duration.observe((method, route_path, str(status)), time.perf_counter() - started)
+            http_request_dynamodb_calls.observe((method, route_path), request.db_calls)
+
+
+def gauge_lines(name: str, help_text: str, labels: tuple, samples: dict) -> list:
+    """Exposition lines for a gauge computed at scrape time; ``samples`` maps label values to a value."""
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"]
+    for label_values, value in sorted(samples.items()):
+        lines.append(f"{name}{_format_labels(labels, label_values)} {_format_value(value)}")
+    return lines
+
+
+def render_metrics(extra_lines: Optional[list] = None) -> str:
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in _metrics:
+        lines.extend(metric.expose())
+    lines.extend(extra_lines or [])
+    return "\n".join(lines) + "\n"
@@ -1,33 +1,75 @@
 """
 PynamoDB models for the todo application.
 """
-from pynamodb.models import Model
-from pynamodb.attributes import UnicodeAttribute, BooleanAttribute, UTCDateTimeAttribute
-import os
-from dotenv import load_dotenv
+from datetime import datetime, timedelta, timezone
+from pynamodb.attributes import UnicodeAttribute, BooleanAttribute, NumberAttribute, TTLAttribute, UTCDateTimeAttribute
+from pynamodb.indexes import GlobalSecondaryIndex, AllProjection
+from database import DynamoDBMeta, SharedClientModel
 
-load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '..', '.env'))
 
-
-class User(Model):
+class User(SharedClientModel):
     """User model using PynamoDB."""
-    class Meta:
+    class Meta(DynamoDBMeta):
         table_name = "User"
-        region = os.getenv("AWS_REGION", "us-east-1")
-        aws_access_key_id = os.getenv("MY_AWS_ACCESS_KEY_ID")
-        aws_secret_access_key = os.getenv("MY_AWS_SECRET_ACCESS_KEY")
     
     username = UnicodeAttribute(hash_key=True)
     hashed_password = UnicodeAttribute()
 
 
-class Todo(Model):
-    """Todo model using PynamoDB."""
+class CreatedAtIndex(GlobalSecondaryIndex):
+    """A user's todos ordered by creation time."""
+    class Meta:
+        index_name = "created_at-index"
+        projection = AllProjection()
+
+    user_id = UnicodeAttribute(hash_key=True)
+    created_at = UTCDateTimeAttribute(range_key=True)
+
+
+class UpdatedAtIndex(GlobalSecondaryIndex):
+    """A user's todos ordered by last update time."""
+    class Meta:
+        index_name = "updated_at-index"
+        projection = AllProjection()
+
+    user_id = UnicodeAttribute(hash_key=True)
+    updated_at = UTCDateTimeAttribute(range_key=True)
+
+
+class StatusCreatedAtIndex(GlobalSecondaryIndex):
+    """A user's completed or pending todos ordered by creation time."""
+    class Meta:
+        index_name = "status-created_at-index"
+        projection = AllProjection()
+
+    status_key = UnicodeAttribute(hash_key=True)
+    created_at = UTCDateTimeAttribute(range_key=True)
+
+
+class StatusUpdatedAtIndex(GlobalSecondaryIndex):
+    """A user's completed or pending todos ordered by last update time."""
     class Meta:
+        index_name = "status-updated_at-index"
+        projection = AllProjection()
+
+    status_key = UnicodeAttribute(hash_key=True)
+    updated_at = UTCDateTimeAttribute(range_key=True)
+
+
+class LegacyIdIndex(GlobalSecondaryIndex):
+    """Re-keyed todos by their original UUID4 id; sparse, since only migrated items have one."""
+    class Meta:
+        index_name = "legacy_id-index"
+        projection = AllProjection()
+
+    user_id = UnicodeAttribute(hash_key=True)
+    legacy_id = UnicodeAttribute(range_key=True)
+
+
+class Todo(SharedClientModel):
+    """Todo model using PynamoDB."""
+    class Meta(DynamoDBMeta):
         table_name = "Todo"
-        region = os.getenv("AWS_REGION", "us-east-1")
-        aws_access_key_id = os.getenv("MY_AWS_ACCESS_KEY_ID")
-        aws_secret_access_key = os.getenv("MY_AWS_SECRET_ACCESS_KEY")
     
     user_id = UnicodeAttribute(hash_key=True)
     todo_id = UnicodeAttribute(range_key=True)
@@ -36,4 +78,51 @@ class Todo(Model):
     completed = BooleanAttribute(default=False)
     created_at = UTCDateTimeAttribute()
     updated_at = UTCDateTimeAttribute()
+    # Original UUID4 id of a todo re-keyed by the ID migration in bootstrap.py
+    legacy_id = UnicodeAttribute(null=True)
+    # "<user_id>#completed" or "<user_id>#pending"; hash key of the status indexes
+    status_key = UnicodeAttribute(null=True)
+    # Set on tombstones left by deletes, so the changes feed can report them;
+    # DynamoDB's TTL removes the tombstone once expires_at has passed.
+    deleted = BooleanAttribute(null=True)
+    expires_at = TTLAttribute(null=True)
 
+    created_at_index = CreatedAtIndex()
+    updated_at_index = UpdatedAtIndex()
+    status_created_at_index = StatusCreatedAtIndex()
+    status_updated_at_index = StatusUpdatedAtIndex()
+    legacy_id_index = LegacyIdIndex()
+
+    @staticmethod
+    def make_status_key(user_id: str, completed: bool) -> str:
+        return f"{user_id}#{'completed' if completed else 'pending'}"
+
+    def mark_deleted(self, at: datetime, ttl: timedelta):
+        """Turn this item into a tombstone that expires ``ttl`` after ``at``."""
+        self.deleted = True
+        self.updated_at = at
+        expires_at = at + ttl
+        self.expires_at = expires_at if expires_at.tzinfo else expires_at.replace(tzinfo=timezone.utc)
+
+    def serialize(self, *args, **kwargs):
+        # Every write path (save, batch_write, transactions) serializes the
+        # item first, so this keeps status_key in step with completed.
+        # Tombstones drop it, which takes them out of the status indexes.
+        self.status_key = None if self.deleted else self.make_status_key(self.user_id, bool(self.completed))
+        return super().serialize(*args, **kwargs)
+
+
+class TodoStats(SharedClientModel):
+    """
+    Per-user todo counters, so summaries don't have to read every todo.
+
+    Adjusted in the same transaction as each create, completion change and
+    delete; ``updated_at`` is when the counts last changed.
+    """
+    class Meta(DynamoDBMeta):
+        table_name = "TodoStats"
+
+    user_id = UnicodeAttribute(hash_key=True)
+    total = NumberAttribute(default=0)
+    completed = NumberAttribute(default=0)
+    updated_at = UTCDateTimeAttribute(null=True)
@@ -0,0 +1,75 @@
+"""
+Cursor pagination helpers for DynamoDB queries.
+
+A cursor is the query's ``LastEvaluatedKey`` wrapped in a signed,
+URL-safe token. The signature stops clients from forging keys into other
+users' partitions, and the scope string ties a cursor to the query that
+produced it.
+"""
+import base64
+import hashlib
+import hmac
+import json
+from typing import Optional
+
+
+class InvalidCursor(ValueError):
+    """Raised when a cursor token is malformed, tampered with or out of scope."""
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def _sign(payload: bytes, secret: Optional[str]) -> bytes:
+    return hmac.new((secret or "").encode("utf-8"), payload, hashlib.sha256).digest()
+
+
+def encode_cursor(last_evaluated_key: Optional[dict], scope: str, secret: Optional[str]) -> Optional[str]:
+    """Turn a ``LastEvaluatedKey`` into an opaque token, or None at the end of the results."""
+    if not last_evaluated_key:
+        return None
+    payload = json.dumps({"s": scope, "k": last_evaluated_key}, separators=(",", ":"), sort_keys=True).encode("utf-8")
+    return f"{_b64encode(payload)}.{_b64encode(_sign(payload, secret))}"
+
+
+def decode_cursor(token: str, scope: str, secret: Optional[str]) -> dict:
+    """Verify a cursor token and return the ``ExclusiveStartKey`` it carries."""
+    try:
+        payload_part, signature_part = token.split(".", 1)
+        payload = _b64decode(payload_part)
+        signature = _b64decode(signature_part)
+    except (ValueError, TypeError):
+        raise InvalidCursor("Malformed cursor")
+
+    if not hmac.compare_digest(signature, _sign(payload, secret)):
+        raise InvalidCursor("Invalid cursor signature")
+
+    try:
+        data = json.loads(payload)
+    except ValueError:
+        raise InvalidCursor("Malformed cursor")
+    if data.get("s") != scope or not isinstance(data.get("k"), dict):
+        raise InvalidCursor("Cursor does not belong to this query")
+    return data["k"]
+
+
+def query_page(model, hash_key, limit: int, last_evaluated_key: Optional[dict] = None, **query_kwargs):
+    """
+    Fetch one page of ``model.query(hash_key, ...)``.
+
+    Returns ``(items, last_evaluated_key)``; the key is None once the
+    partition is exhausted.
+    """
+    results = model.query(
+        hash_key,
+        limit=limit,
+        last_evaluated_key=last_evaluated_key,
+        **query_kwargs,
+    )
+    items = list(results)
+    return items, results.last_evaluated_key
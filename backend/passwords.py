@@ -0,0 +1,119 @@
+"""
+Password hashing service.
+
+Hashing runs on a dedicated pool (processes by default, so it scales
+across cores regardless of the GIL) whose worker count and backlog form a
+hard concurrency limit: a credential-stuffing burst gets 503s instead of
+starving the rest of the API of CPU.
+
+Configuration:
+
+- ``PASSWORD_SCHEME``: ``bcrypt`` (default) or ``argon2id`` (requires the
+  optional ``argon2-cffi`` package)
+- ``BCRYPT_ROUNDS``; ``ARGON2_TIME_COST``, ``ARGON2_MEMORY_COST`` (KiB),
+  ``ARGON2_PARALLELISM``
+- ``PASSWORD_POOL_KIND`` (``process`` or ``thread``),
+  ``PASSWORD_POOL_WORKERS``, ``PASSWORD_POOL_QUEUE``
+
+Hashes made with another scheme or a lower cost still verify, and
+``needs_rehash`` flags them so login can upgrade them transparently.
+"""
+import importlib.util
+import os
+
+from executor import BoundedExecutor
+
+# bcrypt and argon2 are imported on first use, as most processes (and every
+# cold start serving /health) never hash a password
+ARGON2_AVAILABLE = importlib.util.find_spec("argon2") is not None
+
+PASSWORD_SCHEME = os.getenv("PASSWORD_SCHEME", "bcrypt").lower()
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+ARGON2_TIME_COST = int(os.getenv("ARGON2_TIME_COST", "3"))
+ARGON2_MEMORY_COST = int(os.getenv("ARGON2_MEMORY_COST", "65536"))
+ARGON2_PARALLELISM = int(os.getenv("ARGON2_PARALLELISM", "1"))
+
+if PASSWORD_SCHEME not in ("bcrypt", "argon2id"):
+    raise RuntimeError(f"Unknown PASSWORD_SCHEME '{PASSWORD_SCHEME}'")
+if PASSWORD_SCHEME == "argon2id" and not ARGON2_AVAILABLE:
+    raise RuntimeError("PASSWORD_SCHEME=argon2id requires the 'argon2-cffi' package")
+
+
+def _argon2_hasher():
+    import argon2
+
+    return argon2.PasswordHasher(
+        time_cost=ARGON2_TIME_COST,
+        memory_cost=ARGON2_MEMORY_COST,
+        parallelism=ARGON2_PARALLELISM,
+        type=argon2.Type.ID,
+    )
+
+
+def _bcrypt_bytes(password: str) -> bytes:
+    # Bcrypt has a 72-byte limit, so we need to truncate if necessary
+    password_bytes = password.encode('utf-8')
+    if len(password_bytes) > 72:
+        password_bytes = password_bytes[:72]
+    return password_bytes
+
+
+def hash_password(password: str) -> str:
+    """Hash a password with the configured scheme and cost."""
+    if PASSWORD_SCHEME == "argon2id":
+        return _argon2_hasher().hash(password)
+    import bcrypt
+
+    salt = bcrypt.gensalt(rounds=BCRYPT_ROUNDS)
+    return bcrypt.hashpw(_bcrypt_bytes(password), salt).decode('utf-8')
+
+
+def verify_password(plain_password: str, hashed_password: str) -> bool:
+    """Verify a password against a bcrypt or argon2 hash."""
+    if hashed_password.startswith("$argon2"):
+        if not ARGON2_AVAILABLE:
+            raise RuntimeError("Found an argon2 hash but 'argon2-cffi' is not installed")
+        from argon2.exceptions import InvalidHashError, VerificationError
+
+        try:
+            return _argon2_hasher().verify(hashed_password, plain_password)
+        except (VerificationError, InvalidHashError):
+            return False
+    import bcrypt
+
+    try:
+        return bcrypt.checkpw(_bcrypt_bytes(plain_password), hashed_password.encode('utf-8'))
+    except ValueError:
+        return False
+
+
+def needs_rehash(hashed_password: str) -> bool:
+    """Whether a stored hash uses a different scheme or a lower cost than configured."""
+    if PASSWORD_SCHEME == "argon2id":
+        if not hashed_password.startswith("$argon2id$"):
+            return True
+        return _argon2_hasher().check_needs_rehash(hashed_password)
+    if not hashed_password.startswith("$2"):
+        return True
+    try:
+        return int(hashed_password.split("$")[2]) < BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return True
+
+
+hash_pool = BoundedExecutor(
+    "password",
+    max_workers=int(os.getenv("PASSWORD_POOL_WORKERS", str(os.cpu_count() or 2))),
+    max_queue=int(os.getenv("PASSWORD_POOL_QUEUE", "32")),
+    kind=os.getenv("PASSWORD_POOL_KIND", "process"),
+)
+
+
+async def hash_password_async(password: str) -> str:
+    """Hash a password on the password pool."""
+    return await hash_pool.run(hash_password, password)
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """Verify a password on the password pool."""
+    return await hash_pool.run(verify_password, plain_password, hashed_password)
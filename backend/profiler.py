@@ -0,0 +1,212 @@
+"""
+Sampling profiler for the running backend.
+
+A background thread snapshots every thread's stack with
+``sys._current_frames()`` at a fixed interval and counts identical stacks.
+The result is in the collapsed-stack format (``frame;frame;frame count``
+per line) read by flamegraph.pl, speedscope and similar tools. Sampling
+never instruments the code being profiled, so it is safe to run against
+live traffic; only one profile runs at a time.
+
+Three ways to take a profile, all opt-in:
+
+- ``POST /admin/profile?seconds=N`` with ``X-Admin-Token`` (requires
+  ``ADMIN_TOKEN``) profiles the whole process for N seconds
+- ``X-Profile: 1`` plus ``X-Admin-Token`` on any request profiles just
+  that request and returns the stacks instead of the normal body (the
+  real status is in ``X-Profiled-Status``). Samples cover every thread,
+  so profile single calls on a quiet instance.
+- with ``PROFILER_SIGNAL`` set (e.g. ``SIGUSR2``), that signal profiles
+  the process for ``PROFILER_SIGNAL_SECONDS`` and writes the result to
+  ``PROFILER_OUTPUT_DIR``
+
+Idle threads (blocked in locks, queues or the event loop's selector) are
+left out unless asked for.
+"""
+import os
+import re
+import signal
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+from fastapi.responses import PlainTextResponse
+
+from tokens import is_admin_token
+
+PROFILER_MAX_SECONDS = float(os.getenv("PROFILER_MAX_SECONDS", "60"))
+PROFILER_REQUEST_INTERVAL_MS = float(os.getenv("PROFILER_REQUEST_INTERVAL_MS", "1"))
+PROFILER_SIGNAL = os.getenv("PROFILER_SIGNAL")
+PROFILER_SIGNAL_SECONDS = float(os.getenv("PROFILER_SIGNAL_SECONDS", "30"))
+PROFILER_OUTPUT_DIR = os.getenv("PROFILER_OUTPUT_DIR", tempfile.gettempdir())
+
+MAX_STACK_DEPTH = 128
+# A thread whose innermost frame is in one of these modules is waiting, not working
+IDLE_MODULES = {"threading", "queue", "selectors", "concurrent.futures.thread", "asyncio.base_events"}
+
+
+class ProfilerBusy(Exception):
+    """Raised when a profile is requested while another one is running."""
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{frame.f_globals.get('__name__', '?')}.{getattr(code, 'co_qualname', code.co_name)}"
+
+
+def _thread_label(name) -> str:
+    # Fold pool workers ("io-pool_3") into one root per pool
+    return re.sub(r"[_-]\d+$", "", name or "unknown")
+
+
+class SamplingProfiler:
+    """Samples all thread stacks every ``interval`` seconds until stopped."""
+
+    def __init__(self, interval: float, include_idle: bool = False):
+        self.interval = interval
+        self.include_idle = include_idle
+        self.stacks = Counter()
+        self.samples = 0
+        self.started_at = None
+        self.duration = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+
+    def start(self):
+        self.started_at = time.perf_counter()
+        self._thread.start()
+
+    def _run(self):
+        # Sample before the first wait so even very short profiles get data
+        while True:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                # Skip this thread and the signal-triggered one waiting on it
+                if names.get(ident, "").startswith("profiler"):
+                    continue
+                if not self.include_idle and frame.f_globals.get("__name__") in IDLE_MODULES:
+                    continue
+                labels = []
+                while frame is not None and len(labels) < MAX_STACK_DEPTH:
+                    labels.append(_frame_label(frame))
+                    frame = frame.f_back
+                labels.append(_thread_label(names.get(ident)))
+                self.stacks[";".join(reversed(labels))] += 1
+            self.samples += 1
+            if self._stop.wait(self.interval):
+                break
+
+    def stop(self) -> str:
+        """Stop sampling and return the collapsed stacks."""
+        self._stop.set()
+        self._thread.join()
+        self.duration = time.perf_counter() - self.started_at
+        return self.collapsed()
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+# Held while a profile is running
+_active = threading.Lock()
+
+
+class _Profile(SamplingProfiler):
+    """A SamplingProfiler that holds the one-at-a-time lock while running."""
+
+    def stop(self) -> str:
+        try:
+            return super().stop()
+        finally:
+            _active.release()
+
+
+def start_profiler(interval: float, include_idle: bool = False) -> SamplingProfiler:
+    """Start a profile, raising ProfilerBusy if one is already running."""
+    if not _active.acquire(blocking=False):
+        raise ProfilerBusy()
+    profiler = _Profile(interval, include_idle)
+    try:
+        profiler.start()
+    except BaseException:
+        _active.release()
+        raise
+    return profiler
+
+
+def profile_response(profiler: SamplingProfiler, stacks: str, headers: dict = None) -> PlainTextResponse:
+    """Collapsed stacks as a downloadable response."""
+    filename = f"profile-{time.strftime('%Y%m%d-%H%M%S')}.collapsed"
+    return PlainTextResponse(stacks, headers={
+        "Content-Disposition": f'attachment; filename="{filename}"',
+        "X-Profile-Samples": str(profiler.samples),
+        "X-Profile-Duration-Ms": f"{profiler.duration * 1000:.1f}",
+        **(headers or {}),
+    })
+
+
+class ProfilerMiddleware:
+    """Profiles a single request carrying ``X-Profile`` and a valid ``X-Admin-Token``."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope["headers"])
+        if b"x-profile" not in headers or not is_admin_token(headers.get(b"x-admin-token", b"").decode("latin-1")):
+            await self.app(scope, receive, send)
+            return
+        try:
+            profiler = start_profiler(PROFILER_REQUEST_INTERVAL_MS / 1000)
+        except ProfilerBusy:
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def discard(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+
+        try:
+            await self.app(scope, receive, discard)
+        finally:
+            stacks = profiler.stop()
+        response = profile_response(profiler, stacks, {"X-Profiled-Status": str(status)})
+        await response(scope, receive, send)
+
+
+def _profile_to_file(seconds: float):
+    try:
+        profiler = start_profiler(0.005)
+    except ProfilerBusy:
+        print("Profiler already running; ignoring signal")
+        return
+    time.sleep(seconds)
+    stacks = profiler.stop()
+    path = os.path.join(PROFILER_OUTPUT_DIR, f"profile-{os.getpid()}-{time.strftime('%Y%m%d-%H%M%S')}.collapsed")
+    with open(path, "w") as f:
+        f.write(stacks)
+    print(f"Wrote {profiler.samples} profile samples to {path}")
+
+
+def install_signal_handler():
+    """Profile on PROFILER_SIGNAL, if configured. Must run on the main thread."""
+    if not PROFILER_SIGNAL:
+        return
+    try:
+        signum = getattr(signal, PROFILER_SIGNAL.upper())
+        signal.signal(
+            signum,
+            lambda *_: threading.Thread(
+                target=_profile_to_file, args=(PROFILER_SIGNAL_SECONDS,), name="profiler-signal", daemon=True
+            ).start(),
+        )
+    except (AttributeError, ValueError) as e:
+        print(f"Could not install profiler signal handler for {PROFILER_SIGNAL}: {e}")
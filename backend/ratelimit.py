@@ -0,0 +1,347 @@
+"""
+Admission control: per-user and per-IP token buckets plus concurrency caps.
+
+Todo endpoints charge the caller's bucket (keyed by username) a per-route
+cost, so a list query uses up more of the allowance than a single get,
+and exports and imports more than either. ``/token`` and ``/register``
+run before there is a user, and their password hashing is the most
+expensive work the service does, so they are charged to the client's IP
+instead. ``/token`` is also charged to the submitted username, twice
+over: a strict bucket per client IP and username (scope ``login``),
+which stops password guessing even when many clients share an IP, and a
+much looser one per username (scope ``account``) that only a guessing
+campaign spread over many IPs would exhaust. Keying the strict bucket on
+the IP too means someone who knows a username can't use it up and lock
+its owner out. A bucket holds up to ``burst`` tokens and refills at
+``rate`` per second; a request that finds too few gets 429 with
+``Retry-After`` set to when enough will have refilled, before it touches
+storage or a worker pool.
+
+Concurrency caps bound how many requests one user (or one IP, or one IP
+and username, on the auth routes) can have in flight on this worker. The
+rest get 429 straight away instead of queueing in the worker pools in
+front of everyone else.
+
+Buckets live in process memory by default, so each worker enforces its
+own share of the limit. Set ``RATE_LIMIT_URL`` to a Redis URL to share
+them between workers (requires the optional ``redis`` package); any
+``BucketStore`` can be plugged in. Concurrency caps are always per
+worker. If the shared store fails, requests are let through and counted
+as errors, so a limiter outage doesn't take the API down with it.
+
+The frontend calls ``/token`` and ``/register`` from its server, so every
+browser would share the server's IP. It forwards the browser's IP in
+``X-Client-IP``, with ``X-Client-IP-Secret`` set to
+``RATE_LIMIT_CLIENT_IP_SECRET``. The header is only believed when the
+secret matches, so clients calling the API directly can't pick their own
+IP.
+
+Configuration: ``RATE_LIMIT_ENABLED`` (default on),
+``RATE_LIMIT_USER_RATE``/``RATE_LIMIT_USER_BURST``,
+``RATE_LIMIT_IP_RATE``/``RATE_LIMIT_IP_BURST``,
+``RATE_LIMIT_LOGIN_RATE``/``RATE_LIMIT_LOGIN_BURST`` and
+``RATE_LIMIT_ACCOUNT_RATE``/``RATE_LIMIT_ACCOUNT_BURST`` (tokens per
+second, bucket size),
+``RATE_LIMIT_USER_CONCURRENCY``/``RATE_LIMIT_IP_CONCURRENCY``/``RATE_LIMIT_LOGIN_CONCURRENCY``/``RATE_LIMIT_ACCOUNT_CONCURRENCY``,
+``RATE_LIMIT_COSTS`` (``route=cost,...`` overriding ``ROUTE_COSTS``),
+``RATE_LIMIT_CLIENT_IP_SECRET`` (see above) and
+``RATE_LIMIT_TRUST_FORWARDED`` (take the client IP from
+``X-Forwarded-For``; only behind a proxy that sets it).
+"""
+import hmac
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from fastapi import HTTPException
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() in ("1", "true", "yes")
+RATE_LIMIT_TRUST_FORWARDED = os.getenv("RATE_LIMIT_TRUST_FORWARDED", "false").lower() in ("1", "true", "yes")
+# Shared with the frontend server, which forwards the browser's IP in X-Client-IP
+RATE_LIMIT_CLIENT_IP_SECRET = os.getenv("RATE_LIMIT_CLIENT_IP_SECRET", "")
+# Longest username used as a bucket key; longer ones share the bucket of their prefix
+RATE_LIMIT_MAX_ACCOUNT_KEY = 128
+# Buckets kept by the in-memory store; the least recently used are dropped first
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+
+# Tokens charged per request, by route; roughly the relative storage cost
+ROUTE_COSTS = {
+    "get": 1,
+    "stats": 1,
+    "create": 2,
+    "update": 2,
+    "delete": 2,
+    "changes": 2,
+    "list": 5,
+    "search": 5,
+    "events": 5,
+    "batch": 10,
+    "export": 20,
+    "import": 20,
+    "token": 1,
+    "register": 5,
+}
+
+
+class RateLimited(HTTPException):
+    """Raised when a caller is out of tokens or at their concurrency cap."""
+
+    def __init__(self, retry_after: float, detail: str = "Rate limit exceeded, please retry later"):
+        super().__init__(
+            status_code=429,
+            detail=detail,
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+        )
+
+
+def parse_costs(value: str) -> dict:
+    """Parse ``route=cost,...`` into a dict of costs."""
+    costs = {}
+    for part in value.split(","):
+        name, _, cost = part.partition("=")
+        if name.strip():
+            costs[name.strip()] = float(cost)
+    return costs
+
+
+class BucketStore:
+    """Interface for where token buckets are kept."""
+
+    # True if take() does network I/O, so it has to run on a worker pool
+    remote = False
+
+    def take(self, key: str, cost: float, rate: float, burst: float) -> float:
+        """
+        Take ``cost`` tokens from the bucket if it has them.
+
+        Returns 0 if it did, otherwise the seconds until the bucket will
+        have refilled enough (nothing is taken then).
+        """
+        raise NotImplementedError
+
+
+class InMemoryBucketStore(BucketStore):
+    """Buckets in a bounded dict, for single-process deployments and tests."""
+
+    def __init__(self, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, cost, rate, burst):
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            wait = 0.0
+            if tokens >= cost:
+                tokens -= cost
+            else:
+                wait = (cost - tokens) / rate
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            # A dropped bucket comes back full, which only errs towards letting requests in
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return wait
+
+
+# KEYS[1] = bucket; ARGV = cost, rate, burst. Returns the wait as a string,
+# since Lua numbers come back from Redis truncated to integers.
+_REDIS_TAKE = """
+local cost, rate, burst = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or burst
+local updated = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+local wait = 0
+if tokens >= cost then
+    tokens = tokens - cost
+else
+    wait = (cost - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000))
+return tostring(wait)
+"""
+
+
+class RedisBucketStore(BucketStore):
+    """Buckets shared between workers in Redis (requires the optional ``redis`` package)."""
+
+    remote = True
+
+    def __init__(self, url: str):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("RATE_LIMIT_URL is set but the 'redis' package is not installed")
+        client = redis.Redis.from_url(url, decode_responses=True)
+        # Refill and take in one server-side step, so concurrent workers can't both spend the same tokens
+        self._take = client.register_script(_REDIS_TAKE)
+
+    def take(self, key, cost, rate, burst):
+        return float(self._take(keys=[f"ratelimit:{key}"], args=[cost, rate, burst]))
+
+
+class RateLimiter:
+    """
+    Token buckets and in-flight counts per ``(scope, key)``.
+
+    ``limits`` maps a scope ("user", "ip", "login", "account") to its ``(rate, burst)`` and
+    ``concurrency`` to its in-flight cap (0: uncapped).
+    """
+
+    def __init__(self, store: BucketStore, limits: dict, concurrency: dict, costs: dict, enabled: bool = True):
+        self.store = store
+        self.limits = limits
+        self.concurrency = concurrency
+        self.costs = costs
+        self.enabled = enabled
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self.admitted = 0
+        self.limited = {}
+        self.over_concurrency = {}
+        self.errors = 0
+
+    def _count(self, counts: dict, route: str):
+        with self._lock:
+            counts[route] = counts.get(route, 0) + 1
+
+    async def charge(self, scope: str, key: str, route: str, run):
+        """Take ``route``'s cost from the bucket, raising ``RateLimited`` if it's short; ``run`` runs remote stores."""
+        rate, burst = self.limits[scope]
+        # A request costing more than the whole bucket could never get in
+        cost = min(self.costs.get(route, 1), burst)
+        bucket = f"{scope}:{key}"
+        try:
+            if self.store.remote:
+                wait = await run(self.store.take, bucket, cost, rate, burst)
+            else:
+                wait = self.store.take(bucket, cost, rate, burst)
+        except HTTPException:
+            raise
+        except Exception as e:
+            print(f"Error checking rate limit for {bucket}: {e}")
+            with self._lock:
+                self.errors += 1
+            return
+        if wait > 0:
+            self._count(self.limited, route)
+            raise RateLimited(wait)
+
+    @asynccontextmanager
+    async def admit(self, scope: str, key: str, route: str, run, concurrent: bool = True):
+        """
+        Charge the request and hold one of the key's in-flight slots until the block exits.
+
+        ``concurrent=False`` skips the slot, for long-lived streams that are
+        capped elsewhere.
+        """
+        if not self.enabled:
+            yield
+            return
+        await self.charge(scope, key, route, run)
+        limit = self.concurrency.get(scope, 0) if concurrent else 0
+        if not limit:
+            with self._lock:
+                self.admitted += 1
+            yield
+            return
+        slot = (scope, key)
+        with self._lock:
+            if self._in_flight.get(slot, 0) >= limit:
+                self.over_concurrency[route] = self.over_concurrency.get(route, 0) + 1
+                raise RateLimited(1, detail="Too many concurrent requests, please retry")
+            self._in_flight[slot] = self._in_flight.get(slot, 0) + 1
+            self.admitted += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                remaining = self._in_flight[slot] - 1
+                if remaining:
+                    self._in_flight[slot] = remaining
+                else:
+                    del self._in_flight[slot]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "store": type(self.store).__name__,
+                "limits": {scope: {"rate": rate, "burst": burst} for scope, (rate, burst) in self.limits.items()},
+                "concurrency": dict(self.concurrency),
+                "admitted": self.admitted,
+                "limited": dict(self.limited),
+                "over_concurrency": dict(self.over_concurrency),
+                "errors": self.errors,
+                "in_flight_keys": len(self._in_flight),
+            }
+
+
+def client_ip(headers, client: Optional[tuple]) -> str:
+    """
+    The caller's IP.
+
+    In order: ``X-Client-IP`` if it comes with the shared secret (the
+    frontend server calling on a browser's behalf), the first
+    ``X-Forwarded-For`` hop if trusted, else the socket peer.
+    """
+    claimed = headers.get("x-client-ip")
+    if claimed and RATE_LIMIT_CLIENT_IP_SECRET and hmac.compare_digest(
+        headers.get("x-client-ip-secret", "").encode(), RATE_LIMIT_CLIENT_IP_SECRET.encode()
+    ):
+        return claimed.strip()
+    if RATE_LIMIT_TRUST_FORWARDED:
+        forwarded = headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return client[0] if client else "unknown"
+
+
+def account_key(username: Optional[str]) -> Optional[str]:
+    """The ``account`` bucket for a submitted username, or None if there wasn't one."""
+    if not username or not isinstance(username, str):
+        return None
+    return username[:RATE_LIMIT_MAX_ACCOUNT_KEY]
+
+
+def login_key(ip: str, username: Optional[str]) -> Optional[str]:
+    """The ``login`` bucket for a username tried from ``ip`` (IPs have no ``|``, so keys can't collide)."""
+    account = account_key(username)
+    return None if account is None else f"{ip}|{account}"
+
+
+def build_rate_limiter() -> RateLimiter:
+    """Build the limiter from RATE_LIMIT_* environment variables."""
+    url = os.getenv("RATE_LIMIT_URL")
+    store = RedisBucketStore(url) if url else InMemoryBucketStore()
+    limits = {
+        "user": (float(os.getenv("RATE_LIMIT_USER_RATE", "20")), float(os.getenv("RATE_LIMIT_USER_BURST", "100"))),
+        # Loose enough for a NAT or office behind one address; guessing is stopped per login
+        "ip": (float(os.getenv("RATE_LIMIT_IP_RATE", "5")), float(os.getenv("RATE_LIMIT_IP_BURST", "50"))),
+        "login": (float(os.getenv("RATE_LIMIT_LOGIN_RATE", "0.2")), float(os.getenv("RATE_LIMIT_LOGIN_BURST", "10"))),
+        # A ceiling over all IPs, high enough that one attacker can't lock the owner out
+        "account": (float(os.getenv("RATE_LIMIT_ACCOUNT_RATE", "2")), float(os.getenv("RATE_LIMIT_ACCOUNT_BURST", "100"))),
+    }
+    concurrency = {
+        "user": int(os.getenv("RATE_LIMIT_USER_CONCURRENCY", "8")),
+        "ip": int(os.getenv("RATE_LIMIT_IP_CONCURRENCY", "16")),
+        "login": int(os.getenv("RATE_LIMIT_LOGIN_CONCURRENCY", "2")),
+        # Uncapped: others holding the slots would lock the owner out
+        "account": int(os.getenv("RATE_LIMIT_ACCOUNT_CONCURRENCY", "0")),
+    }
+    costs = dict(ROUTE_COSTS)
+    costs.update(parse_costs(os.getenv("RATE_LIMIT_COSTS", "")))
+    return RateLimiter(store, limits, concurrency, costs, enabled=RATE_LIMIT_ENABLED)
+
+
+rate_limiter = build_rate_limiter()
@@ -0,0 +1,252 @@
+"""
+Full-text search over todo titles and descriptions.
+
+``search_index`` holds an inverted index per user: token -> {todo_id:
+weight}, plus the sorted token list so a query term also matches every
+token it prefixes ("gro" finds "groceries"). Results are ranked by a
+TF-IDF score in which title matches count double and whole-token matches
+outrank prefix matches; every query term has to match.
+
+A user's index is built from one read of their todos the first time they
+search, then kept in step incrementally: the write handlers on this
+worker apply each change as it happens, and writes made by other workers
+are picked up from the changes feed once the index is more than
+``SEARCH_SYNC_SECONDS`` old. Only ``SEARCH_MAX_USERS`` indexes are kept,
+least recently searched first out. ``rebuild`` drops and reloads one
+user's index; ``rebuild_all`` rebuilds every user's from a table scan.
+"""
+import bisect
+import math
+import os
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Optional
+
+from changes import CHANGES_SKEW, TOMBSTONE_TTL
+from storage import storage
+
+SEARCH_MAX_USERS = int(os.getenv("SEARCH_MAX_USERS", "1000"))
+SEARCH_SYNC_SECONDS = float(os.getenv("SEARCH_SYNC_SECONDS", "30"))
+# Tokens a single prefix may expand to; keeps one-letter queries cheap
+SEARCH_MAX_EXPANSIONS = int(os.getenv("SEARCH_MAX_EXPANSIONS", "100"))
+
+TITLE_WEIGHT = 2.0
+PREFIX_FACTOR = 0.6
+MAX_TOKEN_LENGTH = 40
+CATCH_UP_PAGE_SIZE = 500
+
+_WORD = re.compile(r"\w+")
+
+
+def tokenize(text: Optional[str]) -> list:
+    """Lowercased, accent-folded word tokens."""
+    if not text:
+        return []
+    folded = unicodedata.normalize("NFKD", text.casefold())
+    folded = "".join(char for char in folded if not unicodedata.combining(char))
+    return [token[:MAX_TOKEN_LENGTH] for token in _WORD.findall(folded)]
+
+
+def _timestamp(value: Optional[datetime]) -> float:
+    if value is None:
+        return 0.0
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+def _weights(todo) -> dict:
+    weights = {}
+    for token in tokenize(todo.title):
+        weights[token] = weights.get(token, 0.0) + TITLE_WEIGHT
+    for token in tokenize(todo.description):
+        weights[token] = weights.get(token, 0.0) + 1.0
+    return weights
+
+
+class UserIndex:
+    """The inverted index for one user's todos."""
+
+    def __init__(self, synced_at: datetime):
+        self.postings = {}
+        self.terms = []
+        # todo_id -> (tokens, updated_at); what to unindex on update, and the tie-breaker
+        self.docs = {}
+        self.synced_at = synced_at
+        self.lock = threading.Lock()
+
+    def add(self, todo, sorted_terms: bool = True):
+        self.remove(todo.todo_id)
+        weights = _weights(todo)
+        for token, weight in weights.items():
+            posting = self.postings.get(token)
+            if posting is None:
+                posting = self.postings[token] = {}
+                if sorted_terms:
+                    bisect.insort(self.terms, token)
+                else:
+                    self.terms.append(token)
+            posting[todo.todo_id] = weight
+        self.docs[todo.todo_id] = (tuple(weights), _timestamp(todo.updated_at))
+
+    def remove(self, todo_id: str):
+        doc = self.docs.pop(todo_id, None)
+        if doc is None:
+            return
+        for token in doc[0]:
+            posting = self.postings[token]
+            del posting[todo_id]
+            if not posting:
+                del self.postings[token]
+                del self.terms[bisect.bisect_left(self.terms, token)]
+
+    def apply(self, todo):
+        if todo.deleted:
+            self.remove(todo.todo_id)
+        else:
+            self.add(todo)
+
+    def _matches(self, term: str) -> dict:
+        """todo_id -> score for one query term, over the term and the tokens it prefixes."""
+        scores = {}
+        start = bisect.bisect_left(self.terms, term)
+        for token in self.terms[start:start + SEARCH_MAX_EXPANSIONS]:
+            if not token.startswith(term):
+                break
+            posting = self.postings[token]
+            idf = math.log(1 + len(self.docs) / len(posting))
+            factor = 1.0 if token == term else PREFIX_FACTOR
+            for todo_id, weight in posting.items():
+                score = idf * weight * factor
+                if score > scores.get(todo_id, 0.0):
+                    scores[todo_id] = score
+        return scores
+
+    def search(self, terms: list) -> list:
+        """Ids of todos matching every term, best first."""
+        scores = None
+        # Rarest-looking (longest) terms first, so the intersection shrinks quickly
+        for term in sorted(set(terms), key=len, reverse=True):
+            matches = self._matches(term)
+            if scores is None:
+                scores = matches
+            else:
+                scores = {todo_id: score + matches[todo_id] for todo_id, score in scores.items() if todo_id in matches}
+            if not scores:
+                return []
+        return sorted(scores, key=lambda todo_id: (scores[todo_id], self.docs[todo_id][1]), reverse=True)
+
+
+class SearchIndex:
+    """Per-user indexes, built on first use and kept in step with writes."""
+
+    def __init__(self, max_users: int = SEARCH_MAX_USERS, sync_seconds: float = SEARCH_SYNC_SECONDS):
+        self.max_users = max_users
+        self.sync_seconds = sync_seconds
+        self._users = OrderedDict()
+        self._lock = threading.Lock()
+        self.builds = 0
+        self.catch_ups = 0
+
+    def _store(self, user_id: str, index: UserIndex):
+        with self._lock:
+            self._users[user_id] = index
+            self._users.move_to_end(user_id)
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+
+    def _load(self, user_id: str) -> UserIndex:
+        # Stamp before reading, so writes racing the read are caught up later
+        synced_at = datetime.now(timezone.utc)
+        return self._build(storage.query_todos(user_id)[0], synced_at)
+
+    def _build(self, todos: list, synced_at: datetime) -> UserIndex:
+        index = UserIndex(synced_at)
+        for todo in todos:
+            index.add(todo, sorted_terms=False)
+        index.terms.sort()
+        self.builds += 1
+        return index
+
+    def _catch_up(self, user_id: str, index: UserIndex):
+        """Apply changes made since the last sync (by any worker) from the changes feed."""
+        started = datetime.now(timezone.utc)
+        since, start_key = index.synced_at - CHANGES_SKEW, None
+        while True:
+            todos, start_key = storage.query_changes(user_id, since, CATCH_UP_PAGE_SIZE, start_key)
+            with index.lock:
+                for todo in todos:
+                    index.apply(todo)
+            if start_key is None:
+                break
+        index.synced_at = started
+        self.catch_ups += 1
+
+    def _index(self, user_id: str) -> UserIndex:
+        with self._lock:
+            index = self._users.get(user_id)
+            if index is not None:
+                self._users.move_to_end(user_id)
+        now = datetime.now(timezone.utc)
+        if index is None or now - index.synced_at > TOMBSTONE_TTL:
+            # Too old to catch up: deletes may have expired out of the feed
+            index = self._load(user_id)
+            self._store(user_id, index)
+        elif (now - index.synced_at).total_seconds() > self.sync_seconds:
+            self._catch_up(user_id, index)
+        return index
+
+    def search(self, user_id: str, query: str) -> list:
+        """Ranked ids of the user's todos matching ``query``."""
+        terms = tokenize(query)
+        if not terms:
+            return []
+        index = self._index(user_id)
+        with index.lock:
+            return index.search(terms)
+
+    def apply(self, user_id: str, todos: list):
+        """Index new or changed todos (tombstones remove); no-op for users without a loaded index."""
+        with self._lock:
+            index = self._users.get(user_id)
+        if index is None:
+            return
+        with index.lock:
+            for todo in todos:
+                index.apply(todo)
+
+    def rebuild(self, user_id: str):
+        """Reload one user's index from storage."""
+        self._store(user_id, self._load(user_id))
+
+    def rebuild_all(self) -> dict:
+        """Rebuild every user's index from one table scan; keeps the most recently updated users."""
+        synced_at = datetime.now(timezone.utc)
+        by_user = {}
+        for todo in storage.scan_todos():
+            by_user.setdefault(todo.user_id, []).append(todo)
+        latest = {
+            user_id: max(_timestamp(todo.updated_at) for todo in todos) for user_id, todos in by_user.items()
+        }
+        users = sorted(by_user, key=latest.get)[-self.max_users:]
+        for user_id in users:
+            self._store(user_id, self._build(by_user[user_id], synced_at))
+        return {"users": len(users), "todos": sum(len(by_user[user_id]) for user_id in users)}
+
+    def stats(self) -> dict:
+        with self._lock:
+            users = list(self._users.values())
+        return {
+            "users": len(users),
+            "max_users": self.max_users,
+            "todos": sum(len(index.docs) for index in users),
+            "terms": sum(len(index.terms) for index in users),
+            "builds": self.builds,
+            "catch_ups": self.catch_ups,
+        }
+
+
+search_index = SearchIndex()
@@ -0,0 +1,89 @@
+"""
+Todo response model and fast JSON encoding.
+
+``TodoOut`` is the single API representation of a todo; everything that
+returns todos converts through ``TodoOut.from_model``. Handlers return
+``FastJSONResponse`` (or pre-encoded bytes) directly, which skips
+FastAPI's ``jsonable_encoder`` pass. Encoding uses ``orjson`` when it is
+installed (optional dependency): it writes dataclasses and datetimes
+natively, so a list of ``TodoOut`` is encoded without building a dict
+per item. Without it, the stdlib ``json`` module is used.
+"""
+import json
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Optional
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _utc(value: Optional[datetime]) -> Optional[datetime]:
+    # Naive datetimes in this codebase are UTC; without an offset, JavaScript's Date reads them as local time
+    if value is not None and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+@dataclass(slots=True)
+class TodoOut:
+    """A todo as returned by the API."""
+    id: str
+    title: str
+    description: Optional[str]
+    completed: bool
+    created_at: Optional[datetime]
+    updated_at: Optional[datetime]
+
+    @classmethod
+    def from_model(cls, todo) -> "TodoOut":
+        return cls(
+            todo.todo_id, todo.title, todo.description, todo.completed, _utc(todo.created_at), _utc(todo.updated_at)
+        )
+
+    def to_dict(self, fields: Optional[list] = None) -> dict:
+        """JSON-ready dict, optionally limited to ``fields``."""
+        data = {
+            "id": self.id,
+            "title": self.title,
+            "description": self.description,
+            "completed": self.completed,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "updated_at": self.updated_at.isoformat() if self.updated_at else None,
+        }
+        if fields:
+            return {name: data[name] for name in fields}
+        return data
+
+
+def _default(value: Any):
+    if isinstance(value, TodoOut):
+        return value.to_dict()
+    if isinstance(value, datetime):
+        return _utc(value).isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(value: Any) -> bytes:
+    """Encode ``value`` (which may contain TodoOut and datetimes) as compact JSON."""
+    if orjson is not None:
+        return orjson.dumps(value, option=orjson.OPT_NAIVE_UTC)
+    return json.dumps(value, default=_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with ``dumps``."""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def encode_todos(todos: list, fields: Optional[list] = None) -> bytes:
+    """Encode Todo items as a JSON array, optionally limited to ``fields``."""
+    if fields:
+        return dumps([TodoOut.from_model(todo).to_dict(fields) for todo in todos])
+    return dumps([TodoOut.from_model(todo) for todo in todos])
@@ -0,0 +1,69 @@
+"""
+Per-user todo counters: ``GET /todos/stats``.
+
+Each user has one ``TodoStats`` item holding ``total`` and ``completed``.
+Creates, completion changes and deletes adjust it in the same transaction
+as the todo write (DynamoDB ``ADD`` in TransactWriteItems, one SQLite
+transaction), so reading the stats is a single get instead of a query of
+every todo. On DynamoDB, completion changes and deletes are conditional
+on the todo being as read, so the amount added is exact. Imports go
+through the same conditional batch writes as batch requests.
+
+Anything that writes todos some other way (a restored backup, a manual
+edit) leaves the counters stale; ``reconcile`` rebuilds them from a query
+of the user's todos, and ``reconcile_all`` does so for every user
+(``POST /admin/stats/reconcile``, ``bootstrap.py --reconcile-stats``).
+Counters that were never written are built the same way on first read.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from storage import storage
+
+RECONCILE_WORKERS = int(os.getenv("STATS_RECONCILE_WORKERS", "8"))
+
+
+def _summary(stats) -> dict:
+    # A counter can briefly dip below zero if a reconcile races a delete
+    total = max(int(stats.total or 0), 0)
+    completed = min(max(int(stats.completed or 0), 0), total)
+    return {
+        "total": total,
+        "completed": completed,
+        "pending": total - completed,
+        "updated_at": stats.updated_at.isoformat() if stats.updated_at else None,
+    }
+
+
+def load_stats(user_id: str) -> dict:
+    """The user's counts, building the counters first if they don't exist yet."""
+    stats = storage.get_stats(user_id)
+    if stats is None:
+        stats = storage.reconcile_stats(user_id)
+    return _summary(stats)
+
+
+def reconcile(user_id: str) -> dict:
+    """Rebuild one user's counters from their todos."""
+    return _summary(storage.reconcile_stats(user_id))
+
+
+def reconcile_all(workers: int = RECONCILE_WORKERS) -> dict:
+    """Rebuild the counters of every user with todos or counters, ``workers`` users at a time."""
+    users = {todo.user_id for todo in storage.scan_todos()}
+    users.update(stats.user_id for stats in storage.scan_stats())
+    failed = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for user_id, error in zip(users, pool.map(_try_reconcile, users)):
+            if error is not None:
+                print(f"Error reconciling stats for {user_id}: {error}")
+                failed += 1
+    return {"users": len(users) - failed, "failed": failed}
+
+
+def _try_reconcile(user_id: str):
+    try:
+        storage.reconcile_stats(user_id)
+    except Exception as e:
+        return e
+    return None
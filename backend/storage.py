@@ -0,0 +1,1343 @@
+"""
+Storage backends for users and todos.
+
+main.py and batch.py go through ``storage`` rather than calling the
+PynamoDB models directly. ``STORAGE_BACKEND`` picks the engine:
+
+- ``dynamodb`` (default): the PynamoDB models and their secondary indexes
+- ``memory``: per-user sorted indexes in process memory; nothing persists
+- ``sqlite``: a SQLite database file (``SQLITE_PATH``) in WAL mode, with
+  indexes matching the DynamoDB ones
+
+Every backend returns ``User``/``Todo`` model instances, so serialization,
+caching and ETags work the same whichever one is in use. List queries are
+keyset-paginated: a page returns the key of its last item, which is passed
+back (inside a signed cursor) to continue after it. The memory and SQLite
+engines make it possible to run, benchmark and profile the API on one
+machine without AWS, and to run small single-node deployments.
+"""
+import bisect
+import functools
+import operator
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from typing import TYPE_CHECKING, Optional
+
+from pynamodb.constants import ALL_OLD
+from pynamodb.exceptions import PutError, TransactWriteError, UpdateError
+from pynamodb.transactions import TransactWrite
+
+from database import warm_up
+from ids import id_generator, is_time_ordered
+from models import Todo, TodoStats, User
+from pagination import query_page
+
+if TYPE_CHECKING:
+    # Imported where it's used, so the other engines don't load it
+    import sqlite3
+
+BATCH_MAX_ATTEMPTS = int(os.getenv("BATCH_MAX_ATTEMPTS", "5"))
+BATCH_BASE_BACKOFF_MS = int(os.getenv("BATCH_BASE_BACKOFF_MS", "50"))
+# Tries for a counted write whose todo changed since it was read, or whose
+# counter update conflicts with another
+STATS_MAX_ATTEMPTS = int(os.getenv("STATS_MAX_ATTEMPTS", "4"))
+
+# Todo attributes persisted by the memory and SQLite engines
+TODO_ATTRIBUTES = (
+    "user_id", "todo_id", "title", "description", "completed", "created_at", "updated_at", "legacy_id",
+    "deleted", "expires_at",
+)
+TIMESTAMP_ATTRIBUTES = ("created_at", "updated_at")
+
+# List ordering -> attributes that form a page key, most significant first
+ORDER_KEYS = {
+    None: ("todo_id",),
+    "created_at": ("created_at", "todo_id"),
+    "updated_at": ("updated_at", "todo_id"),
+}
+# Memory index of every item, tombstones included, by last update
+CHANGES_INDEX = ("changes", "updated_at")
+CHANGES_KEY = ORDER_KEYS["updated_at"]
+
+
+class ConditionFailed(Exception):
+    """Raised when a conditional write finds the item changed or missing."""
+
+
+def _utc(value: datetime) -> datetime:
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def _format_timestamp(value: datetime) -> str:
+    # Fixed width, so string order matches time order
+    return _utc(value).strftime("%Y-%m-%dT%H:%M:%S.%f+00:00")
+
+
+def _parse_timestamp(value: str) -> datetime:
+    return datetime.fromisoformat(value)
+
+
+def _list_sort(completed: Optional[bool], sort: Optional[str]) -> Optional[str]:
+    # Status-filtered lists are always ordered by a timestamp, as in DynamoDB
+    if completed is not None and sort is None:
+        return "created_at"
+    return sort
+
+
+def _stats_delta(todo: Todo, before: Optional[Todo]) -> tuple:
+    """The ``(total, completed)`` change to the counters from writing ``todo`` over ``before``."""
+    old = (0, 0) if before is None else (1, int(bool(before.completed)))
+    new = (0, 0) if todo.deleted else (1, int(bool(todo.completed)))
+    return new[0] - old[0], new[1] - old[1]
+
+
+class Storage:
+    """
+    Interface shared by the storage backends.
+
+    ``query_todos`` returns ``(items, last_key)``; ``last_key`` is None
+    when there is nothing after the page and is otherwise a JSON-safe dict
+    to pass back as ``start_key``. ``limit=None`` reads everything after
+    ``start_key``. ``fields`` is a hint: backends may return more.
+
+    Deletes are written as tombstones (see ``Todo.mark_deleted``).
+    ``query_todos`` never returns them; ``query_changes`` does, until
+    they expire. ``get_todo`` and ``batch_get_todos`` return them as-is.
+    """
+
+    name = None
+    # Writes handed to batch_write in one call
+    batch_write_limit = 25
+
+    async def warm_up(self, run):
+        """Open connections ahead of the first request; ``run`` runs blocking calls off the loop."""
+
+    def get_user(self, username: str) -> Optional[User]:
+        raise NotImplementedError
+
+    def put_user(self, user: User):
+        raise NotImplementedError
+
+    def update_password(self, user: User, hashed_password: str) -> bool:
+        """Replace the user's hash unless it changed since ``user`` was read."""
+        raise NotImplementedError
+
+    def get_todo(self, user_id: str, todo_id: str) -> Todo:
+        """Fetch one todo, raising ``Todo.DoesNotExist`` if there is none."""
+        raise NotImplementedError
+
+    def put_todo(self, todo: Todo, expected_updated_at: Optional[datetime] = None):
+        """Create or replace a todo; with ``expected_updated_at``, only if it still matches."""
+        raise NotImplementedError
+
+    def create_todo(self, todo: Todo):
+        """Write a new todo and count it in the user's stats, atomically; ``ConditionFailed`` if the id is taken."""
+        raise NotImplementedError
+
+    def update_todo(self, user_id: str, todo_id: str, changes: dict, at: datetime,
+                    expected_updated_at: Optional[datetime] = None) -> Todo:
+        """
+        Set ``changes`` (title, description, completed) and ``updated_at`` on a todo in one write.
+
+        Returns the todo as stored. Raises ``Todo.DoesNotExist`` if there is
+        no live todo with that id, and ``ConditionFailed`` if
+        ``expected_updated_at`` is given and no longer matches. A change to
+        ``completed`` adjusts the user's stats in the same transaction.
+        """
+        raise NotImplementedError
+
+    def tombstone_todo(self, user_id: str, todo_id: str, at: datetime, ttl: timedelta) -> Todo:
+        """
+        Turn a live todo into a tombstone and uncount it, in one transaction.
+
+        Raises ``Todo.DoesNotExist`` if there is no live todo with that id.
+        Only the returned tombstone's key and delete attributes are
+        guaranteed to be filled in.
+        """
+        raise NotImplementedError
+
+    def delete_todo(self, todo: Todo):
+        """Remove a todo outright, leaving no tombstone."""
+        raise NotImplementedError
+
+    def batch_get_todos(self, user_id: str, todo_ids: list) -> list:
+        raise NotImplementedError
+
+    def conditional_batch_write(self, user_id: str, writes: list) -> set:
+        """
+        Write up to ``batch_write_limit`` of one user's todos, each only if it is unchanged since it was read.
+
+        ``writes`` are ``(todo, before)`` pairs, where ``before`` is the todo
+        as read (its ``updated_at`` and ``completed``), or None for a new
+        todo. A todo is written only if it is still live with that
+        ``updated_at`` (a new one only if its id is free); the others are
+        left alone and their ids returned. The user's stats change with the
+        written todos, atomically.
+        """
+        raise NotImplementedError
+
+    def batch_write(self, puts: list, deletes: list) -> set:
+        """Write up to ``batch_write_limit`` todos; returns the ids left unwritten."""
+        raise NotImplementedError
+
+    def query_todos(self, user_id: str, completed: Optional[bool] = None, sort: Optional[str] = None,
+                    order: str = "asc", since: Optional[datetime] = None, fields: Optional[list] = None,
+                    limit: Optional[int] = None, start_key: Optional[dict] = None):
+        raise NotImplementedError
+
+    def query_changes(self, user_id: str, since: datetime, limit: int, start_key: Optional[dict] = None):
+        """Todos and tombstones updated at or after ``since``, oldest first; same paging as query_todos."""
+        raise NotImplementedError
+
+    def last_change(self, user_id: str) -> Optional[datetime]:
+        """The latest ``updated_at`` among the user's todos and tombstones; None if they have none."""
+        raise NotImplementedError
+
+    def scan_todos(self):
+        """Every user's todos (not tombstones), in no particular order."""
+        raise NotImplementedError
+
+    def get_stats(self, user_id: str) -> Optional[TodoStats]:
+        """The user's counters, or None if they were never written."""
+        raise NotImplementedError
+
+    def put_stats(self, stats: TodoStats, before: Optional[TodoStats]) -> bool:
+        """Replace the user's counters unless they changed since ``before`` was read (None: didn't exist)."""
+        raise NotImplementedError
+
+    def scan_stats(self):
+        """Every user's counters."""
+        raise NotImplementedError
+
+    def reconcile_stats(self, user_id: str) -> TodoStats:
+        """
+        Rebuild the user's counters from a query of their todos.
+
+        A counted write landing while the todos are read changes the
+        counters' ``updated_at``, which fails the replace; the count is then
+        redone, up to ``STATS_MAX_ATTEMPTS`` times (``ConditionFailed``).
+        """
+        for _ in range(STATS_MAX_ATTEMPTS):
+            before = self.get_stats(user_id)
+            todos, _ = self.query_todos(user_id, fields=["completed", "updated_at"])
+            times = [todo.updated_at for todo in todos] + ([before.updated_at] if before and before.updated_at else [])
+            stats = TodoStats(
+                user_id=user_id,
+                total=len(todos),
+                completed=sum(1 for todo in todos if todo.completed),
+                updated_at=max(times) if times else None,
+            )
+            if self.put_stats(stats, before):
+                return stats
+        raise ConditionFailed()
+
+    def cursor_scope(self, user_id: str, completed: Optional[bool], sort: Optional[str]) -> str:
+        """Identifies the list a page key belongs to, so cursors can't cross queries."""
+        return f"{user_id}|{completed}|{_list_sort(completed, sort)}"
+
+
+def _request_key(request: dict) -> str:
+    """The todo_id of a PutRequest/DeleteRequest from UnprocessedItems."""
+    if "PutRequest" in request:
+        return request["PutRequest"]["Item"]["todo_id"]["S"]
+    return request["DeleteRequest"]["Key"]["todo_id"]["S"]
+
+
+class DynamoDBStorage(Storage):
+    """The PynamoDB models; filtered and sorted lists read the secondary indexes."""
+
+    name = "dynamodb"
+
+    async def warm_up(self, run):
+        await warm_up(run, User, Todo)
+
+    def get_user(self, username):
+        try:
+            return User.get(username)
+        except User.DoesNotExist:
+            return None
+
+    def put_user(self, user):
+        user.save()
+
+    def update_password(self, user, hashed_password):
+        try:
+            user.update(
+                actions=[User.hashed_password.set(hashed_password)],
+                condition=User.hashed_password == user.hashed_password,
+            )
+        except UpdateError as e:
+            if e.cause_response_code == "ConditionalCheckFailedException":
+                return False
+            raise
+        return True
+
+    def get_todo(self, user_id, todo_id):
+        try:
+            return Todo.get(user_id, todo_id)
+        except Todo.DoesNotExist:
+            if is_time_ordered(todo_id):
+                raise
+        # Legacy id: the item may have been re-keyed, so look it up on the
+        # legacy_id index, which holds only re-keyed items
+        for todo in Todo.legacy_id_index.query(user_id, Todo.legacy_id == todo_id, limit=1):
+            return todo
+        raise Todo.DoesNotExist()
+
+    def put_todo(self, todo, expected_updated_at=None):
+        condition = Todo.updated_at == expected_updated_at if expected_updated_at is not None else None
+        try:
+            todo.save(condition=condition)
+        except PutError as e:
+            if e.cause_response_code == "ConditionalCheckFailedException":
+                raise ConditionFailed()
+            raise
+
+    def _live_key(self, user_id, todo_id):
+        """The todo to address by key; legacy ids cost a lookup, since the item may have been re-keyed."""
+        if is_time_ordered(todo_id):
+            return Todo(user_id=user_id, todo_id=todo_id)
+        todo = self.get_todo(user_id, todo_id)
+        if todo.deleted:
+            raise Todo.DoesNotExist()
+        return todo
+
+    @staticmethod
+    def _live_condition(expected_updated_at=None):
+        # Makes updates no-ops on missing todos and tombstones instead of creating a stub item
+        condition = Todo.user_id.exists() & Todo.deleted.does_not_exist()
+        if expected_updated_at is not None:
+            condition &= Todo.updated_at == expected_updated_at
+        return condition
+
+    @staticmethod
+    def _check_live(todo: Optional[Todo], expected_updated_at=None):
+        """Raise what a failed live condition means for ``todo`` (as currently stored, or None)."""
+        if todo is None or todo.deleted:
+            raise Todo.DoesNotExist()
+        if expected_updated_at is not None and todo.updated_at != expected_updated_at:
+            raise ConditionFailed()
+
+    def _check_failed(self, todo, expected_updated_at=None):
+        """Raise what a failed live condition on ``todo`` means; a consistent read tells which part failed."""
+        if expected_updated_at is None:
+            raise Todo.DoesNotExist()
+        try:
+            current = Todo.get(todo.user_id, todo.todo_id, consistent_read=True)
+        except Todo.DoesNotExist:
+            current = None
+        self._check_live(current, expected_updated_at)
+        raise ConditionFailed()
+
+    def _update(self, todo, actions, expected_updated_at=None):
+        """One UpdateItem that returns the whole new item (ALL_NEW), so there is no read before the write."""
+        try:
+            todo.update(actions=actions, condition=self._live_condition(expected_updated_at))
+        except UpdateError as e:
+            if e.cause_response_code != "ConditionalCheckFailedException":
+                raise
+            self._check_failed(todo, expected_updated_at)
+        return todo
+
+    @staticmethod
+    def _stats_actions(total, completed, at):
+        actions = [TodoStats.updated_at.set(at)]
+        if total:
+            actions.append(TodoStats.total.add(total))
+        if completed:
+            actions.append(TodoStats.completed.add(completed))
+        return actions
+
+    def _ensure_stats(self, user_id):
+        try:
+            self.reconcile_stats(user_id)
+        except ConditionFailed:
+            # Someone else created them meanwhile
+            pass
+
+    def _transact(self, user_id, write, stats_actions):
+        """
+        ``write(transaction)``'s todo writes plus the user's counter update in one TransactWriteItems call.
+
+        Returns None on success, or if any todo write's condition failed,
+        the todo writes' cancellation reasons in order (None for those that
+        didn't fail; with the item as it was, when a write has
+        ``return_values=ALL_OLD``). ``stats_actions`` None leaves the
+        counters alone. Counters that don't exist yet are built from the
+        todos first, and conflicts with concurrent transactions on the same
+        items are retried with backoff.
+        """
+        connection = Todo._get_connection().connection
+        for attempt in range(STATS_MAX_ATTEMPTS):
+            try:
+                with TransactWrite(connection=connection) as transaction:
+                    write(transaction)
+                    if stats_actions is not None:
+                        transaction.update(
+                            TodoStats(user_id=user_id), actions=stats_actions, condition=TodoStats.user_id.exists()
+                        )
+                return None
+            except TransactWriteError as e:
+                reasons = e.cancellation_reasons or []
+                if e.cause_response_code != "TransactionCanceledException" or not reasons:
+                    raise
+                todo_reasons, stats_reason = reasons, None
+                if stats_actions is not None:
+                    todo_reasons, stats_reason = reasons[:-1], reasons[-1]
+                if any(reason is not None and reason.code == "ConditionalCheckFailed" for reason in todo_reasons):
+                    return todo_reasons
+                if attempt + 1 == STATS_MAX_ATTEMPTS:
+                    raise
+                if stats_reason is not None and stats_reason.code == "ConditionalCheckFailed":
+                    self._ensure_stats(user_id)
+                elif any(reason is not None and reason.code == "TransactionConflict" for reason in reasons):
+                    delay = BATCH_BASE_BACKOFF_MS * (2 ** attempt) * (0.5 + random.random() / 2)
+                    time.sleep(delay / 1000)
+                else:
+                    raise
+
+    def create_todo(self, todo):
+        def write(transaction):
+            transaction.save(todo, condition=Todo.todo_id.does_not_exist())
+
+        reasons = self._transact(todo.user_id, write, self._stats_actions(1, int(bool(todo.completed)), todo.updated_at))
+        if reasons is not None:
+            raise ConditionFailed()
+
+    def _counted_update(self, user_id, todo_id, actions, delta, at, expected_updated_at=None):
+        """
+        Apply ``actions`` to a live todo in one transaction with the counter change ``delta(todo)``.
+
+        ``todo`` is the todo as read, and the write is conditional on it
+        still being stored as read (its ``updated_at`` and ``completed``),
+        so the change worked out from it is exact. The read is eventually consistent: if it was stale, or the
+        todo changed since, the cancellation returns the todo as stored
+        (ALL_OLD), and that is tried next. Returns the todo the actions were
+        applied to, as it was before them.
+        """
+        todo = self.get_todo(user_id, todo_id)
+        if expected_updated_at is not None and not todo.deleted and todo.updated_at != expected_updated_at:
+            # Only a consistent read can tell a stale one from a failed precondition
+            todo = Todo.get(user_id, todo.todo_id, consistent_read=True)
+        for _ in range(STATS_MAX_ATTEMPTS):
+            self._check_live(todo, expected_updated_at)
+            total, completed = delta(todo)
+            condition = self._live_condition(todo.updated_at) & (Todo.completed == bool(todo.completed))
+            reasons = self._transact(
+                user_id,
+                lambda transaction: transaction.update(todo, actions=actions, condition=condition, return_values=ALL_OLD),
+                self._stats_actions(total, completed, at) if total or completed else None,
+            )
+            if reasons is None:
+                return todo
+            reason = reasons[0]
+            todo = Todo.from_raw_data(reason.raw_item) if reason.raw_item else None
+        raise ConditionFailed()
+
+    def update_todo(self, user_id, todo_id, changes, at, expected_updated_at=None):
+        actions = [getattr(Todo, name).set(value) for name, value in changes.items()]
+        actions.append(Todo.updated_at.set(at))
+        if "completed" not in changes:
+            return self._update(self._live_key(user_id, todo_id), actions, expected_updated_at)
+
+        completed = bool(changes["completed"])
+        # serialize() isn't involved in updates, so keep status_key in step here
+        status_key = Todo.make_status_key(user_id, completed)
+        actions.append(Todo.status_key.set(status_key))
+        todo = self._counted_update(
+            user_id, todo_id, actions, lambda old: (0, int(completed) - int(bool(old.completed))), at,
+            expected_updated_at,
+        )
+        # Transactions don't return items, but the write applied to exactly this one
+        for name, value in changes.items():
+            setattr(todo, name, value)
+        todo.updated_at = at
+        todo.status_key = status_key
+        return todo
+
+    def tombstone_todo(self, user_id, todo_id, at, ttl):
+        tombstone = Todo(user_id=user_id, todo_id=todo_id)
+        tombstone.mark_deleted(at, ttl)
+        actions = [
+            Todo.deleted.set(True),
+            Todo.updated_at.set(tombstone.updated_at),
+            Todo.expires_at.set(tombstone.expires_at),
+            Todo.status_key.remove(),
+        ]
+        todo = self._counted_update(
+            user_id, todo_id, actions, lambda old: (-1, -int(bool(old.completed))), tombstone.updated_at
+        )
+        # A legacy id resolves to the item's current key
+        tombstone.todo_id = todo.todo_id
+        return tombstone
+
+    def delete_todo(self, todo):
+        todo.delete()
+
+    def conditional_batch_write(self, user_id, writes):
+        # One transaction per chunk (25 puts plus the counters, well under
+        # TransactWriteItems' 100). It is all or nothing, so items whose
+        # condition failed are dropped and the rest retried.
+        conflicts = set()
+        pending = list(writes)
+        while pending:
+            deltas = [_stats_delta(todo, before) for todo, before in pending]
+            total, completed = sum(delta[0] for delta in deltas), sum(delta[1] for delta in deltas)
+            at = max(_utc(todo.updated_at) for todo, _ in pending)
+
+            def write(transaction):
+                for todo, before in pending:
+                    if before is None:
+                        condition = Todo.todo_id.does_not_exist()
+                    else:
+                        condition = self._live_condition(before.updated_at)
+                    transaction.save(todo, condition=condition)
+
+            reasons = self._transact(
+                user_id, write, self._stats_actions(total, completed, at) if total or completed else None
+            )
+            if reasons is None:
+                break
+            failed = {
+                position for position, reason in enumerate(reasons)
+                if reason is not None and reason.code == "ConditionalCheckFailed"
+            }
+            conflicts.update(pending[position][0].todo_id for position in failed)
+            pending = [write for position, write in enumerate(pending) if position not in failed]
+        return conflicts
+
+    def batch_get_todos(self, user_id, todo_ids):
+        return list(Todo.batch_get([(user_id, todo_id) for todo_id in todo_ids]))
+
+    def batch_write(self, puts, deletes):
+        """One BatchWriteItem call, retrying unprocessed items with backoff."""
+        connection = Todo._get_connection()
+        put_items = [todo.serialize() for todo in puts]
+        delete_items = [todo._get_keys() for todo in deletes]
+
+        for attempt in range(BATCH_MAX_ATTEMPTS):
+            data = connection.batch_write_item(put_items=put_items, delete_items=delete_items) or {}
+            unprocessed = data.get("UnprocessedItems", {}).get(Todo.Meta.table_name, [])
+            if not unprocessed:
+                return set()
+            put_items = [request["PutRequest"]["Item"] for request in unprocessed if "PutRequest" in request]
+            delete_items = [request["DeleteRequest"]["Key"] for request in unprocessed if "DeleteRequest" in request]
+            if attempt + 1 < BATCH_MAX_ATTEMPTS:
+                # Unprocessed items mean the table is throttling; back off with jitter
+                delay = BATCH_BASE_BACKOFF_MS * (2 ** attempt) * (0.5 + random.random() / 2)
+                time.sleep(delay / 1000)
+        return {_request_key(request) for request in unprocessed}
+
+    def _plan(self, user_id, completed, sort, order, since, fields):
+        """
+        Pick the table or index that answers a list query.
+
+        Returns ``(target, hash_key, query_kwargs)``. Filtering on
+        ``completed`` uses the status indexes so only matching items are
+        read; index reads are eventually consistent. ``since`` becomes a
+        key-range condition wherever the range key is ordered by creation
+        time.
+        """
+        if completed is None:
+            target = {
+                None: Todo,
+                "created_at": Todo.created_at_index,
+                "updated_at": Todo.updated_at_index,
+            }[sort]
+            hash_key = user_id
+        else:
+            target = Todo.status_updated_at_index if sort == "updated_at" else Todo.status_created_at_index
+            hash_key = Todo.make_status_key(user_id, completed)
+
+        query_kwargs = {"scan_index_forward": order == "asc"}
+        filters = []
+        if target in (Todo, Todo.created_at_index, Todo.updated_at_index):
+            # Tombstones have no status_key, so the status indexes never see them
+            filters.append(Todo.deleted.does_not_exist())
+        if since is not None:
+            if target in (Todo.created_at_index, Todo.status_created_at_index):
+                query_kwargs["range_key_condition"] = Todo.created_at >= since
+            else:
+                if target is Todo and id_generator.time_ordered:
+                    query_kwargs["range_key_condition"] = Todo.todo_id >= id_generator.floor(since)
+                # Also filter, so un-migrated UUID4 rows inside the key range are exact
+                filters.append(Todo.created_at >= since)
+        if filters:
+            query_kwargs["filter_condition"] = functools.reduce(operator.and_, filters)
+        if fields:
+            # Keep key attributes in the projection so a cursor can always be
+            # rebuilt from the last item returned.
+            attributes = set(fields) | {"user_id", "todo_id"}
+            if target is not Todo:
+                attributes |= set(target.Meta.attributes)
+            query_kwargs["attributes_to_get"] = sorted(attributes)
+        return target, hash_key, query_kwargs
+
+    def query_todos(self, user_id, completed=None, sort=None, order="asc", since=None, fields=None,
+                    limit=None, start_key=None):
+        target, hash_key, query_kwargs = self._plan(user_id, completed, sort, order, since, fields)
+        if limit is None:
+            return list(target.query(hash_key, last_evaluated_key=start_key, **query_kwargs)), None
+        return query_page(target, hash_key, limit, start_key, **query_kwargs)
+
+    def query_changes(self, user_id, since, limit, start_key=None):
+        return query_page(
+            Todo.updated_at_index, user_id, limit, start_key, range_key_condition=Todo.updated_at >= since
+        )
+
+    def last_change(self, user_id):
+        for todo in Todo.updated_at_index.query(
+            user_id, scan_index_forward=False, limit=1, attributes_to_get=["updated_at"]
+        ):
+            return todo.updated_at
+        return None
+
+    def scan_todos(self):
+        return Todo.scan(filter_condition=Todo.deleted.does_not_exist())
+
+    def get_stats(self, user_id):
+        try:
+            return TodoStats.get(user_id)
+        except TodoStats.DoesNotExist:
+            return None
+
+    def put_stats(self, stats, before):
+        if before is None:
+            condition = TodoStats.user_id.does_not_exist()
+        elif before.updated_at is None:
+            condition = TodoStats.updated_at.does_not_exist()
+        else:
+            condition = TodoStats.updated_at == before.updated_at
+        try:
+            stats.save(condition=condition)
+        except PutError as e:
+            if e.cause_response_code == "ConditionalCheckFailedException":
+                return False
+            raise
+        return True
+
+    def scan_stats(self):
+        return TodoStats.scan()
+
+    def cursor_scope(self, user_id, completed, sort):
+        target, hash_key, _ = self._plan(user_id, completed, sort, "asc", None, None)
+        return user_id if target is Todo else f"{hash_key}|{target.Meta.index_name}"
+
+
+def _todo_record(todo: Todo) -> dict:
+    record = {name: getattr(todo, name) for name in TODO_ATTRIBUTES}
+    record["completed"] = bool(record["completed"])
+    record["deleted"] = True if record["deleted"] else None
+    for name in TIMESTAMP_ATTRIBUTES:
+        record[name] = _utc(record[name])
+    return record
+
+
+class MemoryStorage(Storage):
+    """
+    Everything in process memory, for load tests and local development.
+
+    Each user's todos are kept in one dict plus sorted ``(key, todo_id)``
+    lists per list ordering and status, so list queries bisect to their
+    start position instead of scanning and sorting. Tombstones only appear
+    in the changes index and are purged once expired. Stats are the index
+    lengths, so only when they last changed is stored.
+    """
+
+    name = "memory"
+    batch_write_limit = 500
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._users = {}
+        self._todos = {}
+        self._indexes = {}
+        self._tombstones = {}
+        self._stats_updated_at = {}
+
+    @staticmethod
+    def _index_entries(record: dict):
+        """(index name, entry) pairs for every index the record appears in."""
+        yield CHANGES_INDEX, (record["updated_at"], record["todo_id"])
+        if record["deleted"]:
+            return
+        for sort, key in ORDER_KEYS.items():
+            entry = tuple(record[name] for name in key)
+            yield (None, sort), entry
+            if sort is not None:
+                yield (record["completed"], sort), entry
+
+    def _unindex(self, record: dict):
+        indexes = self._indexes[record["user_id"]]
+        for name, entry in self._index_entries(record):
+            entries = indexes[name]
+            position = bisect.bisect_left(entries, entry)
+            if position < len(entries) and entries[position] == entry:
+                del entries[position]
+
+    def _put(self, record: dict):
+        todos = self._todos.setdefault(record["user_id"], {})
+        old = todos.get(record["todo_id"])
+        if old is not None:
+            self._unindex(old)
+        if old is None or (old["deleted"], old["completed"]) != (record["deleted"], record["completed"]):
+            self._stats_updated_at[record["user_id"]] = record["updated_at"]
+        todos[record["todo_id"]] = record
+        tombstones = self._tombstones.setdefault(record["user_id"], set())
+        if record["deleted"]:
+            tombstones.add(record["todo_id"])
+        else:
+            tombstones.discard(record["todo_id"])
+        indexes = self._indexes.setdefault(record["user_id"], {})
+        for name, entry in self._index_entries(record):
+            bisect.insort(indexes.setdefault(name, []), entry)
+
+    def _delete(self, user_id: str, todo_id: str):
+        record = self._todos.get(user_id, {}).pop(todo_id, None)
+        if record is not None:
+            self._unindex(record)
+            self._tombstones[user_id].discard(todo_id)
+            if not record["deleted"]:
+                self._stats_updated_at[user_id] = datetime.now(timezone.utc)
+
+    def _purge_expired(self, user_id: str):
+        todos = self._todos.get(user_id, {})
+        now = datetime.now(timezone.utc)
+        expired = [
+            todo_id for todo_id in self._tombstones.get(user_id, ())
+            if todos[todo_id]["expires_at"] is not None and todos[todo_id]["expires_at"] <= now
+        ]
+        for todo_id in expired:
+            self._delete(user_id, todo_id)
+
+    def get_user(self, username):
+        with self._lock:
+            hashed_password = self._users.get(username)
+        if hashed_password is None:
+            return None
+        return User(username=username, hashed_password=hashed_password)
+
+    def put_user(self, user):
+        with self._lock:
+            self._users[user.username] = user.hashed_password
+
+    def update_password(self, user, hashed_password):
+        with self._lock:
+            if self._users.get(user.username) != user.hashed_password:
+                return False
+            self._users[user.username] = hashed_password
+        user.hashed_password = hashed_password
+        return True
+
+    def get_todo(self, user_id, todo_id):
+        with self._lock:
+            record = self._todos.get(user_id, {}).get(todo_id)
+        if record is None:
+            raise Todo.DoesNotExist()
+        return Todo(**record)
+
+    def put_todo(self, todo, expected_updated_at=None):
+        record = _todo_record(todo)
+        with self._lock:
+            if expected_updated_at is not None:
+                old = self._todos.get(todo.user_id, {}).get(todo.todo_id)
+                if old is None or old["updated_at"] != _utc(expected_updated_at):
+                    raise ConditionFailed()
+            self._put(record)
+
+    def create_todo(self, todo):
+        record = _todo_record(todo)
+        with self._lock:
+            if todo.todo_id in self._todos.get(todo.user_id, {}):
+                raise ConditionFailed()
+            self._put(record)
+
+    def conditional_batch_write(self, user_id, writes):
+        conflicts = set()
+        with self._lock:
+            for todo, before in writes:
+                old = self._todos.get(user_id, {}).get(todo.todo_id)
+                if before is None:
+                    current = old is None
+                else:
+                    current = old is not None and not old["deleted"] and old["updated_at"] == _utc(before.updated_at)
+                if current:
+                    self._put(_todo_record(todo))
+                else:
+                    conflicts.add(todo.todo_id)
+        return conflicts
+
+    def _live_record(self, user_id, todo_id):
+        record = self._todos.get(user_id, {}).get(todo_id)
+        if record is None or record["deleted"]:
+            raise Todo.DoesNotExist()
+        return record
+
+    def update_todo(self, user_id, todo_id, changes, at, expected_updated_at=None):
+        with self._lock:
+            old = self._live_record(user_id, todo_id)
+            if expected_updated_at is not None and old["updated_at"] != _utc(expected_updated_at):
+                raise ConditionFailed()
+            todo = Todo(**old)
+            for name, value in changes.items():
+                setattr(todo, name, value)
+            todo.updated_at = at
+            record = _todo_record(todo)
+            self._put(record)
+        return Todo(**record)
+
+    def tombstone_todo(self, user_id, todo_id, at, ttl):
+        with self._lock:
+            todo = Todo(**self._live_record(user_id, todo_id))
+            todo.mark_deleted(at, ttl)
+            record = _todo_record(todo)
+            self._put(record)
+        return Todo(**record)
+
+    def delete_todo(self, todo):
+        with self._lock:
+            self._delete(todo.user_id, todo.todo_id)
+
+    def batch_get_todos(self, user_id, todo_ids):
+        with self._lock:
+            todos = self._todos.get(user_id, {})
+            records = [todos[todo_id] for todo_id in todo_ids if todo_id in todos]
+        return [Todo(**record) for record in records]
+
+    def batch_write(self, puts, deletes):
+        records = [_todo_record(todo) for todo in puts]
+        with self._lock:
+            for record in records:
+                self._put(record)
+            for todo in deletes:
+                self._delete(todo.user_id, todo.todo_id)
+        return set()
+
+    def query_todos(self, user_id, completed=None, sort=None, order="asc", since=None, fields=None,
+                    limit=None, start_key=None):
+        sort = _list_sort(completed, sort)
+        key = ORDER_KEYS[sort]
+        since = _utc(since) if since is not None else None
+        start = None
+        if start_key:
+            start = tuple(
+                _parse_timestamp(start_key[name]) if name in TIMESTAMP_ATTRIBUTES else start_key[name]
+                for name in key
+            )
+
+        items, last_key = [], None
+        with self._lock:
+            todos = self._todos.get(user_id, {})
+            entries = self._indexes.get(user_id, {}).get((completed, sort), [])
+            if order == "asc":
+                if start is not None:
+                    first = bisect.bisect_right(entries, start)
+                elif since is not None and sort == "created_at":
+                    first = bisect.bisect_left(entries, (since,))
+                else:
+                    first = 0
+                positions = range(first, len(entries))
+            else:
+                end = bisect.bisect_left(entries, start) if start is not None else len(entries)
+                positions = range(end - 1, -1, -1)
+
+            for position in positions:
+                record = todos[entries[position][-1]]
+                if since is not None and record["created_at"] < since:
+                    if sort == "created_at":
+                        # Descending by creation time: everything after is older
+                        break
+                    continue
+                if limit is not None and len(items) == limit:
+                    last_key = {
+                        name: _format_timestamp(items[-1][name]) if name in TIMESTAMP_ATTRIBUTES else items[-1][name]
+                        for name in key
+                    }
+                    break
+                items.append(record)
+        return [Todo(**record) for record in items], last_key
+
+    def last_change(self, user_id):
+        with self._lock:
+            entries = self._indexes.get(user_id, {}).get(CHANGES_INDEX)
+            return entries[-1][0] if entries else None
+
+    def query_changes(self, user_id, since, limit, start_key=None):
+        if start_key:
+            start = tuple(
+                _parse_timestamp(start_key[name]) if name in TIMESTAMP_ATTRIBUTES else start_key[name]
+                for name in CHANGES_KEY
+            )
+        else:
+            start = None
+        with self._lock:
+            self._purge_expired(user_id)
+            todos = self._todos.get(user_id, {})
+            entries = self._indexes.get(user_id, {}).get(CHANGES_INDEX, [])
+            if start is not None:
+                first = bisect.bisect_right(entries, start)
+            else:
+                first = bisect.bisect_left(entries, (_utc(since),))
+            records = [todos[entry[-1]] for entry in entries[first:first + limit + 1]]
+        last_key = None
+        if len(records) > limit:
+            records = records[:limit]
+            last_key = {
+                name: _format_timestamp(records[-1][name]) if name in TIMESTAMP_ATTRIBUTES else records[-1][name]
+                for name in CHANGES_KEY
+            }
+        return [Todo(**record) for record in records], last_key
+
+    def scan_todos(self):
+        with self._lock:
+            records = [record for todos in self._todos.values() for record in todos.values() if not record["deleted"]]
+        return [Todo(**record) for record in records]
+
+    def _stats(self, user_id):
+        indexes = self._indexes.get(user_id, {})
+        return TodoStats(
+            user_id=user_id,
+            total=len(indexes.get((None, "created_at"), ())),
+            completed=len(indexes.get((True, "created_at"), ())),
+            updated_at=self._stats_updated_at[user_id],
+        )
+
+    def get_stats(self, user_id):
+        with self._lock:
+            if user_id not in self._stats_updated_at:
+                return None
+            return self._stats(user_id)
+
+    def put_stats(self, stats, before):
+        with self._lock:
+            exists = stats.user_id in self._stats_updated_at
+            if exists != (before is not None):
+                return False
+            if exists and self._stats_updated_at[stats.user_id] != before.updated_at:
+                return False
+            self._stats_updated_at[stats.user_id] = _utc(stats.updated_at) if stats.updated_at else None
+        return True
+
+    def scan_stats(self):
+        with self._lock:
+            return [self._stats(user_id) for user_id in self._stats_updated_at]
+
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    username TEXT PRIMARY KEY,
+    hashed_password TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS todos (
+    user_id TEXT NOT NULL,
+    todo_id TEXT NOT NULL,
+    title TEXT NOT NULL,
+    description TEXT,
+    completed INTEGER NOT NULL DEFAULT 0,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    legacy_id TEXT,
+    deleted INTEGER NOT NULL DEFAULT 0,
+    expires_at TEXT,
+    PRIMARY KEY (user_id, todo_id)
+);
+CREATE TABLE IF NOT EXISTS todo_stats (
+    user_id TEXT PRIMARY KEY,
+    total INTEGER NOT NULL DEFAULT 0,
+    completed INTEGER NOT NULL DEFAULT 0,
+    updated_at TEXT
+);
+"""
+
+# Created after SQLITE_MIGRATIONS, so files from before a column existed get it first
+SQLITE_INDEXES = """
+CREATE INDEX IF NOT EXISTS todos_created_at ON todos (user_id, created_at, todo_id);
+CREATE INDEX IF NOT EXISTS todos_updated_at ON todos (user_id, updated_at, todo_id);
+CREATE INDEX IF NOT EXISTS todos_completed_created_at ON todos (user_id, completed, created_at, todo_id);
+CREATE INDEX IF NOT EXISTS todos_completed_updated_at ON todos (user_id, completed, updated_at, todo_id);
+CREATE INDEX IF NOT EXISTS todos_expires_at ON todos (user_id, expires_at) WHERE expires_at IS NOT NULL;
+"""
+
+# Columns added to the todos table after it first shipped, with their definitions
+SQLITE_MIGRATIONS = (
+    ("deleted", "INTEGER NOT NULL DEFAULT 0"),
+    ("expires_at", "TEXT"),
+)
+
+_TODO_COLUMNS = ", ".join(TODO_ATTRIBUTES)
+
+
+class SQLiteStorage(Storage):
+    """
+    A SQLite database file in WAL mode, so reads don't block the writer.
+
+    Each worker thread gets its own connection. Lists are keyset-paginated
+    over the ``(user_id[, completed], <timestamp>, todo_id)`` indexes.
+    SQLite allows one writer at a time, so writes from this process queue
+    on a lock rather than spinning in the busy handler, where concurrent
+    writers can starve each other past ``busy_timeout``. Counted writes
+    adjust ``todo_stats`` in the same transaction.
+    """
+
+    name = "sqlite"
+    batch_write_limit = 500
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        connection = self._connection()
+        connection.executescript(SQLITE_SCHEMA)
+        columns = {row[1] for row in connection.execute("PRAGMA table_info(todos)")}
+        for name, definition in SQLITE_MIGRATIONS:
+            if name not in columns:
+                connection.execute(f"ALTER TABLE todos ADD COLUMN {name} {definition}")
+        connection.executescript(SQLITE_INDEXES)
+
+    def _connection(self) -> "sqlite3.Connection":
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            import sqlite3
+
+            connection = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute("PRAGMA busy_timeout=5000")
+            self._local.connection = connection
+        return connection
+
+    @contextmanager
+    def _transaction(self):
+        connection = self._connection()
+        with self._write_lock:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield connection
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+
+    @staticmethod
+    def _ensure_stats(connection: "sqlite3.Connection", user_id: str) -> bool:
+        """Count the user's todos into their stats row if there is none yet; True if it was created."""
+        cursor = connection.execute(
+            "INSERT OR IGNORE INTO todo_stats (user_id, total, completed, updated_at) "
+            "SELECT ?, COUNT(*), COALESCE(SUM(completed), 0), MAX(updated_at) FROM todos "
+            "WHERE user_id = ? AND deleted = 0",
+            (user_id, user_id),
+        )
+        return cursor.rowcount == 1
+
+    @staticmethod
+    def _add_stats(connection: "sqlite3.Connection", user_id: str, total: int, completed: int, at: str):
+        connection.execute(
+            "UPDATE todo_stats SET total = total + ?, completed = completed + ?, updated_at = ? WHERE user_id = ?",
+            (total, completed, at, user_id),
+        )
+
+    @staticmethod
+    def _row(todo: Todo) -> tuple:
+        record = _todo_record(todo)
+        record["completed"] = int(record["completed"])
+        record["deleted"] = int(bool(record["deleted"]))
+        for name in TIMESTAMP_ATTRIBUTES + ("expires_at",):
+            if record[name] is not None:
+                record[name] = _format_timestamp(record[name])
+        return tuple(record[name] for name in TODO_ATTRIBUTES)
+
+    @staticmethod
+    def _todo(row: tuple) -> Todo:
+        record = dict(zip(TODO_ATTRIBUTES, row))
+        record["completed"] = bool(record["completed"])
+        record["deleted"] = True if record["deleted"] else None
+        for name in TIMESTAMP_ATTRIBUTES + ("expires_at",):
+            if record[name] is not None:
+                record[name] = _parse_timestamp(record[name])
+        return Todo(**record)
+
+    def get_user(self, username):
+        row = self._connection().execute(
+            "SELECT hashed_password FROM users WHERE username = ?", (username,)
+        ).fetchone()
+        if row is None:
+            return None
+        return User(username=username, hashed_password=row[0])
+
+    def put_user(self, user):
+        with self._write_lock:
+            self._connection().execute(
+                "INSERT OR REPLACE INTO users (username, hashed_password) VALUES (?, ?)",
+                (user.username, user.hashed_password),
+            )
+
+    def update_password(self, user, hashed_password):
+        with self._write_lock:
+            cursor = self._connection().execute(
+                "UPDATE users SET hashed_password = ? WHERE username = ? AND hashed_password = ?",
+                (hashed_password, user.username, user.hashed_password),
+            )
+        if cursor.rowcount != 1:
+            return False
+        user.hashed_password = hashed_password
+        return True
+
+    def get_todo(self, user_id, todo_id):
+        row = self._connection().execute(
+            f"SELECT {_TODO_COLUMNS} FROM todos WHERE user_id = ? AND todo_id = ?", (user_id, todo_id)
+        ).fetchone()
+        if row is None:
+            raise Todo.DoesNotExist()
+        return self._todo(row)
+
+    def put_todo(self, todo, expected_updated_at=None):
+        row = self._row(todo)
+        connection = self._connection()
+        if expected_updated_at is None:
+            with self._write_lock:
+                connection.execute(
+                    f"INSERT OR REPLACE INTO todos ({_TODO_COLUMNS}) VALUES ({', '.join('?' for _ in row)})", row
+                )
+            return
+        assignments = ", ".join(f"{name} = ?" for name in TODO_ATTRIBUTES[2:])
+        with self._write_lock:
+            cursor = connection.execute(
+                f"UPDATE todos SET {assignments} WHERE user_id = ? AND todo_id = ? AND updated_at = ?",
+                row[2:] + row[:2] + (_format_timestamp(expected_updated_at),),
+            )
+        if cursor.rowcount != 1:
+            raise ConditionFailed()
+
+    def create_todo(self, todo):
+        import sqlite3
+
+        row = self._row(todo)
+        try:
+            with self._transaction() as connection:
+                self._ensure_stats(connection, todo.user_id)
+                connection.execute(
+                    f"INSERT INTO todos ({_TODO_COLUMNS}) VALUES ({', '.join('?' for _ in row)})", row
+                )
+                self._add_stats(connection, todo.user_id, 1, int(bool(todo.completed)), _format_timestamp(todo.updated_at))
+        except sqlite3.IntegrityError:
+            raise ConditionFailed()
+
+    def _update(self, user_id, todo_id, values: dict, expected_updated_at=None, stats=None):
+        """
+        One UPDATE ... RETURNING on a live todo.
+
+        ``stats(old_completed)`` gives the ``(total, completed)`` counter
+        deltas for the write, applied in the same transaction.
+        """
+        where, params = "user_id = ? AND todo_id = ? AND deleted = 0", [user_id, todo_id]
+        if expected_updated_at is not None:
+            where += " AND updated_at = ?"
+            params.append(_format_timestamp(expected_updated_at))
+        assignments = ", ".join(f"{name} = ?" for name in values)
+        with self._transaction() as connection:
+            if stats is not None:
+                self._ensure_stats(connection, user_id)
+                old = connection.execute(
+                    "SELECT completed FROM todos WHERE user_id = ? AND todo_id = ?", (user_id, todo_id)
+                ).fetchone()
+            rows = connection.execute(
+                f"UPDATE todos SET {assignments} WHERE {where} RETURNING {_TODO_COLUMNS}",
+                [*values.values(), *params],
+            ).fetchall()
+            if rows and stats is not None and any(stats(bool(old[0]))):
+                self._add_stats(connection, user_id, *stats(bool(old[0])), values["updated_at"])
+        if rows:
+            return self._todo(rows[0])
+        if expected_updated_at is not None and not self.get_todo(user_id, todo_id).deleted:
+            raise ConditionFailed()
+        raise Todo.DoesNotExist()
+
+    def update_todo(self, user_id, todo_id, changes, at, expected_updated_at=None):
+        values = {name: int(bool(value)) if name == "completed" else value for name, value in changes.items()}
+        values["updated_at"] = _format_timestamp(at)
+        stats = None
+        if "completed" in values:
+            stats = lambda old_completed: (0, values["completed"] - int(old_completed))
+        return self._update(user_id, todo_id, values, expected_updated_at, stats)
+
+    def tombstone_todo(self, user_id, todo_id, at, ttl):
+        tombstone = Todo(user_id=user_id, todo_id=todo_id)
+        tombstone.mark_deleted(at, ttl)
+        return self._update(user_id, todo_id, {
+            "deleted": 1,
+            "updated_at": _format_timestamp(tombstone.updated_at),
+            "expires_at": _format_timestamp(tombstone.expires_at),
+        }, stats=lambda old_completed: (-1, -int(old_completed)))
+
+    def delete_todo(self, todo):
+        with self._write_lock:
+            self._connection().execute(
+                "DELETE FROM todos WHERE user_id = ? AND todo_id = ?", (todo.user_id, todo.todo_id)
+            )
+
+    def batch_get_todos(self, user_id, todo_ids):
+        if not todo_ids:
+            return []
+        rows = self._connection().execute(
+            f"SELECT {_TODO_COLUMNS} FROM todos WHERE user_id = ? AND todo_id IN ({', '.join('?' for _ in todo_ids)})",
+            (user_id, *todo_ids),
+        ).fetchall()
+        return [self._todo(row) for row in rows]
+
+    def conditional_batch_write(self, user_id, writes):
+        conflicts = set()
+        total = completed = 0
+        at = None
+        assignments = ", ".join(f"{name} = ?" for name in TODO_ATTRIBUTES[2:])
+        with self._transaction() as connection:
+            self._ensure_stats(connection, user_id)
+            for todo, before in writes:
+                row = self._row(todo)
+                if before is None:
+                    cursor = connection.execute(
+                        f"INSERT OR IGNORE INTO todos ({_TODO_COLUMNS}) VALUES ({', '.join('?' for _ in row)})", row
+                    )
+                else:
+                    cursor = connection.execute(
+                        f"UPDATE todos SET {assignments} WHERE user_id = ? AND todo_id = ? AND deleted = 0 AND updated_at = ?",
+                        row[2:] + row[:2] + (_format_timestamp(before.updated_at),),
+                    )
+                if cursor.rowcount != 1:
+                    conflicts.add(todo.todo_id)
+                    continue
+                delta = _stats_delta(todo, before)
+                total, completed = total + delta[0], completed + delta[1]
+                at = max(at, _utc(todo.updated_at)) if at else _utc(todo.updated_at)
+            if total or completed:
+                self._add_stats(connection, user_id, total, completed, _format_timestamp(at))
+        return conflicts
+
+    def batch_write(self, puts, deletes):
+        rows = [self._row(todo) for todo in puts]
+        keys = [(todo.user_id, todo.todo_id) for todo in deletes]
+        with self._transaction() as connection:
+            connection.executemany(
+                f"INSERT OR REPLACE INTO todos ({_TODO_COLUMNS}) VALUES ({', '.join('?' for _ in TODO_ATTRIBUTES)})",
+                rows,
+            )
+            connection.executemany("DELETE FROM todos WHERE user_id = ? AND todo_id = ?", keys)
+        return set()
+
+    def query_todos(self, user_id, completed=None, sort=None, order="asc", since=None, fields=None,
+                    limit=None, start_key=None):
+        sort = _list_sort(completed, sort)
+        key = ORDER_KEYS[sort]
+        where, params = ["user_id = ?", "deleted = 0"], [user_id]
+        if completed is not None:
+            where.append("completed = ?")
+            params.append(int(completed))
+        if since is not None:
+            where.append("created_at >= ?")
+            params.append(_format_timestamp(since))
+        if start_key:
+            where.append(f"({', '.join(key)}) {'>' if order == 'asc' else '<'} ({', '.join('?' for _ in key)})")
+            params.extend(start_key[name] for name in key)
+        direction = "ASC" if order == "asc" else "DESC"
+        sql = (
+            f"SELECT {_TODO_COLUMNS} FROM todos WHERE {' AND '.join(where)} "
+            f"ORDER BY {', '.join(f'{name} {direction}' for name in key)}"
+        )
+        if limit is not None:
+            # One extra row tells us whether there is a next page
+            sql += " LIMIT ?"
+            params.append(limit + 1)
+
+        rows = self._connection().execute(sql, params).fetchall()
+        last_key = None
+        if limit is not None and len(rows) > limit:
+            rows = rows[:limit]
+            last = dict(zip(TODO_ATTRIBUTES, rows[-1]))
+            last_key = {name: last[name] for name in key}
+        return [self._todo(row) for row in rows], last_key
+
+    def last_change(self, user_id):
+        row = self._connection().execute("SELECT MAX(updated_at) FROM todos WHERE user_id = ?", (user_id,)).fetchone()
+        return _parse_timestamp(row[0]) if row[0] else None
+
+    def query_changes(self, user_id, since, limit, start_key=None):
+        connection = self._connection()
+        with self._write_lock:
+            connection.execute(
+                "DELETE FROM todos WHERE user_id = ? AND expires_at IS NOT NULL AND expires_at <= ?",
+                (user_id, _format_timestamp(datetime.now(timezone.utc))),
+            )
+        where, params = ["user_id = ?", "updated_at >= ?"], [user_id, _format_timestamp(since)]
+        if start_key:
+            where.append(f"({', '.join(CHANGES_KEY)}) > ({', '.join('?' for _ in CHANGES_KEY)})")
+            params.extend(start_key[name] for name in CHANGES_KEY)
+        rows = connection.execute(
+            f"SELECT {_TODO_COLUMNS} FROM todos WHERE {' AND '.join(where)} "
+            f"ORDER BY {', '.join(CHANGES_KEY)} LIMIT ?",
+            params + [limit + 1],
+        ).fetchall()
+        last_key = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last = dict(zip(TODO_ATTRIBUTES, rows[-1]))
+            last_key = {name: last[name] for name in CHANGES_KEY}
+        return [self._todo(row) for row in rows], last_key
+
+    def scan_todos(self):
+        cursor = self._connection().execute(f"SELECT {_TODO_COLUMNS} FROM todos WHERE deleted = 0")
+        return (self._todo(row) for row in cursor)
+
+    @staticmethod
+    def _stats(row: tuple) -> TodoStats:
+        user_id, total, completed, updated_at = row
+        return TodoStats(
+            user_id=user_id, total=total, completed=completed,
+            updated_at=_parse_timestamp(updated_at) if updated_at else None,
+        )
+
+    def get_stats(self, user_id):
+        row = self._connection().execute(
+            "SELECT user_id, total, completed, updated_at FROM todo_stats WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        return self._stats(row) if row else None
+
+    def put_stats(self, stats, before):
+        updated_at = _format_timestamp(stats.updated_at) if stats.updated_at else None
+        with self._write_lock:
+            if before is None:
+                cursor = self._connection().execute(
+                    "INSERT OR IGNORE INTO todo_stats (user_id, total, completed, updated_at) VALUES (?, ?, ?, ?)",
+                    (stats.user_id, stats.total, stats.completed, updated_at),
+                )
+            else:
+                cursor = self._connection().execute(
+                    "UPDATE todo_stats SET total = ?, completed = ?, updated_at = ? WHERE user_id = ? AND updated_at IS ?",
+                    (stats.total, stats.completed, updated_at, stats.user_id,
+                     _format_timestamp(before.updated_at) if before.updated_at else None),
+                )
+        return cursor.rowcount == 1
+
+    def scan_stats(self):
+        cursor = self._connection().execute("SELECT user_id, total, completed, updated_at FROM todo_stats")
+        return (self._stats(row) for row in cursor)
+
+
+BACKENDS = {"dynamodb": DynamoDBStorage, "memory": MemoryStorage, "sqlite": SQLiteStorage}
+
+
+def build_storage() -> Storage:
+    """Create the backend selected by STORAGE_BACKEND."""
+    name = os.getenv("STORAGE_BACKEND", "dynamodb").lower()
+    if name not in BACKENDS:
+        raise RuntimeError(f"Unknown STORAGE_BACKEND '{name}'")
+    if name == "sqlite":
+        return SQLiteStorage(os.getenv("SQLITE_PATH", os.path.join(os.path.dirname(__file__), "todo.db")))
+    return BACKENDS[name]()
+
+
+storage = build_storage()
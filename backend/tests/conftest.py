@@ -0,0 +1,76 @@
+"""
+Shared fixtures for the API tests.
+
+The app runs in-process through Starlette's TestClient against the memory
+and SQLite storage backends, so no AWS account (or moto) is needed. Every
+test is run once per backend, with a fresh user.
+
+    cd backend && python -m pytest -q
+"""
+import os
+import sys
+import uuid
+
+import pytest
+
+# Settings are read at import time, so they go in before the app is imported
+os.environ.setdefault("MY_AWS_SECRET_ACCESS_KEY", "test-secret")
+os.environ["STORAGE_BACKEND"] = "memory"
+os.environ["RATE_LIMIT_ENABLED"] = "false"
+os.environ["BCRYPT_ROUNDS"] = "4"
+os.environ["PASSWORD_POOL_KIND"] = "thread"
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.testclient import TestClient
+
+import batch
+import changes
+import main
+import search
+import stats
+import storage as storage_module
+import transfer
+
+# Modules holding their own reference to the storage backend
+STORAGE_USERS = (main, batch, changes, search, stats, transfer, storage_module)
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def storage(request, tmp_path, monkeypatch):
+    """A fresh storage backend, installed everywhere the app looks it up."""
+    if request.param == "sqlite":
+        backend = storage_module.SQLiteStorage(str(tmp_path / "todo.db"))
+    else:
+        backend = storage_module.MemoryStorage()
+    for module in STORAGE_USERS:
+        monkeypatch.setattr(module, "storage", backend)
+    return backend
+
+
+@pytest.fixture(scope="session")
+def app_client():
+    # Once per session: leaving the lifespan shuts the worker pools down
+    with TestClient(main.app) as client:
+        yield client
+
+
+@pytest.fixture
+def client(app_client, storage):
+    return app_client
+
+
+@pytest.fixture
+def user(client):
+    """A registered user's id and Authorization header."""
+    username = f"user-{uuid.uuid4().hex[:12]}"
+    response = client.post("/register", json={"username": username, "password": "pw"})
+    assert response.status_code == 200, response.text
+    response = client.post("/token", data={"username": username, "password": "pw"})
+    assert response.status_code == 200, response.text
+    return username, {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+@pytest.fixture
+def auth(user):
+    return user[1]
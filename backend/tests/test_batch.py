@@ -0,0 +1,85 @@
+"""Batch operations and the conditional batch writes under them."""
+from datetime import datetime, timedelta, timezone
+
+from models import Todo
+
+
+def run(client, auth, operations):
+    response = client.post("/todos:batch", json={"operations": operations}, headers=auth)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def stats(client, auth):
+    body = client.get("/todos/stats", headers=auth).json()
+    return body["total"], body["completed"]
+
+
+def test_batch(client, auth):
+    result = run(client, auth, [{"op": "create", "title": f"Todo {i}"} for i in range(3)])
+    assert result["succeeded"] == 3
+    ids = [item["id"] for item in result["results"]]
+    assert [item["todo"]["title"] for item in result["results"]] == ["Todo 0", "Todo 1", "Todo 2"]
+
+    result = run(client, auth, [
+        {"op": "complete", "id": ids[0]},
+        {"op": "update", "id": ids[1], "title": "Renamed", "completed": True},
+        {"op": "delete", "id": ids[2]},
+        {"op": "update", "id": "missing", "title": "Nope"},
+        {"op": "create"},
+        {"op": "delete"},
+    ])
+    assert [item["status"] for item in result["results"]] == [200, 200, 200, 404, 400, 400]
+    assert (result["succeeded"], result["failed"]) == (3, 3)
+
+    todos = client.get("/todos", headers=auth).json()
+    assert [(todo["title"], todo["completed"]) for todo in todos] == [("Todo 0", True), ("Renamed", True)]
+    assert stats(client, auth) == (2, 2)
+
+
+def test_batch_duplicate_id(client, auth):
+    todo_id = run(client, auth, [{"op": "create", "title": "Once"}])["results"][0]["id"]
+    result = run(client, auth, [
+        {"op": "complete", "id": todo_id},
+        {"op": "delete", "id": todo_id},
+    ])
+    assert [item["status"] for item in result["results"]] == [200, 409]
+    assert client.get(f"/todos/{todo_id}", headers=auth).json()["completed"] is True
+
+
+def test_batch_deleted_todo(client, auth):
+    todo_id = run(client, auth, [{"op": "create", "title": "Gone"}])["results"][0]["id"]
+    client.delete(f"/todos/{todo_id}", headers=auth)
+    result = run(client, auth, [{"op": "update", "id": todo_id, "title": "Back"}])
+    assert result["results"][0]["status"] == 404
+    assert client.get(f"/todos/{todo_id}", headers=auth).status_code == 404
+    assert stats(client, auth) == (0, 0)
+
+
+def test_conditional_batch_write(storage, client, auth, user):
+    user_id = user[0]
+    ids = [run(client, auth, [{"op": "create", "title": f"Todo {i}"}])["results"][0]["id"] for i in range(3)]
+    read = {todo.todo_id: todo for todo in storage.batch_get_todos(user_id, ids)}
+
+    # Another writer gets to the first two after they were read
+    client.put(f"/todos/{ids[0]}", json={"completed": True}, headers=auth)
+    client.delete(f"/todos/{ids[1]}", headers=auth)
+
+    now = datetime.now(timezone.utc) + timedelta(seconds=1)
+    writes = []
+    for todo_id in ids:
+        before = Todo(user_id=user_id, todo_id=todo_id, completed=read[todo_id].completed,
+                      updated_at=read[todo_id].updated_at)
+        todo = Todo(user_id=user_id, todo_id=todo_id, title="Stale", completed=True,
+                    created_at=read[todo_id].created_at, updated_at=now)
+        writes.append((todo, before))
+    new = Todo(user_id=user_id, todo_id=ids[2], title="Taken", completed=False, created_at=now, updated_at=now)
+
+    assert storage.conditional_batch_write(user_id, writes) == {ids[0], ids[1]}
+    # A create only goes in if the id is free
+    assert storage.conditional_batch_write(user_id, [(new, None)]) == {ids[2]}
+
+    todos = client.get("/todos", headers=auth).json()
+    assert [(todo["title"], todo["completed"]) for todo in todos] == [("Todo 0", True), ("Stale", True)]
+    assert client.get(f"/todos/{ids[1]}", headers=auth).status_code == 404
+    assert stats(client, auth) == (2, 2)
@@ -0,0 +1,158 @@
+"""CRUD, conditional requests and list pagination."""
+
+
+def create(client, auth, title, **fields):
+    response = client.post("/todos", json={"title": title, **fields}, headers=auth)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def test_crud(client, auth):
+    todo = create(client, auth, "Buy milk", description="2 litres")
+    assert todo["completed"] is False
+
+    response = client.get(f"/todos/{todo['id']}", headers=auth)
+    assert response.status_code == 200
+    assert response.json()["title"] == "Buy milk"
+
+    response = client.put(f"/todos/{todo['id']}", json={"completed": True}, headers=auth)
+    assert response.status_code == 200
+    assert response.json()["completed"] is True
+    assert response.json()["description"] == "2 litres"
+
+    response = client.delete(f"/todos/{todo['id']}", headers=auth)
+    assert response.status_code == 200
+    assert client.get(f"/todos/{todo['id']}", headers=auth).status_code == 404
+    assert client.put(f"/todos/{todo['id']}", json={"title": "x"}, headers=auth).status_code == 404
+    assert client.delete(f"/todos/{todo['id']}", headers=auth).status_code == 404
+    assert client.get("/todos", headers=auth).json() == []
+
+
+def test_todos_are_per_user(client, auth, user):
+    todo = create(client, auth, "Mine")
+    client.post("/register", json={"username": user[0] + "-other", "password": "pw"})
+    token = client.post("/token", data={"username": user[0] + "-other", "password": "pw"}).json()["access_token"]
+    other = {"Authorization": f"Bearer {token}"}
+    assert client.get(f"/todos/{todo['id']}", headers=other).status_code == 404
+    assert client.get("/todos", headers=other).json() == []
+
+
+def test_if_match(client, auth):
+    todo = create(client, auth, "Draft")
+    etag = client.get(f"/todos/{todo['id']}", headers=auth).headers["ETag"]
+
+    response = client.put(f"/todos/{todo['id']}", json={"title": "First"}, headers={**auth, "If-Match": etag})
+    assert response.status_code == 200
+    new_etag = response.headers["ETag"]
+    assert new_etag != etag
+
+    # The old ETag lost the race
+    response = client.put(f"/todos/{todo['id']}", json={"title": "Second"}, headers={**auth, "If-Match": etag})
+    assert response.status_code == 412
+    response = client.put(f"/todos/{todo['id']}", json={"completed": True}, headers={**auth, "If-Match": etag})
+    assert response.status_code == 412
+    assert client.get(f"/todos/{todo['id']}", headers=auth).json()["title"] == "First"
+
+    response = client.put(f"/todos/{todo['id']}", json={"completed": True}, headers={**auth, "If-Match": new_etag})
+    assert response.status_code == 200
+    response = client.put(f"/todos/{todo['id']}", json={"title": "Any"}, headers={**auth, "If-Match": "*"})
+    assert response.status_code == 200
+    response = client.put(f"/todos/{todo['id']}", json={"title": "Bad"}, headers={**auth, "If-Match": '"not-ours"'})
+    assert response.status_code == 412
+
+
+def test_if_none_match(client, auth):
+    todo = create(client, auth, "Cached")
+    etag = client.get(f"/todos/{todo['id']}", headers=auth).headers["ETag"]
+    assert client.get(f"/todos/{todo['id']}", headers={**auth, "If-None-Match": etag}).status_code == 304
+
+    list_etag = client.get("/todos", headers=auth).headers["ETag"]
+    assert client.get("/todos", headers={**auth, "If-None-Match": list_etag}).status_code == 304
+
+    # Every kind of write moves the list ETag
+    client.put(f"/todos/{todo['id']}", json={"completed": True}, headers=auth)
+    response = client.get("/todos", headers={**auth, "If-None-Match": list_etag})
+    assert response.status_code == 200
+    assert response.json()[0]["completed"] is True
+    list_etag = response.headers["ETag"]
+    client.delete(f"/todos/{todo['id']}", headers=auth)
+    response = client.get("/todos", headers={**auth, "If-None-Match": list_etag})
+    assert response.status_code == 200
+    assert response.json() == []
+
+
+def pages(client, auth, **params):
+    """All ids from following X-Next-Cursor, and the number of pages."""
+    ids, count, cursor = [], 0, None
+    while True:
+        query = dict(params, **({"cursor": cursor} if cursor else {}))
+        response = client.get("/todos", params=query, headers=auth)
+        assert response.status_code == 200, response.text
+        ids += [todo["id"] for todo in response.json()]
+        count += 1
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            return ids, count
+
+
+def test_cursor_round_trip(client, auth):
+    created = [create(client, auth, f"Todo {i}")["id"] for i in range(7)]
+    for todo_id in created[::2]:
+        client.put(f"/todos/{todo_id}", json={"completed": True}, headers=auth)
+
+    ids, count = pages(client, auth, limit=3)
+    assert ids == created
+    assert count == 3
+
+    ids, _ = pages(client, auth, limit=2, sort="created_at", order="desc")
+    assert ids == created[::-1]
+
+    ids, _ = pages(client, auth, limit=2, completed="true")
+    assert ids == created[::2]
+    ids, _ = pages(client, auth, limit=2, completed="false")
+    assert ids == created[1::2]
+
+    response = client.get("/todos", params={"limit": 2}, headers=auth)
+    assert response.status_code == 200
+    cursor = response.headers["X-Next-Cursor"]
+    response = client.get("/todos", params={"limit": 2, "cursor": cursor, "fields": "id,title"}, headers=auth)
+    assert response.status_code == 200
+    assert [todo["id"] for todo in response.json()] == created[2:4]
+    assert set(response.json()[0]) == {"id", "title"}
+
+
+def test_stream(client, auth):
+    created = [create(client, auth, f"Todo {i}")["id"] for i in range(3)]
+    response = client.get("/todos", params={"stream": "json"}, headers=auth)
+    assert [todo["id"] for todo in response.json()] == created
+    response = client.get("/todos", params={"stream": "ndjson"}, headers=auth)
+    assert len(response.text.strip().splitlines()) == 3
+
+
+def test_bad_cursor(client, auth):
+    for i in range(3):
+        create(client, auth, f"Todo {i}")
+    cursor = client.get("/todos", params={"limit": 1}, headers=auth).headers["X-Next-Cursor"]
+
+    # A cursor is tied to the query it came from
+    response = client.get("/todos", params={"limit": 1, "cursor": cursor, "completed": "true"}, headers=auth)
+    assert response.status_code == 400
+    response = client.get("/todos", params={"limit": 1, "cursor": cursor[:-2] + "xx"}, headers=auth)
+    assert response.status_code == 400
+    response = client.get("/todos", params={"limit": 1, "cursor": "garbage"}, headers=auth)
+    assert response.status_code == 400
+
+
+def test_stats(client, auth):
+    assert client.get("/todos/stats", headers=auth).json()["total"] == 0
+    ids = [create(client, auth, f"Todo {i}")["id"] for i in range(4)]
+    client.put(f"/todos/{ids[0]}", json={"completed": True}, headers=auth)
+    client.put(f"/todos/{ids[1]}", json={"completed": True}, headers=auth)
+    # Completing twice, or a write that doesn't touch completion, counts once
+    client.put(f"/todos/{ids[1]}", json={"completed": True}, headers=auth)
+    client.put(f"/todos/{ids[0]}", json={"title": "Renamed"}, headers=auth)
+    client.delete(f"/todos/{ids[1]}", headers=auth)
+    client.delete(f"/todos/{ids[2]}", headers=auth)
+
+    stats = client.get("/todos/stats", headers=auth).json()
+    assert (stats["total"], stats["completed"], stats["pending"]) == (2, 1, 1)
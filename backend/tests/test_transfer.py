@@ -0,0 +1,117 @@
+"""Import and export, and how imports show up in lists and the changes feed."""
+import json
+
+
+def export(client, auth, fmt="ndjson"):
+    response = client.get("/todos/export", params={"format": fmt}, headers=auth)
+    assert response.status_code == 200
+    return response.text
+
+
+def import_(client, auth, body, content_type="application/x-ndjson", **params):
+    response = client.post("/todos/import", params=params, content=body.encode("utf-8"),
+                           headers={**auth, "Content-Type": content_type})
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def ndjson(*records):
+    return "".join(json.dumps(record) + "\n" for record in records)
+
+
+def test_round_trip(client, auth, user):
+    for i in range(3):
+        client.post("/todos", json={"title": f"Todo {i}", "description": f"#{i}"}, headers=auth)
+    for fmt, content_type in (("ndjson", "application/x-ndjson"), ("csv", "text/csv")):
+        body = export(client, auth, fmt)
+        client.post("/register", json={"username": user[0] + fmt, "password": "pw"})
+        token = client.post("/token", data={"username": user[0] + fmt, "password": "pw"}).json()["access_token"]
+        other = {"Authorization": f"Bearer {token}"}
+
+        summary = import_(client, other, body, content_type)
+        assert (summary["rows"], summary["imported"], summary["failed"]) == (3, 3, 0)
+        todos = client.get("/todos", headers=other).json()
+        assert [(todo["title"], todo["description"]) for todo in todos] == [
+            ("Todo 0", "#0"), ("Todo 1", "#1"), ("Todo 2", "#2")
+        ]
+        assert client.get("/todos/stats", headers=other).json()["total"] == 3
+
+
+def test_import_moves_list_and_changes(client, auth):
+    todo = client.post("/todos", json={"title": "Old"}, headers=auth).json()
+    etag = client.get("/todos", headers=auth).headers["ETag"]
+    since = client.get("/todos/changes", headers=auth).json()["next_since"]
+
+    # Rows carry the updated_at of an export made long ago
+    summary = import_(client, auth, ndjson(
+        {"id": todo["id"], "title": "Imported", "updated_at": todo["updated_at"]},
+        {"title": "New", "completed": True, "updated_at": "2020-01-01T00:00:00+00:00"},
+    ))
+    assert (summary["imported"], summary["failed"]) == (2, 0)
+
+    response = client.get("/todos", headers={**auth, "If-None-Match": etag})
+    assert response.status_code == 200
+    assert sorted(todo["title"] for todo in response.json()) == ["Imported", "New"]
+
+    changes = client.get("/todos/changes", params={"since": since}, headers=auth).json()
+    assert sorted(todo["title"] for todo in changes["changes"]) == ["Imported", "New"]
+    assert all(todo["updated_at"] > "2021" for todo in changes["changes"])
+
+    stats = client.get("/todos/stats", headers=auth).json()
+    assert (stats["total"], stats["completed"]) == (2, 1)
+
+
+def test_import_keeps_newer_writes(client, auth):
+    kept, deleted, same = (client.post("/todos", json={"title": title}, headers=auth).json()
+                           for title in ("Kept", "Deleted", "Same"))
+    body = export(client, auth)
+
+    client.put(f"/todos/{kept['id']}", json={"title": "Edited"}, headers=auth)
+    client.delete(f"/todos/{deleted['id']}", headers=auth)
+
+    summary = import_(client, auth, body)
+    assert (summary["imported"], summary["failed"]) == (1, 2)
+    assert sorted(error["row"] for error in summary["errors"]) == [0, 1]
+
+    assert client.get(f"/todos/{kept['id']}", headers=auth).json()["title"] == "Edited"
+    assert client.get(f"/todos/{deleted['id']}", headers=auth).status_code == 404
+    assert client.get(f"/todos/{same['id']}", headers=auth).json()["updated_at"] == same["updated_at"]
+
+
+def test_import_resume(client, auth):
+    records = [{"title": f"Todo {i}"} for i in range(5)]
+    summary = import_(client, auth, ndjson(*records[:3]))
+    assert summary["checkpoint"] == 3
+
+    # Replaying from an earlier row with the same import id doesn't duplicate anything
+    summary = import_(client, auth, ndjson(*records), import_id=summary["import_id"], skip=1)
+    assert (summary["rows"], summary["imported"], summary["failed"]) == (5, 4, 0)
+    titles = [todo["title"] for todo in client.get("/todos", headers=auth).json()]
+    assert sorted(titles) == [f"Todo {i}" for i in range(5)]
+    assert client.get("/todos/stats", headers=auth).json()["total"] == 5
+
+
+def test_import_bad_rows(client, auth):
+    summary = import_(client, auth, '{"title": "Good"}\nnot json\n{"description": "no title"}\n')
+    assert (summary["rows"], summary["imported"], summary["failed"]) == (3, 1, 2)
+    assert [error["row"] for error in summary["errors"]] == [1, 2]
+
+
+def test_changes_feed(client, auth):
+    first = client.get("/todos/changes", headers=auth).json()
+    assert (first["changes"], first["deleted"], first["has_more"]) == ([], [], False)
+
+    ids = [client.post("/todos", json={"title": f"Todo {i}"}, headers=auth).json()["id"] for i in range(3)]
+    client.delete(f"/todos/{ids[0]}", headers=auth)
+
+    seen, deleted, since = [], [], first["next_since"]
+    while True:
+        page = client.get("/todos/changes", params={"since": since, "limit": 1}, headers=auth).json()
+        seen += [todo["id"] for todo in page["changes"]]
+        deleted += page["deleted"]
+        since = page["next_since"]
+        if not page["has_more"]:
+            break
+    assert (sorted(seen), deleted) == (ids[1:], [ids[0]])
+
+    assert client.get("/todos/changes", params={"since": "garbage"}, headers=auth).status_code == 400
@@ -0,0 +1,181 @@
+"""
+JWT access tokens with a cache of already-verified tokens.
+
+Every authenticated request used to run a full ``jwt.decode`` (base64,
+JSON parsing and an HMAC). Verified tokens are now remembered by a hash
+of the token until they expire, so repeat requests skip all of that.
+``JWT_BACKEND`` picks the implementation used on a miss: ``jose``
+(python-jose, the default), ``pyjwt`` (requires the optional ``PyJWT``
+package) or ``hs256``, a minimal stdlib HS256-only codec that skips the
+generic JOSE machinery. The backend (and with it python-jose and its
+crypto dependencies) is only loaded on first use, which keeps it out of
+cold starts that never see a token.
+"""
+import base64
+import calendar
+import hashlib
+import hmac
+import json
+import os
+import time
+from datetime import datetime, timedelta
+
+from cache import MISSING, LRUCache
+
+SECRET_KEY = os.getenv("MY_AWS_SECRET_ACCESS_KEY")
+ALGORITHM = "HS256"
+ACCESS_TOKEN_EXPIRE_MINUTES = 30
+# Shared secret for the /admin endpoints; they are disabled when unset
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+
+class InvalidToken(Exception):
+    """Raised when a token fails verification or has no subject."""
+
+
+class JoseBackend:
+    name = "jose"
+
+    def __init__(self):
+        from jose import jwt, JWTError
+        self._jwt = jwt
+        self._error = JWTError
+
+    def encode(self, payload: dict, secret: str, algorithm: str) -> str:
+        return self._jwt.encode(payload, secret, algorithm=algorithm)
+
+    def decode(self, token: str, secret: str, algorithm: str) -> dict:
+        try:
+            return self._jwt.decode(token, secret, algorithms=[algorithm])
+        except self._error as e:
+            raise InvalidToken(str(e))
+
+
+class PyJWTBackend:
+    name = "pyjwt"
+
+    def __init__(self):
+        try:
+            import jwt
+        except ImportError:
+            raise RuntimeError("JWT_BACKEND=pyjwt requires the 'PyJWT' package")
+        self._jwt = jwt
+
+    def encode(self, payload: dict, secret: str, algorithm: str) -> str:
+        return self._jwt.encode(payload, secret, algorithm=algorithm)
+
+    def decode(self, token: str, secret: str, algorithm: str) -> dict:
+        try:
+            return self._jwt.decode(token, secret, algorithms=[algorithm])
+        except self._jwt.PyJWTError as e:
+            raise InvalidToken(str(e))
+
+
+def _b64encode(data: bytes) -> bytes:
+    return base64.urlsafe_b64encode(data).rstrip(b"=")
+
+
+def _b64decode(data: bytes) -> bytes:
+    return base64.urlsafe_b64decode(data + b"=" * (-len(data) % 4))
+
+
+class HS256Backend:
+    """HS256 only: HMAC-SHA256 over ``header.payload`` plus an ``exp`` check."""
+
+    name = "hs256"
+    _header = _b64encode(json.dumps({"alg": "HS256", "typ": "JWT"}, separators=(",", ":")).encode("utf-8"))
+
+    def encode(self, payload: dict, secret: str, algorithm: str) -> str:
+        if algorithm != "HS256":
+            raise ValueError("The hs256 backend only supports HS256")
+        claims = {
+            key: calendar.timegm(value.utctimetuple()) if isinstance(value, datetime) else value
+            for key, value in payload.items()
+        }
+        body = _b64encode(json.dumps(claims, separators=(",", ":")).encode("utf-8"))
+        signing_input = self._header + b"." + body
+        signature = hmac.new(secret.encode("utf-8"), signing_input, hashlib.sha256).digest()
+        return (signing_input + b"." + _b64encode(signature)).decode("ascii")
+
+    def decode(self, token: str, secret: str, algorithm: str) -> dict:
+        try:
+            header, body, signature = token.encode("ascii").split(b".")
+            if json.loads(_b64decode(header)).get("alg") != "HS256" or algorithm != "HS256":
+                raise InvalidToken("Unsupported algorithm")
+            expected = hmac.new(secret.encode("utf-8"), header + b"." + body, hashlib.sha256).digest()
+            if not hmac.compare_digest(expected, _b64decode(signature)):
+                raise InvalidToken("Signature verification failed")
+            payload = json.loads(_b64decode(body))
+        except (ValueError, TypeError, AttributeError):
+            raise InvalidToken("Malformed token")
+        if not isinstance(payload, dict):
+            raise InvalidToken("Malformed token")
+        exp = payload.get("exp")
+        if exp is not None and (not isinstance(exp, (int, float)) or exp <= time.time()):
+            raise InvalidToken("Signature has expired")
+        return payload
+
+
+BACKENDS = {"jose": JoseBackend, "pyjwt": PyJWTBackend, "hs256": HS256Backend}
+
+JWT_BACKEND = os.getenv("JWT_BACKEND", "jose").lower()
+if JWT_BACKEND not in BACKENDS:
+    raise RuntimeError(f"Unknown JWT_BACKEND '{JWT_BACKEND}'")
+# Built by get_jwt_backend() on first use; assign to swap implementations
+jwt_backend = None
+
+
+def get_jwt_backend():
+    global jwt_backend
+    if jwt_backend is None:
+        jwt_backend = BACKENDS[JWT_BACKEND]()
+    return jwt_backend
+
+# Entries live until the token expires, capped at TOKEN_CACHE_TTL seconds
+verified_tokens = LRUCache(
+    max_entries=int(os.getenv("TOKEN_CACHE_MAX_ENTRIES", "10000")),
+    ttl=float(os.getenv("TOKEN_CACHE_TTL", "300")),
+)
+TOKEN_CACHE_ENABLED = os.getenv("TOKEN_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+
+
+def create_access_token(data: dict, expires_delta: timedelta = None):
+    """Create a JWT access token."""
+    to_encode = data.copy()
+    if expires_delta:
+        expire = datetime.utcnow() + expires_delta
+    else:
+        expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    to_encode.update({"exp": expire})
+    return get_jwt_backend().encode(to_encode, SECRET_KEY, ALGORITHM)
+
+
+def verify_token(token: str) -> str:
+    """Return the token's subject (username), raising InvalidToken if it isn't valid."""
+    key = hashlib.sha256(token.encode("utf-8")).digest() if TOKEN_CACHE_ENABLED else None
+    if key is not None:
+        cached = verified_tokens.get(key)
+        if cached is not MISSING:
+            username, expires_at = cached
+            if expires_at is None or expires_at > time.time():
+                return username
+            verified_tokens.delete(key)
+
+    payload = get_jwt_backend().decode(token, SECRET_KEY, ALGORITHM)
+    username = payload.get("sub")
+    if username is None:
+        raise InvalidToken("Token has no subject")
+
+    if key is not None:
+        expires_at = payload.get("exp")
+        ttl = verified_tokens.ttl if expires_at is None else min(verified_tokens.ttl, expires_at - time.time())
+        if ttl > 0:
+            verified_tokens.set(key, (username, expires_at), ttl=ttl)
+    return username
+
+
+def is_admin_token(token: str) -> bool:
+    """Whether ``token`` matches ADMIN_TOKEN (always False when it isn't set)."""
+    if not ADMIN_TOKEN or not token:
+        return False
+    return hmac.compare_digest(token.encode("utf-8"), ADMIN_TOKEN.encode("utf-8"))
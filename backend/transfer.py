@@ -0,0 +1,465 @@
+"""
+Bulk export and import of a user's todos as NDJSON or CSV.
+
+Export pages through the user's todos ``EXPORT_PAGE_SIZE`` at a time and
+yields each page as soon as it is encoded, so nothing is buffered beyond
+one page. Import parses the input incrementally (one line or CSV record
+at a time) and writes through the storage backend's conditional batch
+writes, with at most ``IMPORT_MAX_IN_FLIGHT`` batches outstanding; memory
+stays flat whatever the size of the input.
+
+Imported todos are stamped with the time they are written, so they move
+the list ETags and show up in the changes feed like any other write. A
+row never replaces a todo that was changed or deleted after the row's
+``updated_at`` (the time it was exported): those rows are reported as
+errors instead. Rows identical to the stored todo are counted as
+imported without being written.
+
+Imports report a checkpoint: the number of input rows before which
+everything has been written. Restarting with ``skip`` set to it and the
+same import id resumes the import. The import id records when the import
+started; rows without an ``id`` get one derived from it and the row
+number (and rows without ``created_at`` get its start time), so replaying
+rows after a crash overwrites them instead of creating duplicates.
+
+Records have the ``TodoOut`` fields: ``id`` (optional), ``title``
+(required), ``description``, ``completed``, ``created_at`` and
+``updated_at``. The same operations are available from the command line:
+
+    python transfer.py export --user USER [--format ndjson|csv] [--output FILE]
+    python transfer.py import --user USER --input FILE [--format ndjson|csv]
+                              [--checkpoint FILE] [--max-in-flight N]
+
+The CLI import saves its checkpoint to ``<input>.checkpoint`` (or
+``--checkpoint``) as it goes and resumes from it when run again.
+"""
+import argparse
+import asyncio
+import csv
+import io
+import json
+import os
+import sys
+import re
+import secrets
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Callable, Optional
+
+from ids import derived_todo_id
+from models import Todo
+from serialization import TodoOut, dumps
+from storage import storage
+
+EXPORT_PAGE_SIZE = int(os.getenv("EXPORT_PAGE_SIZE", "500"))
+IMPORT_MAX_IN_FLIGHT = int(os.getenv("IMPORT_MAX_IN_FLIGHT", "4"))
+# Row errors kept for the summary; later ones are only counted
+IMPORT_MAX_REPORTED_ERRORS = 100
+IMPORT_CHECKPOINT_SECONDS = 2.0
+
+FORMATS = ("ndjson", "csv")
+CSV_COLUMNS = ("id", "title", "description", "completed", "created_at", "updated_at")
+MAX_ID_LENGTH = 128
+READ_SIZE = 64 * 1024
+IMPORT_ID_PATTERN = re.compile(r"^[0-9a-f]{28}$")
+
+
+class InvalidRow(ValueError):
+    """Raised for an input row that can't be turned into a todo."""
+
+
+def new_import_id(at: datetime) -> str:
+    """12 hex digits of start time in milliseconds, then 16 random ones."""
+    return f"{int(at.timestamp() * 1000):012x}{secrets.token_hex(8)}"
+
+
+def import_started_at(import_id: str) -> datetime:
+    return datetime.fromtimestamp(int(import_id[:12], 16) / 1000, timezone.utc)
+
+
+def _csv_line(values) -> str:
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator="\n").writerow(values)
+    return buffer.getvalue()
+
+
+def _encode_page(todos: list, fmt: str) -> bytes:
+    if fmt == "csv":
+        rows = []
+        for todo in todos:
+            data = TodoOut.from_model(todo).to_dict()
+            data["description"] = data["description"] or ""
+            data["completed"] = "true" if data["completed"] else "false"
+            rows.append(_csv_line([data[name] for name in CSV_COLUMNS]))
+        return "".join(rows).encode("utf-8")
+    return b"".join(dumps(TodoOut.from_model(todo)) + b"\n" for todo in todos)
+
+
+def export_chunks(user_id: str, fmt: str, page_size: int = EXPORT_PAGE_SIZE):
+    """Yield the user's todos as encoded chunks, one storage page each."""
+    if fmt == "csv":
+        yield _csv_line(CSV_COLUMNS).encode("utf-8")
+    last_key = None
+    while True:
+        todos, last_key = storage.query_todos(user_id, limit=page_size, start_key=last_key)
+        if todos:
+            yield _encode_page(todos, fmt)
+        if last_key is None:
+            break
+
+
+async def iter_lines(chunks):
+    """Split an async iterable of byte chunks into decoded lines, keeping their endings."""
+    pending = b""
+    async for chunk in chunks:
+        pending += chunk
+        lines = pending.split(b"\n")
+        pending = lines.pop()
+        for line in lines:
+            yield line.decode("utf-8") + "\n"
+    if pending:
+        yield pending.decode("utf-8")
+
+
+async def iter_records(lines, fmt: str):
+    """
+    Parse lines into ``(row, record)``; ``record`` is a dict, or an
+    ``InvalidRow`` for a line that doesn't parse. CSV needs a header row.
+    """
+    row = 0
+    if fmt == "ndjson":
+        async for line in lines:
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+                if not isinstance(record, dict):
+                    raise ValueError("expected a JSON object")
+            except ValueError as e:
+                record = InvalidRow(f"Invalid JSON: {e}")
+            yield row, record
+            row += 1
+        return
+
+    header, text = None, ""
+    async for line in lines:
+        text += line
+        # A quoted field may span lines; the record ends once the quotes balance
+        if text.count('"') % 2:
+            continue
+        if not text.strip():
+            text = ""
+            continue
+        values = next(csv.reader([text]))
+        text = ""
+        if header is None:
+            header = [name.strip().lower() for name in values]
+            continue
+        if len(values) != len(header):
+            yield row, InvalidRow(f"Expected {len(header)} columns, got {len(values)}")
+        else:
+            yield row, dict(zip(header, values))
+        row += 1
+    if text.strip():
+        yield row, InvalidRow("Unterminated quoted field")
+
+
+def _parse_bool(value) -> bool:
+    if isinstance(value, bool):
+        return value
+    if value is None or value == "":
+        return False
+    text = str(value).strip().lower()
+    if text in ("true", "1", "yes"):
+        return True
+    if text in ("false", "0", "no"):
+        return False
+    raise InvalidRow(f"Invalid completed value '{value}'")
+
+
+def _parse_time(value, default: datetime) -> datetime:
+    if value is None or value == "":
+        return default
+    try:
+        parsed = datetime.fromisoformat(str(value))
+    except ValueError:
+        raise InvalidRow(f"Invalid timestamp '{value}'")
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def todo_from_record(user_id: str, record: dict, make_id: Callable[[datetime], str], default_created_at: datetime) -> Todo:
+    """Build a Todo from an import record; raises InvalidRow."""
+    title = record.get("title")
+    if not isinstance(title, str) or not title.strip():
+        raise InvalidRow("title is required")
+    description = record.get("description")
+    if description is not None and not isinstance(description, str):
+        raise InvalidRow("description must be a string")
+    created_at = _parse_time(record.get("created_at"), default_created_at)
+    todo_id = record.get("id")
+    if todo_id in (None, ""):
+        todo_id = make_id(created_at)
+    elif not isinstance(todo_id, str) or len(todo_id) > MAX_ID_LENGTH:
+        raise InvalidRow("Invalid id")
+    return Todo(
+        user_id=user_id,
+        todo_id=todo_id,
+        title=title,
+        description=description or None,
+        completed=_parse_bool(record.get("completed")),
+        created_at=created_at,
+        updated_at=_parse_time(record.get("updated_at"), created_at),
+    )
+
+
+class ImportJob:
+    """
+    Writes parsed records for one user in batches, several at a time.
+
+    ``run(fn, *args)`` runs a blocking storage call off the event loop.
+    ``on_written(todos)`` is called with each written batch, and
+    ``on_checkpoint(summary)`` whenever the checkpoint advances.
+    """
+
+    def __init__(self, user_id: str, run, import_id: Optional[str] = None, skip: int = 0,
+                 max_in_flight: int = IMPORT_MAX_IN_FLIGHT, on_written=None, on_checkpoint=None):
+        self.user_id = user_id
+        self.run = run
+        self.import_id = import_id or new_import_id(datetime.now(timezone.utc))
+        self.started_at = import_started_at(self.import_id)
+        self.skip = skip
+        self.max_in_flight = max_in_flight
+        self.on_written = on_written
+        self.on_checkpoint = on_checkpoint
+        self.rows = 0
+        self.imported = 0
+        self.failed = 0
+        self.errors = []
+        self.checkpoint = skip
+        # First row of each in-flight batch -> row after its last, and finished batches
+        self._batches = {}
+        self._finished = set()
+
+    def _error(self, row: int, message: str):
+        self.failed += 1
+        if len(self.errors) < IMPORT_MAX_REPORTED_ERRORS:
+            self.errors.append({"row": row, "error": message})
+
+    def _make_id(self, row: int):
+        return lambda created_at: derived_todo_id(created_at, f"{self.user_id}:{self.import_id}:{row}")
+
+    async def _write(self, start: int, end: int, batch: list):
+        try:
+            written, errors = await self.run(self._write_batch, batch)
+        except Exception as e:
+            print(f"Error writing import batch: {e}")
+            written, errors = [], {todo.todo_id: f"Write failed: {str(e)}" for _, todo in batch}
+        return start, end, batch, written, errors
+
+    def _write_batch(self, batch: list):
+        """
+        Write one batch unless that would replace newer data; returns ``(written, errors)``.
+
+        ``errors`` maps the ids of rows left alone to why. Each todo is
+        written only if the stored one is unchanged since it was read here,
+        so an edit or delete landing meanwhile isn't overwritten either.
+        """
+        stored = {todo.todo_id: todo for todo in storage.batch_get_todos(self.user_id, [todo.todo_id for _, todo in batch])}
+        now = datetime.now(timezone.utc)
+        writes, errors = [], {}
+        for _, todo in batch:
+            old = stored.get(todo.todo_id)
+            if old is not None and old.deleted:
+                errors[todo.todo_id] = "Skipped: the todo was deleted after it was exported"
+                continue
+            if old is not None and (old.title, old.description, bool(old.completed)) == (todo.title, todo.description, todo.completed):
+                # Already as imported (an unchanged todo, or a replayed row)
+                continue
+            if old is not None and old.updated_at > todo.updated_at:
+                errors[todo.todo_id] = "Skipped: the todo was changed after it was exported"
+                continue
+            todo.updated_at = now
+            writes.append((todo, old))
+        conflicts = storage.conditional_batch_write(self.user_id, writes) if writes else set()
+        for todo_id in conflicts:
+            errors[todo_id] = "Skipped: the todo was changed during the import"
+        return [todo for todo, _ in writes if todo.todo_id not in conflicts], errors
+
+    def _finish(self, result):
+        start, end, batch, written, errors = result
+        for row, todo in batch:
+            if todo.todo_id in errors:
+                self._error(row, errors[todo.todo_id])
+        self.imported += len(batch) - sum(1 for _, todo in batch if todo.todo_id in errors)
+        if written and self.on_written is not None:
+            self.on_written(written)
+        self._finished.add(start)
+        # The checkpoint only moves past batches with nothing before them still in flight
+        advanced = False
+        while self.checkpoint in self._finished:
+            self._finished.discard(self.checkpoint)
+            self.checkpoint = self._batches.pop(self.checkpoint)
+            advanced = True
+        if advanced and self.on_checkpoint is not None:
+            self.on_checkpoint(self.summary())
+
+    async def run_records(self, records) -> dict:
+        """Import ``(row, record)`` pairs (see iter_records); returns the summary."""
+        limit = storage.batch_write_limit
+        in_flight = set()
+        batch, batch_start, seen_ids = [], self.skip, set()
+
+        async def submit(end):
+            nonlocal batch, batch_start, seen_ids, in_flight
+            if len(in_flight) >= self.max_in_flight:
+                done, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    self._finish(task.result())
+            self._batches[batch_start] = end
+            in_flight.add(asyncio.ensure_future(self._write(batch_start, end, batch)))
+            batch, batch_start, seen_ids = [], end, set()
+
+        async for row, record in records:
+            if row < self.skip:
+                continue
+            self.rows = row + 1
+            try:
+                if isinstance(record, InvalidRow):
+                    raise record
+                todo = todo_from_record(self.user_id, record, self._make_id(row), self.started_at)
+            except InvalidRow as e:
+                self._error(row, str(e))
+                continue
+            # A batch write can't carry the same key twice
+            if todo.todo_id in seen_ids:
+                await submit(row)
+            batch.append((row, todo))
+            seen_ids.add(todo.todo_id)
+            if len(batch) >= limit:
+                await submit(row + 1)
+
+        if batch:
+            await submit(self.rows)
+        if in_flight:
+            for task in asyncio.as_completed(in_flight):
+                self._finish(await task)
+        # Trailing invalid rows have nothing left to wait for
+        self.checkpoint = max(self.checkpoint, self.rows)
+        return self.summary()
+
+    def summary(self) -> dict:
+        return {
+            "import_id": self.import_id,
+            "rows": max(self.rows, self.skip),
+            "imported": self.imported,
+            "failed": self.failed,
+            "checkpoint": self.checkpoint,
+            "errors": self.errors,
+        }
+
+
+async def _read_file(path: str):
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(READ_SIZE)
+            if not chunk:
+                break
+            yield chunk
+
+
+def _save_checkpoint(path: str, state: dict):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp, path)
+
+
+def cli_export(args):
+    output = open(args.output, "wb") if args.output else sys.stdout.buffer
+    try:
+        for chunk in export_chunks(args.user, args.format):
+            output.write(chunk)
+    finally:
+        if args.output:
+            output.close()
+
+
+def cli_import(args):
+    fmt = args.format or ("csv" if args.input.lower().endswith(".csv") else "ndjson")
+    checkpoint_path = args.checkpoint or args.input + ".checkpoint"
+    state = {
+        "input": os.path.abspath(args.input),
+        "user_id": args.user,
+        "import_id": new_import_id(datetime.now(timezone.utc)),
+        "checkpoint": 0,
+    }
+    if os.path.exists(checkpoint_path):
+        with open(checkpoint_path) as f:
+            saved = json.load(f)
+        if (saved.get("input"), saved.get("user_id")) != (state["input"], state["user_id"]):
+            raise SystemExit(f"{checkpoint_path} belongs to a different import; remove it or pass --checkpoint")
+        state = saved
+        print(f"Resuming import {state['import_id']} from row {state['checkpoint']}", file=sys.stderr)
+
+    last_saved = 0.0
+
+    def on_checkpoint(summary):
+        nonlocal last_saved
+        state["checkpoint"] = summary["checkpoint"]
+        if time.monotonic() - last_saved >= IMPORT_CHECKPOINT_SECONDS:
+            _save_checkpoint(checkpoint_path, state)
+            last_saved = time.monotonic()
+            print(f"{summary['checkpoint']} rows done, {summary['failed']} failed", file=sys.stderr)
+
+    async def run_import():
+        executor = ThreadPoolExecutor(max_workers=args.max_in_flight, thread_name_prefix="import")
+        loop = asyncio.get_running_loop()
+
+        async def run(fn, *fn_args):
+            return await loop.run_in_executor(executor, fn, *fn_args)
+
+        job = ImportJob(args.user, run, import_id=state["import_id"], skip=state["checkpoint"],
+                        max_in_flight=args.max_in_flight, on_checkpoint=on_checkpoint)
+        try:
+            return await job.run_records(iter_records(iter_lines(_read_file(args.input)), fmt))
+        finally:
+            executor.shutdown(wait=True)
+
+    started = time.perf_counter()
+    try:
+        summary = asyncio.run(run_import())
+    except BaseException:
+        _save_checkpoint(checkpoint_path, state)
+        raise
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    summary["seconds"] = round(time.perf_counter() - started, 3)
+    print(json.dumps(summary, indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = commands.add_parser("export", help="write a user's todos to a file or stdout")
+    export_parser.add_argument("--user", required=True)
+    export_parser.add_argument("--format", choices=FORMATS, default="ndjson")
+    export_parser.add_argument("--output", help="default: stdout")
+
+    import_parser = commands.add_parser("import", help="load todos for a user from a file")
+    import_parser.add_argument("--user", required=True)
+    import_parser.add_argument("--input", required=True)
+    import_parser.add_argument("--format", choices=FORMATS, help="default: from the file extension")
+    import_parser.add_argument("--checkpoint", help="default: <input>.checkpoint")
+    import_parser.add_argument("--max-in-flight", type=int, default=IMPORT_MAX_IN_FLIGHT)
+
+    args = parser.parse_args()
+    if args.command == "export":
+        cli_export(args)
+    else:
+        cli_import(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,14 @@
 "use server";
 
-import { cookies } from "next/headers";
+import { cookies, headers } from "next/headers";
 import { jwtDecode } from "jwt-decode";
 
 // Backend API base URL
 const API_BASE_URL = process.env.NEXT_PUBLIC_API_URL || "http://localhost:8000";
 
+// Shared with the backend, which only trusts a forwarded client IP that comes with it
+const CLIENT_IP_SECRET = process.env.RATE_LIMIT_CLIENT_IP_SECRET;
+
 // Types
 export interface SignUpParams {
   username: string;
@@ -44,6 +47,23 @@ async function setSessionCookie(token: string) {
   });
 }
 
+// Forward the browser's IP, so the backend rate-limits sign-ins per client
+// instead of lumping every browser under this server's IP
+async function clientIpHeaders(): Promise<Record<string, string>> {
+  if (!CLIENT_IP_SECRET) return {};
+
+  const requestHeaders = await headers();
+  const ip =
+    requestHeaders.get("x-forwarded-for")?.split(",")[0].trim() ||
+    requestHeaders.get("x-real-ip");
+  if (!ip) return {};
+
+  return {
+    "X-Client-IP": ip,
+    "X-Client-IP-Secret": CLIENT_IP_SECRET,
+  };
+}
+
 // Sign up user
 export async function signUp(params: SignUpParams): Promise<AuthResponse> {
   const { username, password } = params;
@@ -55,6 +75,7 @@ export async function signUp(params: SignUpParams): Promise<AuthResponse> {
       method: "POST",
       headers: {
         "Content-Type": "application/json",
+        ...(await clientIpHeaders()),
       },
       body: JSON.stringify({
         username,
@@ -119,6 +140,7 @@ export async function signIn(params: SignInParams): Promise<AuthResponse> {
 
     const response = await fetch(`${API_BASE_URL}/token`, {
       method: "POST",
+      headers: await clientIpHeaders(),
       body: formData,
     });
 